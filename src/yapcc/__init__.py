@@ -15,3 +15,41 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 """yapcc is Yet Another Python C Compiler."""
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from yapcc.api import MemoryCache, compile_source, default_cache
+    from yapcc.context import Options
+    from yapcc.jobs import Stage
+    from yapcc.profile import Profile
+
+__all__ = [
+    "MemoryCache",
+    "Options",
+    "Profile",
+    "Stage",
+    "compile_source",
+    "default_cache",
+]
+
+
+def __getattr__(name: str) -> Any:  # noqa: ANN401
+    """Import the compile API on first use, keeping `import yapcc` cheap."""
+    if name in {"MemoryCache", "compile_source", "default_cache"}:
+        from yapcc import api
+
+        return getattr(api, name)
+    if name == "Options":
+        from yapcc.context import Options
+
+        return Options
+    if name == "Stage":
+        from yapcc.jobs import Stage
+
+        return Stage
+    if name == "Profile":
+        from yapcc.profile import Profile
+
+        return Profile
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,241 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""In-memory compile API with memoized stage results."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Literal, overload
+
+from yapcc.codegen import Program as AsmProgram
+from yapcc.codegen import emit
+from yapcc.context import CompilationContext, Options
+from yapcc.jobs import Stage
+from yapcc.lex import TokenBuffer, tokenize
+from yapcc.parse import Program as ASTProgram
+from yapcc.parse import parse
+from yapcc.passes import compile_tac
+from yapcc.preprocess import preprocess_builtin
+from yapcc.profile import Profile
+from yapcc.profile import stage as timed
+from yapcc.tac import Program as TACProgram
+from yapcc.tac import ir
+
+StageResult = TokenBuffer | ASTProgram | TACProgram | AsmProgram | str
+
+DEFAULT_MAXSIZE = 1024
+
+_STAGES = tuple(Stage)
+# results of earlier stages do not depend on the options, so they are shared
+# between compilations with different options
+_OPTION_STAGES = frozenset({Stage.CODEGEN, Stage.ASSEMBLY})
+
+
+class MemoryCache:
+    """A bounded, thread-safe LRU cache of stage results.
+
+    Every stage result is an entry of its own, so a compilation to a later stage
+    reuses the results of earlier stages cached by other compilations. Cached
+    results are shared, and must not be mutated.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, StageResult] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached stage results."""
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> StageResult | None:
+        """Return the result cached under `key`, or `None` on a miss."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Hashable, result: StageResult) -> None:
+        """Cache `result` under `key`, evicting the least recently used results."""
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every result and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+_DEFAULT_CACHE = MemoryCache()
+
+
+def default_cache() -> MemoryCache:
+    """Return the cache `compile_source` uses unless given another."""
+    return _DEFAULT_CACHE
+
+
+def _compute(
+    stage: Stage, previous: StageResult | None, source: str, ctx: CompilationContext
+) -> StageResult:
+    match stage, previous:
+        case Stage.LEX, _:
+            with timed(ctx.profile, "lex"):
+                return tokenize(source, ctx)
+        case Stage.PARSE, TokenBuffer():
+            with timed(ctx.profile, "parse"):
+                return parse(previous, ctx)
+        case Stage.TACKY, ASTProgram():
+            with timed(ctx.profile, "ir"):
+                return ir(previous, ctx)
+        case Stage.CODEGEN, TACProgram():
+            return compile_tac(previous, ctx)
+        case Stage.ASSEMBLY, AsmProgram():
+            with timed(ctx.profile, "emit"):
+                return emit(previous)
+    raise RuntimeError(f'Unsupported stage "{stage}"')
+
+
+def _stage_result(
+    stage: Stage,
+    source: str,
+    digest: bytes,
+    cache: MemoryCache,
+    ctx: CompilationContext,
+) -> StageResult:
+    options = ctx.options if stage in _OPTION_STAGES else None
+    key = (digest, stage, options)
+    result = cache.get(key)
+    if result is None:
+        index = _STAGES.index(stage)
+        previous = None
+        if index:
+            previous = _stage_result(_STAGES[index - 1], source, digest, cache, ctx)
+        result = _compute(stage, previous, source, ctx)
+        cache.put(key, result)
+    return result
+
+
+@overload
+def compile_source(
+    text: str,
+    stage: Literal[Stage.LEX],
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> TokenBuffer: ...
+
+
+@overload
+def compile_source(
+    text: str,
+    stage: Literal[Stage.PARSE],
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> ASTProgram: ...
+
+
+@overload
+def compile_source(
+    text: str,
+    stage: Literal[Stage.TACKY],
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> TACProgram: ...
+
+
+@overload
+def compile_source(
+    text: str,
+    stage: Literal[Stage.CODEGEN],
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> AsmProgram: ...
+
+
+@overload
+def compile_source(
+    text: str,
+    stage: Literal[Stage.ASSEMBLY] = Stage.ASSEMBLY,
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> str: ...
+
+
+@overload
+def compile_source(
+    text: str,
+    stage: Stage,
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> StageResult: ...
+
+
+def compile_source(
+    text: str,
+    stage: Stage = Stage.ASSEMBLY,
+    options: Options | None = None,
+    cache: MemoryCache | None = None,
+    profile: Profile | None = None,
+) -> StageResult:
+    """Compile C source text in memory, up to and including `stage`.
+
+    Returns the tokens, AST, TAC, assembly tree or assembly text. Nothing is
+    written to disk and no subprocess is run, so only sources the built-in
+    preprocessor supports can be compiled, and quoted includes are resolved in the
+    current directory. The source is preprocessed on every call, then results of
+    every later stage are memoized in `cache`, by default the one returned by
+    `default_cache`. Stages run, rather than found in the cache, are timed and
+    counted in `profile`, if given.
+    """
+    if cache is None:
+        cache = _DEFAULT_CACHE
+    ctx = CompilationContext(
+        options if options is not None else Options(), profile=profile
+    )
+    try:
+        # results are keyed by the preprocessed source, so they follow edits to
+        # included headers and the directory includes are resolved in
+        with timed(profile, "preprocess"):
+            source = preprocess_builtin(text)
+        if source is None:
+            raise RuntimeError(
+                "PreprocessError: source needs the gcc preprocessor, which"
+                " compile_source does not run"
+            )
+        digest = hashlib.sha256(source.encode()).digest()
+        return _stage_result(stage, source, digest, cache, ctx)
+    finally:
+        if profile is not None:
+            profile.counts.update(ctx.stats)
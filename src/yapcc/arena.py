@@ -0,0 +1,183 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Flat, arena-based AST representation."""
+
+from array import array
+from collections.abc import Sequence
+from enum import IntEnum
+
+from yapcc.lex import Token
+from yapcc.parse import (
+    ComplementOperator,
+    Constant,
+    Expression,
+    Function,
+    NegateOperator,
+    Program,
+    Return,
+    Statement,
+    TokenStream,
+    Unary,
+    UnaryOperator,
+    parse_with,
+)
+
+
+class NodeKind(IntEnum):
+    """A flat AST node kind."""
+
+    CONSTANT = 1
+    NEGATE = 2
+    COMPLEMENT = 3
+    RETURN = 4
+    FUNCTION = 5
+    PROGRAM = 6
+
+
+_UNARY_KINDS: dict[UnaryOperator, NodeKind] = {
+    NegateOperator(): NodeKind.NEGATE,
+    ComplementOperator(): NodeKind.COMPLEMENT,
+}
+
+NO_CHILD = -1
+
+
+class FlatAST:
+    """An AST stored as parallel arrays, indexed by node.
+
+    Node `i` has kind `kinds[i]`, an operand `values[i]` (the value of a constant,
+    or the index of a function's name in `names`), and the index of its child in
+    `children[i]` (or `NO_CHILD`). Nodes are stored bottom-up, so every child
+    precedes its parent and the root is the last node.
+
+    A `FlatAST` is also a parser builder: `parse_flat` appends nodes to it
+    directly, without creating any per-node objects.
+    """
+
+    __slots__ = ("kinds", "values", "children", "names")
+
+    def __init__(self) -> None:
+        self.kinds = array("B")
+        self.values = array("q")
+        self.children = array("q")
+        self.names: list[str] = []
+
+    def __len__(self) -> int:
+        """Return the number of nodes."""
+        return len(self.kinds)
+
+    @property
+    def root(self) -> int:
+        """The index of the root node."""
+        return len(self.kinds) - 1
+
+    def _append(self, kind: NodeKind, value: int, child: int) -> int:
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.children.append(child)
+        return len(self.kinds) - 1
+
+    def constant(self, value: int) -> int:
+        """Append a constant expression node."""
+        try:
+            return self._append(NodeKind.CONSTANT, value, NO_CHILD)
+        except OverflowError:
+            raise RuntimeError(
+                f'SyntaxError: Constant "{value}" is out of range'
+            ) from None
+
+    def unary(self, op: UnaryOperator, exp: int) -> int:
+        """Append a unary expression node."""
+        return self._append(_UNARY_KINDS[op], 0, exp)
+
+    def return_(self, exp: int) -> int:
+        """Append a return statement node."""
+        return self._append(NodeKind.RETURN, 0, exp)
+
+    def function(self, name: str, body: int) -> int:
+        """Append a function definition node."""
+        self.names.append(name)
+        return self._append(NodeKind.FUNCTION, len(self.names) - 1, body)
+
+    def program(self, function_definition: int) -> "FlatAST":
+        """Append the root node, completing the AST."""
+        self._append(NodeKind.PROGRAM, 0, function_definition)
+        return self
+
+
+def parse_flat(tokens: Sequence[Token] | TokenStream) -> FlatAST:
+    """Parse a sequence of tokens, returning a flat AST."""
+    return parse_with(tokens, FlatAST())
+
+
+def _exp(node: object) -> Expression:
+    assert isinstance(node, Expression)
+    return node
+
+
+def to_tree(flat: FlatAST) -> Program:
+    """Convert a flat AST to the equivalent dataclass AST."""
+    # children precede parents, so a single forward pass sees every child first
+    nodes: list[object] = []
+    for kind, value, child in zip(flat.kinds, flat.values, flat.children, strict=True):
+        match kind:
+            case NodeKind.CONSTANT:
+                nodes.append(Constant(value))
+            case NodeKind.NEGATE:
+                nodes.append(Unary(NegateOperator(), _exp(nodes[child])))
+            case NodeKind.COMPLEMENT:
+                nodes.append(Unary(ComplementOperator(), _exp(nodes[child])))
+            case NodeKind.RETURN:
+                nodes.append(Return(_exp(nodes[child])))
+            case NodeKind.FUNCTION:
+                body = nodes[child]
+                assert isinstance(body, Statement)
+                nodes.append(Function(flat.names[value], body))
+            case NodeKind.PROGRAM:
+                fn = nodes[child]
+                assert isinstance(fn, Function)
+                nodes.append(Program(fn))
+            case _:
+                raise RuntimeError(f'Unsupported flat AST node kind "{kind}"')
+
+    root = nodes[-1] if nodes else None
+    if not isinstance(root, Program):
+        raise RuntimeError("Flat AST has no program root node")
+    return root
+
+
+def from_tree(ast: Program) -> FlatAST:
+    """Convert a dataclass AST to the equivalent flat AST."""
+    flat = FlatAST()
+    fn = ast.function_definition
+    if not isinstance(fn.body, Return):
+        raise RuntimeError(f'Unsupported AST statement "{type(fn.body).__name__}"')
+
+    # walk the expression with an explicit stack, appending the operand first
+    exp = fn.body.exp
+    pending: list[UnaryOperator] = []
+    while isinstance(exp, Unary):
+        pending.append(exp.op)
+        exp = exp.exp
+    if not isinstance(exp, Constant):
+        raise RuntimeError(f'Unsupported AST expression "{type(exp).__name__}"')
+
+    node = flat.constant(exp.value)
+    while pending:
+        node = flat.unary(pending.pop(), node)
+
+    return flat.program(flat.function(fn.name, flat.return_(node)))
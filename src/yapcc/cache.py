@@ -0,0 +1,174 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Content-addressed on-disk cache of compiled assembly.
+
+Entries are keyed by a hash of the preprocessed source, the compiler's own
+sources and the compiler options, so any change to one of them misses. Every
+entry is a file written atomically, so concurrent compilations, in one process or
+many, can share a cache directory. Recency is tracked through entry modification
+times, and the least recently used entries are evicted to keep the cache within
+its size budget.
+"""
+
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import re
+import tempfile
+from dataclasses import asdict, dataclass
+
+from yapcc.context import CompilationContext, Options
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SUFFIX = ".s"
+_TEMP_PREFIX = ".tmp-"
+# other files in the directory, such as a user's own assembly, are never entries
+_ENTRY_NAME = re.compile(r"[0-9a-f]{64}\.s")
+
+
+@functools.cache
+def _compiler_digest() -> bytes:
+    # hashing the compiler's sources invalidates entries whenever it changes,
+    # including between unreleased versions
+    digest = hashlib.sha256()
+    package = os.path.dirname(__file__)
+    for name in sorted(os.listdir(package)):
+        if name.endswith(".py"):
+            with open(os.path.join(package, name), "rb") as module:
+                digest.update(name.encode() + b"\0" + module.read() + b"\0")
+    return digest.digest()
+
+
+@functools.cache
+def _entry_mode() -> int:
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def cache_key(source: str, options: Options) -> str:
+    """Return the cache key for a preprocessed source compiled with `options`."""
+    digest = hashlib.sha256(_compiler_digest())
+    digest.update(json.dumps(asdict(options), sort_keys=True).encode() + b"\0")
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class DiskCache:
+    """A compile cache in `directory`, holding at most `max_bytes` of entries.
+
+    Entries are stored under keys returned by `cache_key`; other files in
+    `directory` are left alone.
+
+    Hits, misses and evictions are recorded in `ctx` as `cache_hits`,
+    `cache_misses` and `cache_evictions`.
+    """
+
+    directory: str
+    max_bytes: int = DEFAULT_MAX_BYTES
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key: str, ctx: CompilationContext | None = None) -> str | None:
+        """Return the assembly cached under `key`, or `None` on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="ascii") as entry:
+                assembly = entry.read()
+            # mark the entry as recently used
+            os.utime(path)
+        except OSError:
+            # never written, evicted by a concurrent compilation, or unreadable;
+            # a cache problem never fails a compilation
+            if ctx is not None:
+                ctx.stats["cache_misses"] += 1
+            return None
+        if ctx is not None:
+            ctx.stats["cache_hits"] += 1
+        return assembly
+
+    def put(
+        self, key: str, assembly: str, ctx: CompilationContext | None = None
+    ) -> None:
+        """Cache `assembly` under `key`, then evict entries over the size budget.
+
+        Nothing is cached if the directory cannot be written to.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix=_TEMP_PREFIX, dir=self.directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="ascii") as entry:
+                # mkstemp creates the file private to its owner, but the cache may
+                # be shared with other users
+                os.fchmod(entry.fileno(), _entry_mode())
+                entry.write(assembly)
+            # readers see either no entry or a complete one
+            os.replace(temp_path, self._path(key))
+        except BaseException as e:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            if isinstance(e, OSError):
+                return
+            raise
+        with contextlib.suppress(OSError):
+            self.evict(ctx)
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries: list[tuple[float, int, str]] = []
+        with contextlib.suppress(FileNotFoundError), os.scandir(self.directory) as it:
+            for dir_entry in it:
+                # skips partially written temp files as well
+                if not _ENTRY_NAME.fullmatch(dir_entry.name):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    stat = dir_entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+        return entries
+
+    def evict(self, ctx: CompilationContext | None = None) -> None:
+        """Remove least recently used entries until the cache is within budget."""
+        entries = self._entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        entries.sort()
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                if ctx is not None:
+                    ctx.stats["cache_evictions"] += 1
+            size -= entry_size
+
+    def usage(self) -> tuple[int, int]:
+        """Return the number of entries and their total size in bytes."""
+        entries = self._entries()
+        return len(entries), sum(entry_size for _, entry_size, _ in entries)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        for _, _, path in self._entries():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
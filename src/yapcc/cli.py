@@ -17,26 +17,56 @@
 """Main CLI entrypoint."""
 
 import argparse
-import contextlib
 import os
 import subprocess
 import sys
-from pprint import pp
-from typing import Callable
+from collections import Counter
+from collections.abc import Iterator, Sequence
 
-from yapcc.codegen import codegen, emit
-from yapcc.lex import lex
-from yapcc.parse import parse
-from yapcc.tac import ir
+from yapcc.cache import DEFAULT_MAX_BYTES, DiskCache
+from yapcc.client import compile_remote, default_socket_path
+from yapcc.context import OPTIMIZATION_LEVELS, Options
+from yapcc.jobs import DUMP_FORMATS, DUMPS, Job, Result, Stage, write_output
+from yapcc.profile import Profile, report_json, report_trace, stage
+from yapcc.toolchain import deliver, link, link_input, remove, text_writer
 
+# The compiler itself is imported lazily, so that client mode starts quickly.
 
-def _make_cleanup(paths: list[str]) -> Callable[[], None]:
-    def cleanup() -> None:
-        for f in paths:
-            with contextlib.suppress(FileNotFoundError):
-                os.remove(f)
 
-    return cleanup
+def _compile_all(jobs: Sequence[Job], workers: int) -> Iterator[Result]:
+    from yapcc.driver import compile_job
+
+    # results are yielded in job order, as soon as each one and its predecessors
+    # are done
+    if workers == 1 or len(jobs) == 1:
+        # in-process, dumps are streamed straight to stdout
+        for job in jobs:
+            yield compile_job(job, sys.stdout)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // (4 * workers))
+        yield from pool.map(compile_job, jobs, chunksize=chunksize)
+
+
+def _deliver_remote_assembly(job: Job, result: Result) -> None:
+    # a server returns the assembly, which the client assembles and links itself
+    assembly = result.assembly
+    if assembly is None:
+        return
+    deliver(job, text_writer(assembly), result.profile)
+
+
+def _parse_dumps(value: str) -> tuple[str, ...]:
+    dumps = tuple(dump for dump in value.split(",") if dump)
+    for dump in dumps:
+        if dump not in DUMPS:
+            raise argparse.ArgumentTypeError(
+                f"invalid dump {dump!r} (choose from {', '.join(DUMPS)})"
+            )
+    return dumps
 
 
 def main() -> None:
@@ -52,82 +82,260 @@ def main() -> None:
         "--codegen", action="store_true", help="lex, parse, and generate assembly only"
     )
     parser.add_argument("-S", action="store_true", help="emit assembly")
-    parser.add_argument("file")
+    parser.add_argument(
+        "-O",
+        dest="optimization_level",
+        type=int,
+        choices=OPTIMIZATION_LEVELS,
+        default=1,
+        metavar="LEVEL",
+        help="optimization level: 0 (none), 1 (default), or 2 (iterate to fixpoint)",
+    )
+    parser.add_argument(
+        "-j",
+        dest="jobs",
+        type=int,
+        metavar="N",
+        help="compile with N worker processes (0 for one per CPU, the default for"
+        " --server; otherwise 1)",
+    )
+    parser.add_argument(
+        "-o", dest="output", help="link every file into this one executable"
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--server",
+        action="store_true",
+        help="serve compile requests from warm worker processes",
+    )
+    mode.add_argument(
+        "--client", action="store_true", help="compile with a running server"
+    )
+    parser.add_argument(
+        "--socket",
+        default=default_socket_path(),
+        metavar="PATH",
+        help="server socket path (default: yapcc-$UID.sock in $XDG_RUNTIME_DIR, or"
+        " in the temp directory)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="reuse assembly compiled by earlier runs from DIR (default:"
+        " $YAPCC_CACHE_DIR, or no cache; never with --client)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        metavar="MB",
+        help="evict least recently used entries above MB megabytes (default:"
+        " %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-stats", action="store_true", help="report cache hits and misses"
+    )
+    parser.add_argument(
+        "--pipe",
+        action="store_true",
+        help="stream assembly to the assembler instead of writing .s files",
+    )
+    parser.add_argument(
+        "--save-temps",
+        action="store_true",
+        help="keep the .i, .s and .o files of every stage",
+    )
+    parser.add_argument(
+        "--dump",
+        type=_parse_dumps,
+        default=(),
+        metavar="IR[,IR...]",
+        help=f"dump intermediate representations, out of {','.join(DUMPS)}",
+    )
+    parser.add_argument(
+        "--dump-format",
+        choices=DUMP_FORMATS,
+        default="text",
+        help="dump as compact text (the default) or newline-delimited JSON",
+    )
+    parser.add_argument(
+        "--time-passes",
+        action="store_true",
+        help="report the wall time, CPU time and peak memory of every stage, the"
+        " runs of every optimization pass, and counts such as tokens and"
+        " instructions, as a table on stderr",
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="PATH",
+        help="write the same report for every file, and in total, as JSON to PATH"
+        " (- for stdout)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="write begin and end events of every file, stage and subprocess to"
+        " PATH, in the Chrome trace-event format",
+    )
+    parser.add_argument("files", nargs="*", metavar="file")
 
     args = parser.parse_args()
 
-    lex_only: bool = args.lex
-    parse_only: bool = args.parse
-    tac_only: bool = args.tacky
-    codegen_only: bool = args.codegen
+    stop_after = Stage.ASSEMBLY
+    if args.lex:
+        stop_after = Stage.LEX
+    elif args.parse:
+        stop_after = Stage.PARSE
+    elif args.tacky:
+        stop_after = Stage.TACKY
+    elif args.codegen:
+        stop_after = Stage.CODEGEN
     emit_only: bool = args.S
+    optimization_level: int = args.optimization_level
+    output_path: str | None = args.output
+    save_temps: bool = args.save_temps
+    # -S asks for the assembly, so it is never piped
+    pipe: bool = args.pipe and not emit_only
+    socket_path: str = args.socket
+    jobs_arg: int | None = args.jobs
+    if jobs_arg is None:
+        jobs_arg = 0 if args.server else 1
+    workers = jobs_arg or os.cpu_count() or 1
+    stats_path: str | None = args.stats
+    trace_path: str | None = args.trace
+    # only reports of memory need it traced, which slows compilation down
+    profile_memory: bool = args.time_passes or stats_path is not None
+    profiling = profile_memory or trace_path is not None
 
-    (input_base, _) = os.path.splitext(args.file)
-    input_path = args.file
-    preprocess_path = input_base + ".i"
-    assembly_path = input_base + ".s"
-    output_path = input_base
+    if args.server:
+        if args.files:
+            parser.error("--server does not take files")
+        from yapcc.server import serve
 
-    cleanup_all = _make_cleanup([preprocess_path, assembly_path, output_path])
-    cleanup_except_asm = _make_cleanup([preprocess_path])
+        serve(socket_path, workers)
+        return
+    if not args.files:
+        parser.error("the following arguments are required: file")
+    if output_path is not None and (emit_only or stop_after != Stage.ASSEMBLY):
+        parser.error("-o cannot be combined with -S or a stage option")
+    if jobs_arg < 0:
+        parser.error("-j must not be negative")
+    cache_dir: str | None = args.cache_dir
+    if args.client:
+        # a server never writes to a cache directory named by a client
+        if cache_dir is not None or args.cache_stats:
+            parser.error(
+                "--cache-dir and --cache-stats cannot be combined with --client"
+            )
+    elif cache_dir is None:
+        cache_dir = os.environ.get("YAPCC_CACHE_DIR")
+    cache = None
+    if cache_dir is not None:
+        cache = DiskCache(os.path.abspath(cache_dir), args.cache_size * 1024 * 1024)
+    elif args.cache_stats:
+        parser.error("--cache-stats requires a cache directory")
 
-    try:
-        # pre-process source file
-        subprocess.run(
-            ["gcc", "-E", "-P", input_path, "-o", preprocess_path], check=True
+    options = Options(optimization_level=optimization_level)
+    # without -o, each file is linked by its own worker
+    link_each = not emit_only and output_path is None
+    jobs = [
+        Job(
+            path,
+            stop_after,
+            options,
+            os.path.splitext(path)[0] if link_each else None,
+            cache=cache,
+            pipe=pipe,
+            save_temps=save_temps,
+            dumps=args.dump,
+            dump_format=args.dump_format,
+            profile=profiling,
+            profile_memory=profile_memory,
         )
+        for path in args.files
+    ]
+
+    if args.client:
+        # the server may run in another directory
+        remote_jobs = [
+            Job(
+                os.path.abspath(job.input_path),
+                stop_after,
+                options,
+                capture=True,
+                dumps=job.dumps,
+                dump_format=job.dump_format,
+                profile=job.profile,
+                profile_memory=job.profile_memory,
+            )
+            for job in jobs
+        ]
+        results = compile_remote(remote_jobs, socket_path)
+    else:
+        results = _compile_all(jobs, workers)
+
+    failed = False
+    stats: Counter[str] = Counter()
+    profiles: list[tuple[str, Profile]] = []
+    try:
+        for job, result in zip(jobs, results, strict=True):
+            write_output(result, sys.stdout)
+            stats.update(result.stats)
+            if result.error is None and args.client:
+                try:
+                    _deliver_remote_assembly(job, result)
+                except Exception as e:
+                    result = Result(job.input_path, error=str(e))
+            if result.error is not None:
+                print(f"yapcc: {job.input_path}: {result.error}", file=sys.stderr)
+                failed = True
+            if result.profile is not None:
+                profiles.append((job.input_path, result.profile))
+    except RuntimeError as e:
+        # the server is unreachable or went away, rather than one file failing
+        if not args.client:
+            raise
+        print(f"yapcc: {e}", file=sys.stderr)
+        failed = True
+    sys.stdout.flush()
 
-        # compile pre-processed source file
-
-        # read source & perform lexing
-        with open(preprocess_path, "r", encoding="ascii") as preprocess_file:
-            source = preprocess_file.read()
-
-        # lex step
-        tokens = lex(source)
-        pp(tokens)
-        if lex_only:
-            cleanup_all()
-            sys.exit(0)
-
-        # parse step
-        ast = parse(tokens)
-        pp(ast)
-        if parse_only:
-            cleanup_all()
-            sys.exit(0)
-
-        # tac IR step
-        tac = ir(ast)
-        pp(tac)
-        if tac_only:
-            cleanup_all()
-            sys.exit(0)
-
-        # codegen step
-        asm = codegen(ast)
-        # pp(asm)
-        if codegen_only:
-            cleanup_all()
-            sys.exit(0)
-
-        # emit step
-        output = emit(asm)
-        # pp(output)
-        with open(assembly_path, "w", encoding="ascii") as outfile:
-            outfile.write(output)
-        if emit_only:
-            cleanup_except_asm()
-            sys.exit(0)
-        os.remove(preprocess_path)
-
-        # assemble and link assembly file
-        subprocess.run(["gcc", assembly_path, "-o", output_path], check=True)
-        os.remove(assembly_path)
-
-    except Exception:
-        cleanup_all()
-        raise
+    # the final link is only part of the total, since it is shared by every file
+    total = Profile(memory=profile_memory)
+    for _, profile in profiles:
+        total.update(profile)
+
+    link_inputs = [link_input(job) for job in jobs]
+    try:
+        if output_path is not None and not failed:
+            # link every translation unit into one executable
+            with stage(total if profiling else None, "link"):
+                link(link_inputs, output_path, total if profiling else None)
+    except subprocess.CalledProcessError as e:
+        print(f"yapcc: {output_path}: {e}", file=sys.stderr)
+        failed = True
+    finally:
+        if output_path is not None and not save_temps:
+            remove(*link_inputs)
+    if cache is not None and args.cache_stats:
+        entries, size = cache.usage()
+        print(
+            f"yapcc: cache: {stats['cache_hits']} hits, {stats['cache_misses']}"
+            f" misses, {stats['cache_evictions']} evictions; {entries} entries,"
+            f" {size} bytes",
+            file=sys.stderr,
+        )
+    if args.time_passes:
+        sys.stderr.write(total.table())
+    if stats_path == "-":
+        print(report_json(profiles, total))
+    elif stats_path is not None:
+        with open(stats_path, "w", encoding="utf-8") as outfile:
+            outfile.write(report_json(profiles, total) + "\n")
+    if trace_path is not None:
+        with open(trace_path, "w", encoding="utf-8") as outfile:
+            outfile.write(report_trace(total.events) + "\n")
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
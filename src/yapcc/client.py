@@ -0,0 +1,63 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Client for a yapcc compile server.
+
+Only job descriptions are imported here, not the compiler, so a client starts
+quickly.
+"""
+
+import os
+import socket
+import tempfile
+from collections.abc import Iterator, Sequence
+
+from yapcc.jobs import Job, Result, dump_job, load_result
+
+
+def default_socket_path() -> str:
+    """Return the per-user socket path a server listens on by default."""
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"yapcc-{os.getuid()}.sock")
+
+
+def compile_remote(jobs: Sequence[Job], socket_path: str) -> Iterator[Result]:
+    """Compile jobs on the server listening at `socket_path`.
+
+    Every job is sent before any result is read, so the server can compile them in
+    parallel. Results are yielded in job order.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            raise RuntimeError(
+                f'ServerError: no server listening on "{socket_path}"'
+            ) from e
+        with sock.makefile("w", encoding="utf-8") as requests:
+            for job in jobs:
+                requests.write(dump_job(job) + "\n")
+        sock.shutdown(socket.SHUT_WR)
+
+        with sock.makefile("r", encoding="utf-8") as responses:
+            count = 0
+            for line in responses:
+                count += 1
+                yield load_result(line)
+        if count != len(jobs):
+            raise RuntimeError(
+                f"ServerError: expected {len(jobs)} results, but received {count}"
+            )
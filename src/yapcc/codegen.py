@@ -16,114 +16,356 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Assembly codegen step logic."""
 
+import io
 from dataclasses import dataclass
-
-from yapcc.parse import Constant as ASTConstant
-from yapcc.parse import Function as ASTFunction
-from yapcc.parse import Program as ASTProgram
-from yapcc.parse import Return as ASTReturn
-from yapcc.parse import Statement as ASTStatement
+from typing import TextIO, overload
+
+from yapcc.context import CompilationContext
+from yapcc.interning import Singleton, SmallValueCached
+from yapcc.regalloc import linear_scan
+from yapcc.tac import Complement as TACComplement
+from yapcc.tac import Constant as TACConstant
+from yapcc.tac import Copy as TACCopy
+from yapcc.tac import Function as TACFunction
+from yapcc.tac import Instruction as TACInstruction
+from yapcc.tac import Negate as TACNegate
+from yapcc.tac import Program as TACProgram
+from yapcc.tac import Return as TACReturn
+from yapcc.tac import Unary as TACUnary
+from yapcc.tac import UnaryOperator as TACUnaryOperator
+from yapcc.tac import Value as TACValue
+from yapcc.tac import Var as TACVar
 
 
 class Node:
     """Abstract assembly node."""
 
+    __slots__ = ()
+
 
 class Operand(Node):
     """Abstract assembly operand."""
 
+    __slots__ = ()
+
 
 class Expression(Operand):
     """Abstract assembly expression."""
 
+    __slots__ = ()
 
-@dataclass
-class Imm(Expression):
+
+@dataclass(frozen=True, slots=True, init=False)
+class Imm(SmallValueCached, Expression):
     """Assembly imm expression."""
 
     value: int
 
 
+@dataclass(frozen=True, slots=True)
 class Register(Operand):
     """Assembly register."""
 
+    name: str
+
+
+AX = Register("ax")
+CX = Register("cx")
+DX = Register("dx")
+SI = Register("si")
+DI = Register("di")
+R8 = Register("r8")
+R9 = Register("r9")
+R10 = Register("r10")
+R11 = Register("r11")
+
+# Caller-saved registers that may hold TAC temps. %eax is reserved for return values
+# and %r10d as scratch for fixing up instructions.
+ALLOCATABLE_REGISTERS: tuple[Register, ...] = (CX, DX, SI, DI, R8, R9, R11)
+
+
+@dataclass(frozen=True, slots=True)
+class Pseudo(Operand):
+    """Assembly pseudo-register, standing in for a TAC temp until allocation."""
+
+    name: str
+
+
+@dataclass(frozen=True, slots=True)
+class Stack(Operand):
+    """Assembly stack slot, addressed relative to the frame base pointer."""
+
+    offset: int
+
+
+class UnaryOperator(Node):
+    """Abstract assembly unary operator."""
+
+    __slots__ = ()
+
+
+@dataclass(frozen=True, slots=True)
+class Neg(Singleton, UnaryOperator):
+    """Assembly neg operator."""
+
+
+@dataclass(frozen=True, slots=True)
+class Not(Singleton, UnaryOperator):
+    """Assembly not operator."""
+
 
 class Instruction(Node):
     """Abstract assembly instruction."""
 
+    __slots__ = ()
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Mov(Instruction):
     """Assembly mov instruction."""
 
-    src: Imm
-    dest: Register
+    src: Operand
+    dest: Operand
+
+
+@dataclass(frozen=True, slots=True)
+class Unary(Instruction):
+    """Assembly unary instruction."""
+
+    op: UnaryOperator
+    operand: Operand
+
 
+@dataclass(frozen=True, slots=True)
+class Xor(Instruction):
+    """Assembly xor instruction."""
 
-class Ret(Instruction):
+    src: Operand
+    dest: Operand
+
+
+@dataclass(frozen=True, slots=True)
+class Ret(Singleton, Instruction):
     """Assembly ret instruction."""
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Function(Node):
-    """Assembly function node."""
+    """Assembly function node.
+
+    `stack_size` is the number of bytes of stack slots the function's frame needs.
+    """
 
     name: str
-    instructions: list[Instruction]
+    instructions: tuple[Instruction, ...]
+    stack_size: int = 0
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Program(Node):
     """Assembly root node."""
 
     function_definition: Function
 
 
-def _transform_ast_constant(c: ASTConstant) -> Imm:
-    return Imm(c.value)
-
-
-def _transform_ast_statement(s: ASTStatement) -> list[Instruction]:
-    if isinstance(s, ASTReturn):
-        if isinstance(s.exp, ASTConstant):
-            return [Mov(_transform_ast_constant(s.exp), Register()), Ret()]
-        else:
-            raise RuntimeError(
-                f'Unsupported AST return expression "${type(s).__name__}"'
-            )
-    else:
-        raise RuntimeError(f'Unsupported AST statement "${type(s).__name__}"')
-
-
-def _transform_ast_function(ast_function: ASTFunction) -> Function:
-    return Function(
-        name=ast_function.name,
-        instructions=_transform_ast_statement(ast_function.body),
+def _transform_tac_value(value: TACValue) -> Operand:
+    match value:
+        case TACConstant(v):
+            return Imm(v)
+        case TACVar(name):
+            return Pseudo(name)
+    raise RuntimeError(f'Unsupported TAC value "{type(value).__name__}"')
+
+
+def _transform_tac_unop(op: TACUnaryOperator) -> UnaryOperator:
+    match op:
+        case TACNegate():
+            return Neg()
+        case TACComplement():
+            return Not()
+    raise RuntimeError(f'Unsupported TAC unary operator "{type(op).__name__}"')
+
+
+def _select_instructions(body: tuple[TACInstruction, ...]) -> list[Instruction]:
+    instructions: list[Instruction] = []
+    for instr in body:
+        match instr:
+            case TACReturn(value):
+                instructions.append(Mov(_transform_tac_value(value), AX))
+                instructions.append(Ret())
+            case TACUnary(op, src, dest):
+                dest_operand = _transform_tac_value(dest)
+                instructions.append(Mov(_transform_tac_value(src), dest_operand))
+                instructions.append(Unary(_transform_tac_unop(op), dest_operand))
+            case TACCopy(src, dest):
+                instructions.append(
+                    Mov(_transform_tac_value(src), _transform_tac_value(dest))
+                )
+            case _:
+                raise RuntimeError(
+                    f'Unsupported TAC instruction "{type(instr).__name__}"'
+                )
+    return instructions
+
+
+def _replace_pseudos(
+    instructions: list[Instruction], registers: dict[Pseudo, Register]
+) -> tuple[list[Instruction], int]:
+    # temps without a register get their own 4-byte stack slot, in order of first
+    # appearance
+    homes: dict[Pseudo, Operand] = dict(registers)
+    slot_count = 0
+
+    def home(operand: Operand) -> Operand:
+        nonlocal slot_count
+        if isinstance(operand, Pseudo):
+            replacement = homes.get(operand)
+            if replacement is None:
+                slot_count += 1
+                replacement = homes[operand] = Stack(-4 * slot_count)
+            return replacement
+        return operand
+
+    replaced: list[Instruction] = []
+    for instr in instructions:
+        match instr:
+            case Mov(src, dest):
+                instr = Mov(home(src), home(dest))
+            case Unary(op, operand):
+                instr = Unary(op, home(operand))
+        replaced.append(instr)
+    return replaced, 4 * slot_count
+
+
+def _fix_up(instructions: list[Instruction]) -> list[Instruction]:
+    fixed: list[Instruction] = []
+    for instr in instructions:
+        match instr:
+            case Mov(Stack() as src, Stack() as dest):
+                # x86 has no memory-to-memory mov
+                fixed.append(Mov(src, R10))
+                fixed.append(Mov(R10, dest))
+            case Mov(Imm(0), Register() as dest):
+                # shorter encoding than a mov of a zero immediate
+                fixed.append(Xor(dest, dest))
+            case _:
+                fixed.append(instr)
+    return fixed
+
+
+def _transform_tac_function(fn: TACFunction, ctx: CompilationContext) -> Function:
+    registers: dict[Pseudo, Register] = {}
+    if ctx.options.register_allocation:
+        for temp, register in linear_scan(fn, ALLOCATABLE_REGISTERS).items():
+            if register is None:
+                ctx.stats["spilled_temps"] += 1
+            else:
+                registers[Pseudo(temp.value)] = register
+
+    instructions, stack_size = _replace_pseudos(
+        _select_instructions(fn.body), registers
     )
+    # keep the stack pointer 16-byte aligned
+    stack_size = -(-stack_size // 16) * 16
+    return Function(fn.identifier, tuple(_fix_up(instructions)), stack_size)
 
 
-def _transform_program(ast: ASTProgram) -> Program:
-    return Program(function_definition=_transform_ast_function(ast.function_definition))
+def codegen(tac: TACProgram, ctx: CompilationContext | None = None) -> Program:
+    """Transform three-address code, returning an intermediate assembly tree.
 
-
-def codegen(ast: ASTProgram) -> Program:
-    """Transform an AST, returning an intermediate assembly tree."""
-    program = _transform_program(ast)
+    Unless disabled in the context options, temps are assigned registers by linear
+    scan and only spilled to stack slots under register pressure.
+    """
+    if ctx is None:
+        ctx = CompilationContext()
+    program = Program(_transform_tac_function(tac.function_definition, ctx))
+    ctx.stats["asm_instructions"] += len(program.function_definition.instructions)
     return program
 
 
-def emit(program: Program) -> str:
-    """Format an intermediate assembly tree."""
-    output: list[str] = []
+_REGISTER_NAMES: dict[Register, str] = {
+    AX: "%eax",
+    CX: "%ecx",
+    DX: "%edx",
+    SI: "%esi",
+    DI: "%edi",
+    R8: "%r8d",
+    R9: "%r9d",
+    R10: "%r10d",
+    R11: "%r11d",
+}
+
+
+def format_operand(operand: Operand) -> str:
+    """Format an operand in AT&T syntax."""
+    match operand:
+        case Imm(value):
+            return f"${value}"
+        case Register():
+            return _REGISTER_NAMES[operand]
+        case Stack(offset):
+            return f"{offset}(%rbp)"
+    raise RuntimeError(f'Unsupported assembly operand "{type(operand).__name__}"')
+
+
+# Templates are formatted with the instruction's formatted operands, in order.
+_TEMPLATES: dict[type[Instruction], str] = {
+    Mov: "\tmovl\t{}, {}\n",
+    Xor: "\txorl\t{}, {}\n",
+}
+_UNARY_TEMPLATES: dict[type[UnaryOperator], str] = {
+    Neg: "\tnegl\t{}\n",
+    Not: "\tnotl\t{}\n",
+}
+_PROLOGUE = "\tpushq\t%rbp\n\tmovq\t%rsp, %rbp\n\tsubq\t${}, %rsp\n"
+_EPILOGUE = "\tmovq\t%rbp, %rsp\n\tpopq\t%rbp\n"
+_RET = "\tret\n"
+_FOOTER = '\t.section\t.note.GNU-stack, "",@progbits\n'
+
+# Lines are written to the output stream in chunks of this many.
+_CHUNK_SIZE = 1024
+
+
+def _emit_instruction(instr: Instruction, fn: Function) -> str:
+    match instr:
+        case Mov(src, dest) | Xor(src, dest):
+            template = _TEMPLATES[type(instr)]
+            return template.format(format_operand(src), format_operand(dest))
+        case Unary(op, operand):
+            return _UNARY_TEMPLATES[type(op)].format(format_operand(operand))
+        case Ret():
+            return _EPILOGUE + _RET if fn.stack_size else _RET
+    raise RuntimeError(f'Unsupported assembly instruction "{type(instr).__name__}"')
+
+
+@overload
+def emit(program: Program) -> str: ...
+
+
+@overload
+def emit(program: Program, out: TextIO) -> None: ...
+
+
+def emit(program: Program, out: TextIO | None = None) -> str | None:
+    """Format an intermediate assembly tree.
+
+    The assembly is written to `out` in chunks as it is formatted, so the full text
+    is never held in memory. Without `out`, it is returned as a string instead.
+    """
+    if out is None:
+        with io.StringIO() as buffer:
+            emit(program, buffer)
+            return buffer.getvalue()
 
     fn = program.function_definition
-    output.append(f"\t.globl {fn.name}")
-    output.append(f"{fn.name}:")
+    chunk: list[str] = [f"\t.globl {fn.name}\n{fn.name}:\n"]
+    if fn.stack_size:
+        chunk.append(_PROLOGUE.format(fn.stack_size))
     for instr in fn.instructions:
-        if isinstance(instr, Mov):
-            output.append(f"\tmovl\t${instr.src.value}, %eax")
-        elif isinstance(instr, Ret):
-            output.append("\tret")
-
-    output.append('\t.section\t.note.GNU-stack, "",@progbits\n')
-    return "\n".join(output)
+        chunk.append(_emit_instruction(instr, fn))
+        if len(chunk) >= _CHUNK_SIZE:
+            out.write("".join(chunk))
+            chunk.clear()
+    chunk.append(_FOOTER)
+    out.write("".join(chunk))
+    return None
@@ -0,0 +1,65 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Per-compilation state shared by every compiler stage."""
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from yapcc.profile import Profile
+
+OPTIMIZATION_LEVELS = range(3)
+
+
+@dataclass(frozen=True, slots=True)
+class Options:
+    """Compiler options."""
+
+    optimization_level: int = 1
+    """The `-O` level selecting which optimization passes run."""
+
+    register_allocation: bool | None = None
+    """Keep TAC temps in registers where possible, instead of in stack slots.
+
+    Defaults to whether `optimization_level` is above 0.
+    """
+
+    def __post_init__(self) -> None:
+        """Derive the defaults that depend on the optimization level."""
+        if self.register_allocation is None:
+            object.__setattr__(self, "register_allocation", self.optimization_level > 0)
+
+
+@dataclass(slots=True)
+class CompilationContext:
+    """State for compiling one translation unit.
+
+    A context owns everything a compilation would otherwise share through module
+    globals, so output is deterministic per compilation and separate contexts can be
+    used concurrently from different threads. A single context must not be.
+    """
+
+    options: Options = field(default_factory=Options)
+    stats: Counter[str] = field(default_factory=Counter)
+    temp_count: int = 0
+    profile: Profile | None = None
+    """Time each stage in this profile, if given."""
+
+    def make_temp_name(self) -> str:
+        """Return a new temp name, unique within this compilation."""
+        name = f"tmp_{self.temp_count}"
+        self.temp_count += 1
+        return name
@@ -0,0 +1,161 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compiler driver running the stages for one translation unit."""
+
+import contextlib
+import tempfile
+import traceback
+from collections.abc import Callable, Iterator
+from typing import TextIO
+
+from yapcc.cache import cache_key
+from yapcc.codegen import emit
+from yapcc.context import CompilationContext
+from yapcc.dump import (
+    Record,
+    asm_records,
+    ast_records,
+    json_lines,
+    tac_records,
+    text_lines,
+    token_records,
+)
+from yapcc.jobs import Job, Result, Stage
+from yapcc.lex import tokenize
+from yapcc.parse import parse
+from yapcc.passes import compile_tac
+from yapcc.preprocess import preprocess
+from yapcc.profile import Profile, span, stage
+from yapcc.tac import ir
+from yapcc.toolchain import deliver, remove, text_writer
+
+Write = Callable[[str], object]
+
+
+def _discard(line: str) -> None:
+    # jobs without dumps and without a stream never write
+    pass
+
+
+def _dump(job: Job, dump: str, records: Iterator[Record], write: Write) -> None:
+    # records are generated lazily, so a dump not requested costs nothing
+    if dump not in job.dumps:
+        return
+    lines = json_lines if job.dump_format == "json" else text_lines
+    for line in lines(dump, job.input_path, records):
+        write(line)
+
+
+def _run(job: Job, ctx: CompilationContext, write: Write) -> str | None:
+    # pre-process source file, in-process unless it needs gcc
+    with stage(ctx.profile, "preprocess"):
+        source = preprocess(job.input_path, ctx, source=job.source)
+        if job.save_temps:
+            with open(job.preprocessed_path, "w", encoding="ascii") as outfile:
+                outfile.write(source)
+
+    # reuse cached assembly for the same source, compiler and options, unless the
+    # stages must run to be dumped
+    key = None
+    if job.cache is not None and job.stop_after == Stage.ASSEMBLY and not job.dumps:
+        key = cache_key(source, ctx.options)
+        assembly = job.cache.get(key, ctx)
+        if assembly is not None:
+            return _output(job, ctx, assembly)
+
+    # lex step
+    with stage(ctx.profile, "lex"):
+        tokens = tokenize(source, ctx)
+    _dump(job, "tokens", token_records(tokens), write)
+    if job.stop_after == Stage.LEX:
+        return None
+
+    # parse step
+    with stage(ctx.profile, "parse"):
+        ast = parse(tokens, ctx)
+    _dump(job, "ast", ast_records(ast), write)
+    if job.stop_after == Stage.PARSE:
+        return None
+
+    # tac IR step
+    with stage(ctx.profile, "ir"):
+        tac = ir(ast, ctx)
+    _dump(job, "tac", tac_records(tac), write)
+    if job.stop_after == Stage.TACKY:
+        return None
+
+    # optimization and codegen steps
+    asm = compile_tac(tac, ctx)
+    _dump(job, "asm", asm_records(asm), write)
+    if job.stop_after == Stage.CODEGEN:
+        return None
+
+    # emit step, then assemble and link
+    if job.cache is None or key is None:
+        if job.capture:
+            with stage(ctx.profile, "emit"):
+                return emit(asm)
+        deliver(job, lambda outfile: emit(asm, outfile), ctx.profile)
+        return None
+    with stage(ctx.profile, "emit"):
+        assembly = emit(asm)
+    job.cache.put(key, assembly, ctx)
+    return _output(job, ctx, assembly)
+
+
+def _output(job: Job, ctx: CompilationContext, assembly: str) -> str | None:
+    if job.capture:
+        return assembly
+    deliver(job, text_writer(assembly), ctx.profile)
+    return None
+
+
+def compile_job(job: Job, out: TextIO | None = None) -> Result:
+    """Compile one translation unit, reporting rather than raising errors.
+
+    Dumps are written to `out` as they are produced. Without it, they are streamed
+    to a temp file named in the result, which `write_output` copies out. On error, any assembly or executable written for the job is
+    removed, so a failing translation unit never affects others compiled
+    alongside it.
+    """
+    profile = Profile(memory=job.profile_memory) if job.profile else None
+    ctx = CompilationContext(job.options, profile=profile)
+    dumps_path = assembly = error = None
+    with contextlib.ExitStack() as stack:
+        if out is None and job.dumps:
+            # a file rather than memory, however large the dumps of a worker get
+            fd, dumps_path = tempfile.mkstemp(prefix="yapcc-", suffix=".dump")
+            out = stack.enter_context(open(fd, "w", encoding="utf-8"))
+        write: Write = _discard if out is None else out.write
+        try:
+            with span(profile, job.input_path, "file"):
+                assembly = _run(job, ctx, write)
+        except Exception as e:
+            if not job.capture:
+                paths = [job.assembly_path, job.object_path, job.output_path]
+                remove(*filter(None, paths))
+            error = "".join(traceback.format_exception_only(e)).strip()
+    if profile is not None:
+        profile.counts.update(ctx.stats)
+    return Result(
+        job.input_path,
+        error=error,
+        stats=ctx.stats,
+        assembly=assembly,
+        profile=profile,
+        dumps_path=dumps_path,
+    )
@@ -0,0 +1,108 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Structured dumps of intermediate representations.
+
+Each representation is turned into a stream of flat records by a generator, one
+record per token, AST node or instruction, and records are formatted one line at
+a time. A dump is therefore written incrementally and never built in memory, and
+its JSON lines can be consumed as they arrive.
+"""
+
+import json
+from collections.abc import Iterator, Sequence
+from dataclasses import fields, is_dataclass
+
+from yapcc import codegen, parse, tac
+from yapcc.lex import Token
+
+Record = dict[str, object]
+
+
+def _scalar(value: object) -> object:
+    match value:
+        case codegen.Imm() | codegen.Register() | codegen.Pseudo() | codegen.Stack():
+            return codegen.format_operand(value)
+        case tac.Constant(v) | tac.Var(v):
+            return v
+        case str() | int():
+            return value
+    # operators have no fields and are named by their type
+    return type(value).__name__
+
+
+def token_records(tokens: Sequence[Token]) -> Iterator[Record]:
+    """Yield one record per token."""
+    for token in tokens:
+        yield {"type": token.type.name, "literal": token.literal}
+
+
+def ast_records(program: parse.Program) -> Iterator[Record]:
+    """Yield one record per AST node, in pre-order, with its depth."""
+    # an explicit stack, since expressions can nest deeper than the recursion limit
+    stack: list[tuple[parse.Node, int]] = [(program, 0)]
+    while stack:
+        node, depth = stack.pop()
+        record: Record = {"depth": depth, "node": type(node).__name__}
+        children: list[parse.Node] = []
+        assert is_dataclass(node)
+        for field in fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, parse.Node) and is_dataclass(value) and fields(value):
+                children.append(value)
+            else:
+                record[field.name] = _scalar(value)
+        yield record
+        stack.extend((child, depth + 1) for child in reversed(children))
+
+
+def _instruction_record(instr: object) -> Record:
+    assert is_dataclass(instr)
+    record: Record = {"depth": 1, "instruction": type(instr).__name__}
+    for field in fields(instr):
+        record[field.name] = _scalar(getattr(instr, field.name))
+    return record
+
+
+def tac_records(program: tac.Program) -> Iterator[Record]:
+    """Yield a record per function, followed by one per TAC instruction in it."""
+    fn = program.function_definition
+    yield {"depth": 0, "function": fn.identifier}
+    for instr in fn.body:
+        yield _instruction_record(instr)
+
+
+def asm_records(program: codegen.Program) -> Iterator[Record]:
+    """Yield a record per function, followed by one per instruction in it."""
+    fn = program.function_definition
+    yield {"depth": 0, "function": fn.name, "stack_size": fn.stack_size}
+    for instr in fn.instructions:
+        yield _instruction_record(instr)
+
+
+def json_lines(dump: str, path: str, records: Iterator[Record]) -> Iterator[str]:
+    """Format records as newline-delimited JSON, tagged with the dump and file."""
+    for record in records:
+        yield json.dumps({"dump": dump, "file": path, **record}) + "\n"
+
+
+def text_lines(dump: str, path: str, records: Iterator[Record]) -> Iterator[str]:
+    """Format records as compact text, one line of values per record."""
+    yield f"# {dump} {path}\n"
+    for record in records:
+        depth = record.pop("depth", 0)
+        assert isinstance(depth, int)
+        yield "  " * depth + " ".join(str(value) for value in record.values()) + "\n"
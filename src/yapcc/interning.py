@@ -0,0 +1,79 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Instance interning for immutable tree nodes."""
+
+from typing import Any, Self
+
+# Integer-valued nodes with values in this range are cached and shared.
+SMALL_VALUES = range(-128, 256)
+
+_singletons: dict[type, Any] = {}
+_small_values: dict[tuple[type, int], Any] = {}
+
+
+class Singleton:
+    """Mixin for stateless nodes: every instantiation returns one shared instance."""
+
+    __slots__ = ()
+
+    def __new__(cls) -> Self:
+        """Return the shared instance of `cls`."""
+        instance = _singletons.get(cls)
+        if instance is None:
+            # setdefault keeps the first instance if threads race to create one
+            instance = _singletons.setdefault(cls, super().__new__(cls))
+        return instance  # type: ignore[no-any-return]
+
+    def __reduce__(self) -> tuple[type[Self], tuple[()]]:
+        """Unpickle (and copy) to the shared instance."""
+        return (type(self), ())
+
+
+class SmallValueCached:
+    """Mixin for nodes holding a single `value`: small values are shared instances.
+
+    Nodes using it must be dataclasses with `init=False`, since a generated
+    `__init__` would write `value` again on a shared instance.
+    """
+
+    __slots__ = ()
+
+    value: int
+
+    def __new__(cls, value: int) -> Self:
+        """Return a shared instance for small values, else a new instance."""
+        # bools and floats equal to small ints are kept apart from them
+        if type(value) is not int or value not in SMALL_VALUES:
+            return cls._create(value)
+        instance = _small_values.get((cls, value))
+        if instance is None:
+            # the value is set before publishing, so other threads never see it unset
+            instance = _small_values.setdefault((cls, value), cls._create(value))
+        return instance  # type: ignore[no-any-return]
+
+    def __init__(self, value: int) -> None:
+        """Leave the instance as `__new__` made it."""
+
+    @classmethod
+    def _create(cls, value: int) -> Self:
+        instance = super().__new__(cls)
+        object.__setattr__(instance, "value", value)
+        return instance
+
+    def __reduce__(self) -> tuple[type[Self], tuple[int]]:
+        """Unpickle (and copy) through `__new__`, so small values stay shared."""
+        return (type(self), (self.value,))
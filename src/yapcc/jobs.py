@@ -0,0 +1,154 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compile jobs and their results.
+
+This module is kept free of compiler stage imports, so that clients of a compile
+server can describe jobs without loading the compiler.
+"""
+
+import json
+import os
+import shutil
+from collections import Counter
+from dataclasses import asdict, dataclass, field, fields
+from enum import StrEnum
+from typing import TextIO
+
+from yapcc.cache import DiskCache
+from yapcc.context import Options
+from yapcc.profile import Profile
+
+DUMPS = ("tokens", "ast", "tac", "asm")
+DUMP_FORMATS = ("text", "json")
+
+
+class Stage(StrEnum):
+    """The last stage to run for a translation unit."""
+
+    LEX = "lex"
+    PARSE = "parse"
+    TACKY = "tacky"
+    CODEGEN = "codegen"
+    ASSEMBLY = "assembly"
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    """A translation unit to compile."""
+
+    input_path: str
+    stop_after: Stage = Stage.ASSEMBLY
+    options: Options = field(default_factory=Options)
+    output_path: str | None = None
+    """Link the assembly into this executable, then remove the assembly."""
+    source: str | None = None
+    """The contents of `input_path`, if they should not be read from disk."""
+    capture: bool = False
+    """Return the assembly in the result instead of writing it to a file."""
+    cache: DiskCache | None = None
+    """Reuse and store assembly in this cache."""
+    pipe: bool = False
+    """Stream the assembly to the assembler instead of writing it to a file."""
+    save_temps: bool = False
+    """Keep the preprocessed source, assembly and object files."""
+    dumps: tuple[str, ...] = ()
+    """Representations to dump, out of `DUMPS`."""
+    dump_format: str = "text"
+    """The format of dumps, out of `DUMP_FORMATS`."""
+    profile: bool = False
+    """Time each stage, count representation sizes and record trace events."""
+    profile_memory: bool = True
+    """Trace the peak memory of each stage too, when profiling."""
+
+    @property
+    def preprocessed_path(self) -> str:
+        """The path the preprocessed source is saved to."""
+        return os.path.splitext(self.input_path)[0] + ".i"
+
+    @property
+    def assembly_path(self) -> str:
+        """The path the assembly is written to."""
+        return os.path.splitext(self.input_path)[0] + ".s"
+
+    @property
+    def object_path(self) -> str:
+        """The path the object is assembled to."""
+        return os.path.splitext(self.input_path)[0] + ".o"
+
+
+@dataclass(frozen=True, slots=True)
+class Result:
+    """The outcome of a job."""
+
+    input_path: str
+    output: str = ""
+    """Dumps of intermediate representations, as sent by a compile server."""
+    error: str | None = None
+    stats: Counter[str] = field(default_factory=Counter)
+    assembly: str | None = None
+    """The assembly, for jobs that capture it."""
+    profile: Profile | None = None
+    """Stage timings and representation sizes, for jobs that profile."""
+    dumps_path: str | None = None
+    """A temp file the dumps were streamed to, for the receiver to copy out."""
+
+
+def write_output(result: Result, out: TextIO) -> None:
+    """Write the dumps of `result` to `out`, removing any temp file they are in."""
+    out.write(result.output)
+    if result.dumps_path is not None:
+        with open(result.dumps_path, "r", encoding="utf-8") as dumps:
+            shutil.copyfileobj(dumps, out)
+        os.remove(result.dumps_path)
+
+
+def dump_job(job: Job) -> str:
+    """Encode a job as one line of JSON."""
+    return json.dumps(asdict(job))
+
+
+def load_job(line: str) -> Job:
+    """Decode a job encoded by `dump_job`."""
+    fields = json.loads(line)
+    options = Options(**fields.pop("options"))
+    cache = fields.pop("cache")
+    return Job(
+        **fields | {"dumps": tuple(fields["dumps"])},
+        options=options,
+        cache=None if cache is None else DiskCache(**cache),
+    )
+
+
+def dump_result(result: Result) -> str:
+    """Encode a result as one line of JSON."""
+    # asdict would rebuild the stats counter from its items, so encode by hand
+    encoded = {f.name: getattr(result, f.name) for f in fields(result)}
+    if result.profile is not None:
+        encoded["profile"] = result.profile.as_dict()
+    return json.dumps(encoded)
+
+
+def load_result(line: str) -> Result:
+    """Decode a result encoded by `dump_result`."""
+    fields = json.loads(line)
+    stats = Counter[str](fields.pop("stats"))
+    profile = fields.pop("profile")
+    return Result(
+        **fields,
+        stats=stats,
+        profile=None if profile is None else Profile.from_dict(profile),
+    )
@@ -16,9 +16,13 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Lexer (tokenizer) step logic."""
 
+import re
+from array import array
+from collections.abc import Iterator, Sequence
 from enum import Enum, auto
-from itertools import takewhile
-from typing import NamedTuple
+from typing import NamedTuple, overload
+
+from yapcc.context import CompilationContext
 
 KEYWORDS: list[str] = ["int", "void", "return"]
 
@@ -52,75 +56,156 @@ class Token(NamedTuple):
     literal: str
 
 
-def _read_constant(source: str) -> Token:
-    literal = "".join(takewhile(lambda char: char.isnumeric(), source))
-
-    if len(literal) != len(source):
-        next_char = source[len(literal)]
-        if next_char.isalpha() or next_char == "_":
-            # TODO: better error message
-            raise RuntimeError(
-                f'TokenError: Illegal constant "{literal+ next_char}..."'
-            )
-
-    return Token(TokenType.CONSTANT, literal)
-
-
-def _read_identifier(source: str) -> Token:
-    literal = "".join(takewhile(lambda char: char.isalnum() or char == "_", source))
-
-    match literal:
-        case "int":
-            return Token(TokenType.INT_KEYWORD, "int")
-        case "void":
-            return Token(TokenType.VOID_KEYWORD, "void")
-        case "return":
-            return Token(TokenType.RETURN_KEYWORD, "return")
-        case _:
-            return Token(TokenType.IDENTIFIER, literal)
-
-
-def _peek(source: str) -> str:
-    if len(source) > 1:
-        return source[1]
-    else:
-        return ""
-
-
-def _next_token(source: str) -> tuple[Token, str]:
-    match first_char := source[0]:
-        case "(":
-            token = Token(TokenType.OPEN_PAREN, "(")
-        case ")":
-            token = Token(TokenType.CLOSE_PAREN, ")")
-        case "{":
-            token = Token(TokenType.OPEN_BRACE, "{")
-        case "}":
-            token = Token(TokenType.CLOSE_BRACE, "}")
-        case ";":
-            token = Token(TokenType.SEMICOLON, ";")
-        case "-":
-            next_char = _peek(source)
-            if next_char == "-":
-                token = Token(TokenType.MINUS_MINUS, "--")
-                raise RuntimeError('TokenError: Illegal token "--"')
-            token = Token(TokenType.MINUS, "-")
-        case "~":
-            token = Token(TokenType.TILDE, "~")
-        case _ if first_char.isnumeric():
-            token = _read_constant(source)
-        case _ if first_char.isalpha() or first_char == "_":
-            token = _read_identifier(source)
-        case _:
-            raise RuntimeError(f'TokenError: Illegal token "{first_char}"')
-
-    return (token, source[len(token.literal) :])
-
-
-def lex(source: str) -> list[Token]:
-    """Perform lex step."""
-    tokens: list[Token] = []
-    while source := source.lstrip():  # strip whitespace from string start
-        token, source = _next_token(source)
-        tokens.append(token)
-    return tokens
+_KEYWORD_TYPES: dict[str, TokenType] = {
+    "int": TokenType.INT_KEYWORD,
+    "void": TokenType.VOID_KEYWORD,
+    "return": TokenType.RETURN_KEYWORD,
+}
+
+_PUNCTUATOR_TYPES: dict[str, TokenType] = {
+    "(": TokenType.OPEN_PAREN,
+    ")": TokenType.CLOSE_PAREN,
+    "{": TokenType.OPEN_BRACE,
+    "}": TokenType.CLOSE_BRACE,
+    ";": TokenType.SEMICOLON,
+    "-": TokenType.MINUS,
+    "~": TokenType.TILDE,
+}
+
+_FIXED_TYPES: dict[str, TokenType] = _KEYWORD_TYPES | _PUNCTUATOR_TYPES
+
+# A token kind is the (small, positive) value of its type, as stored in a
+# `TokenBuffer`.
+_FIXED_KINDS: dict[str, int] = {
+    literal: token_type.value for literal, token_type in _FIXED_TYPES.items()
+}
+
+_TYPES_BY_KIND: dict[int, TokenType] = {t.value: t for t in TokenType}
+
+# Keyword and punctuator tokens never vary, so one instance of each is shared.
+_FIXED_TOKENS_BY_KIND: dict[int, Token] = {
+    token_type.value: Token(token_type, literal)
+    for literal, token_type in _FIXED_TYPES.items()
+}
+
+# The master pattern matches every position of the source, so `finditer` walks it in
+# a single pass without re-slicing. Alternatives are tried in order: "--" must
+# precede the single-character punctuators, a constant captures a trailing
+# identifier character so "1foo" can be reported, and anything else is illegal.
+# Letters and digits are ASCII only, as in C's basic source character set, so a
+# non-ASCII letter or digit is an illegal token rather than part of an identifier
+# or constant.
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<whitespace>\s+)
+    | (?P<constant>[0-9]+)(?P<constant_suffix>[A-Za-z_])?
+    | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<minus_minus>--)
+    | (?P<punctuator>[(){};~-])
+    | (?P<illegal>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+class TokenBuffer(Sequence[Token]):
+    """A compact token sequence, stored as parallel arrays over the lexed source.
+
+    Each token costs one byte for its type and eight for its start and end offsets.
+    `Token` values are only built on access: keywords and punctuators are shared
+    instances, and other literals are sliced from the source.
+    """
+
+    __slots__ = ("source", "kinds", "starts", "ends")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.kinds = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+
+    def __len__(self) -> int:
+        """Return the number of tokens."""
+        return len(self.kinds)
+
+    @overload
+    def __getitem__(self, idx: int) -> Token: ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> list[Token]: ...
+
+    def __getitem__(self, idx: int | slice) -> Token | list[Token]:
+        """Return the token at `idx`, or a list of tokens for a slice."""
+        if isinstance(idx, slice):
+            return [self._token(i) for i in range(len(self))[idx]]
+        if idx < 0:
+            idx += len(self)
+        return self._token(idx)
+
+    def __iter__(self) -> Iterator[Token]:
+        """Iterate over the tokens in order."""
+        source = self.source
+        fixed_token = _FIXED_TOKENS_BY_KIND.get
+        for kind, start, end in zip(self.kinds, self.starts, self.ends, strict=True):
+            token = fixed_token(kind)
+            yield token or Token(_TYPES_BY_KIND[kind], source[start:end])
+
+    def __repr__(self) -> str:
+        """Return a representation listing every token."""
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def _token(self, idx: int) -> Token:
+        kind = self.kinds[idx]
+        token = _FIXED_TOKENS_BY_KIND.get(kind)
+        return token or Token(_TYPES_BY_KIND[kind], self.literal_at(idx))
+
+    def type_at(self, idx: int) -> TokenType:
+        """Return the type of the token at `idx`."""
+        return _TYPES_BY_KIND[self.kinds[idx]]
+
+    def literal_at(self, idx: int) -> str:
+        """Return the literal of the token at `idx`."""
+        return self.source[self.starts[idx] : self.ends[idx]]
+
+
+def tokenize(source: str, ctx: CompilationContext | None = None) -> TokenBuffer:
+    """Perform lex step, returning a compact token buffer."""
+    buffer = TokenBuffer(source)
+    kinds = buffer.kinds.append
+    starts = buffer.starts.append
+    ends = buffer.ends.append
+    fixed_kind = _FIXED_KINDS.get
+    constant_kind = TokenType.CONSTANT.value
+    identifier_kind = TokenType.IDENTIFIER.value
+
+    for m in _TOKEN_PATTERN.finditer(source):
+        kind = m.lastgroup
+        if kind == "whitespace":
+            continue
+
+        literal = m.group()
+        token_kind = fixed_kind(literal)
+        if token_kind is None:
+            match kind:
+                case "constant":
+                    token_kind = constant_kind
+                case "identifier":
+                    token_kind = identifier_kind
+                case "constant_suffix":
+                    # TODO: better error message
+                    raise RuntimeError(f'TokenError: Illegal constant "{literal}..."')
+                case _:
+                    raise RuntimeError(f'TokenError: Illegal token "{literal}"')
+        start, end = m.span()
+        kinds(token_kind)
+        starts(start)
+        ends(end)
+
+    if ctx is not None:
+        ctx.stats["tokens"] += len(buffer)
+    return buffer
+
+
+def lex(source: str, ctx: CompilationContext | None = None) -> list[Token]:
+    """Perform lex step, returning a list of tokens."""
+    return list(tokenize(source, ctx))
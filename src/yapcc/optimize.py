@@ -0,0 +1,189 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Optimization passes over three-address code."""
+
+import contextlib
+from array import array
+from collections import Counter
+from collections.abc import Callable
+
+from yapcc.context import CompilationContext
+from yapcc.tac import (
+    Complement,
+    Constant,
+    Copy,
+    Function,
+    Instruction,
+    Negate,
+    Opcode,
+    PackedFunction,
+    Return,
+    Unary,
+    UnaryOperator,
+    Value,
+    Var,
+    reads,
+)
+
+
+def wrap_int32(value: int) -> int:
+    """Wrap an integer to the range of a 32-bit two's-complement int."""
+    return (value + 0x8000_0000) % 0x1_0000_0000 - 0x8000_0000
+
+
+# Folding functions take and return wrapped 32-bit values. Binary operators get a
+# table of their own, keyed the same way and taking two operands.
+_UNARY_FOLDS: dict[UnaryOperator, Callable[[int], int]] = {
+    Negate(): lambda v: wrap_int32(-v),
+    Complement(): lambda v: ~v,
+}
+
+
+def fold_constants(fn: Function, ctx: CompilationContext | None = None) -> Function:
+    """Evaluate instructions whose operands are all constants at compile time.
+
+    A folded instruction is removed and its destination temp is replaced by the
+    constant result in every later instruction. TAC temps are assigned exactly once,
+    so this is safe in a single forward pass.
+    """
+    known: dict[Var, Constant] = {}
+
+    def resolve(value: Value) -> Value:
+        if isinstance(value, Var):
+            return known.get(value, value)
+        return value
+
+    body: list[Instruction] = []
+    for instr in fn.body:
+        match instr:
+            case Unary(op, src, dest):
+                src = resolve(src)
+                if isinstance(src, Constant):
+                    fold = _UNARY_FOLDS[op]
+                    known[dest] = Constant(fold(wrap_int32(src.value)))
+                    continue
+                instr = Unary(op, src, dest)
+            case Copy(src, dest):
+                src = resolve(src)
+                if isinstance(src, Constant):
+                    known[dest] = src
+                    continue
+                instr = Copy(src, dest)
+            case Return(value):
+                instr = Return(resolve(value))
+        body.append(instr)
+
+    if ctx is not None:
+        ctx.stats["tac_folded"] += len(fn.body) - len(body)
+    return Function(fn.identifier, tuple(body))
+
+
+def propagate_copies(fn: Function, ctx: CompilationContext | None = None) -> Function:
+    """Replace every read of a copied temp with the value it was copied from.
+
+    The copies themselves are left in place for `eliminate_dead_code` to remove.
+    """
+    copies: dict[Var, Value] = {}
+
+    def resolve(value: Value) -> Value:
+        if isinstance(value, Var):
+            return copies.get(value, value)
+        return value
+
+    body: list[Instruction] = []
+    for instr in fn.body:
+        match instr:
+            case Copy(src, dest):
+                # resolving the source first collapses chains of copies
+                src = copies[dest] = resolve(src)
+                instr = Copy(src, dest)
+            case Unary(op, src, dest):
+                instr = Unary(op, resolve(src), dest)
+            case Return(value):
+                instr = Return(resolve(value))
+        body.append(instr)
+
+    return Function(fn.identifier, tuple(body))
+
+
+def eliminate_dead_code(
+    fn: Function, ctx: CompilationContext | None = None
+) -> Function:
+    """Remove unreachable instructions and instructions writing unread temps.
+
+    Nothing after the first `Return` can run, so it is dropped. Use counts for each
+    temp are then computed in one forward sweep, and one backward sweep removes
+    every instruction whose destination is never read. Removing an instruction
+    releases its own reads, and since temps are defined before they are used, the
+    backward sweep reaches the definitions those reads refer to afterwards, so
+    chains of dead temps are removed in the same sweep. The number of removed
+    instructions is recorded in `ctx`. `eliminate_dead_code_packed` does the same
+    over a packed function.
+    """
+    live: list[Instruction] = []
+    for instr in fn.body:
+        live.append(instr)
+        if isinstance(instr, Return):
+            break
+
+    uses: Counter[Var] = Counter()
+    for instr in live:
+        uses.update(value for value in reads(instr) if isinstance(value, Var))
+
+    body: list[Instruction] = []
+    for instr in reversed(live):
+        if isinstance(instr, Unary | Copy) and not uses[instr.dest]:
+            uses.subtract(value for value in reads(instr) if isinstance(value, Var))
+            continue
+        body.append(instr)
+    body.reverse()
+
+    if ctx is not None:
+        ctx.stats["tac_eliminated"] += len(fn.body) - len(body)
+    return Function(fn.identifier, tuple(body))
+
+
+def eliminate_dead_code_packed(fn: PackedFunction) -> PackedFunction:
+    """Remove unreachable instructions and instructions writing unread temps.
+
+    Nothing after the first `RETURN` can run, so it is dropped. Use counts for each
+    temp are then computed in one forward sweep over the operand arrays, and one
+    backward sweep removes every instruction whose destination is never read.
+    Removing an instruction releases its own read, and since temps are defined
+    before they are used, the backward sweep reaches the definitions those reads
+    refer to afterwards, so chains of dead temps are removed in the same sweep.
+    """
+    opcodes, srcs, dests = fn.opcodes, fn.srcs, fn.dests
+    end = len(opcodes)
+    with contextlib.suppress(ValueError):
+        end = opcodes.index(Opcode.RETURN) + 1
+
+    # operands below zero are constants, which have no use count
+    uses = array("l", bytes(array("l").itemsize * fn.temp_count))
+    for src in srcs[:end]:
+        if src >= 0:
+            uses[src] += 1
+
+    live: list[int] = []
+    for i in range(end - 1, -1, -1):
+        if opcodes[i] != Opcode.RETURN and not uses[dests[i]]:
+            if srcs[i] >= 0:
+                uses[srcs[i]] -= 1
+            continue
+        live.append(i)
+    live.reverse()
+    return fn.select(live)
@@ -16,21 +16,29 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Recursive descent parser logic."""
 
+from collections.abc import Sequence
 from dataclasses import dataclass
+from typing import Protocol, TypeVar
 
+from yapcc.context import CompilationContext
+from yapcc.interning import Singleton, SmallValueCached
 from yapcc.lex import Token, TokenType
 
 
 class Node:
     """Abstract AST node."""
 
+    __slots__ = ()
+
 
 class Expression(Node):
     """Abstract AST expression node."""
 
+    __slots__ = ()
+
 
-@dataclass
-class Constant(Expression):
+@dataclass(frozen=True, slots=True, init=False)
+class Constant(SmallValueCached, Expression):
     """AST constant expression node."""
 
     value: int
@@ -39,18 +47,20 @@ class Constant(Expression):
 class UnaryOperator(Node):
     """Abstract AST unary operator node."""
 
+    __slots__ = ()
+
 
-@dataclass
-class ComplementOperator(UnaryOperator):
+@dataclass(frozen=True, slots=True)
+class ComplementOperator(Singleton, UnaryOperator):
     """AST complement operator."""
 
 
-@dataclass
-class NegateOperator(UnaryOperator):
+@dataclass(frozen=True, slots=True)
+class NegateOperator(Singleton, UnaryOperator):
     """AST negate operator."""
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Unary(Expression):
     """AST unary expression node."""
 
@@ -61,15 +71,17 @@ class Unary(Expression):
 class Statement(Node):
     """Abstract AST statement node."""
 
+    __slots__ = ()
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Return(Statement):
     """AST return statement node."""
 
     exp: Expression
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Function(Node):
     """AST function node."""
 
@@ -77,94 +89,244 @@ class Function(Node):
     body: Statement
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Program(Node):
     """AST root node."""
 
     function_definition: Function
 
 
-def _peek(tokens: list[Token]) -> Token:
-    if tokens:
-        return tokens[0]
-    else:
-        raise RuntimeError("SyntaxError: unexpected end of input")
+def node_count(program: Program) -> int:
+    """Return the number of nodes in an AST, operators included."""
+    # an explicit stack, since expressions can nest deeper than the recursion limit;
+    # every node is a slotted dataclass, whose slots are its fields
+    count = 0
+    stack: list[Node] = [program]
+    while stack:
+        node = stack.pop()
+        count += 1
+        slots: tuple[str, ...] = node.__slots__
+        for name in slots:
+            child = getattr(node, name)
+            if isinstance(child, Node):
+                stack.append(child)
+    return count
 
 
-def _parse_unop(tokens: list[Token]) -> UnaryOperator:
-    if _consume(tokens).type == TokenType.TILDE:
-        return ComplementOperator()
-    else:
-        return NegateOperator()
+ExpT = TypeVar("ExpT")
+StmtT = TypeVar("StmtT")
+FnT = TypeVar("FnT")
+ProgT = TypeVar("ProgT")
+ProgT_co = TypeVar("ProgT_co", covariant=True)
 
 
-def _parse_exp(tokens: list[Token]) -> Expression:
-    next_token = _peek(tokens)
-    if next_token.type == TokenType.CONSTANT:
-        const_token = _consume(tokens)
-        value = int(const_token.literal)
-        return Constant(value)
-    elif next_token.type in [TokenType.TILDE, TokenType.MINUS]:
-        op = _parse_unop(tokens)
-        inner_exp = _parse_exp(tokens)
-        return Unary(op, inner_exp)
-    elif next_token.type == TokenType.OPEN_PAREN:
-        _consume(tokens)
-        inner_exp = _parse_exp(tokens)
-        _expect(TokenType.CLOSE_PAREN, tokens)
-        return inner_exp
-    else:
-        raise RuntimeError(
-            f'SyntaxError: Malformed expression "{tokens[0] + next_token}"'
-        )
+class Builder(Protocol[ExpT, StmtT, FnT, ProgT_co]):
+    """Constructs an AST representation as the parser recognizes each node.
 
+    Nodes are built bottom-up: every child is built before its parent.
+    """
 
-def _parse_statement(tokens: list[Token]) -> Statement:
-    _expect(TokenType.RETURN_KEYWORD, tokens)
-    return_val = _parse_exp(tokens)
-    _expect(TokenType.SEMICOLON, tokens)
-    return Return(exp=return_val)
+    def constant(self, value: int) -> ExpT:
+        """Build a constant expression."""
+        ...
 
+    def unary(self, op: UnaryOperator, exp: ExpT) -> ExpT:
+        """Build a unary expression."""
+        ...
 
-def _parse_function(tokens: list[Token]) -> Function:
-    _expect(TokenType.INT_KEYWORD, tokens)
-    ident_token = _expect(TokenType.IDENTIFIER, tokens)
-    name = ident_token.literal
-    _expect(TokenType.OPEN_PAREN, tokens)
-    _expect(TokenType.VOID_KEYWORD, tokens)
-    _expect(TokenType.CLOSE_PAREN, tokens)
-    _expect(TokenType.OPEN_BRACE, tokens)
-    body = _parse_statement(tokens)
-    _expect(TokenType.CLOSE_BRACE, tokens)
+    def return_(self, exp: ExpT) -> StmtT:
+        """Build a return statement."""
+        ...
 
-    return Function(name=name, body=body)
+    def function(self, name: str, body: StmtT) -> FnT:
+        """Build a function definition."""
+        ...
 
+    def program(self, function_definition: FnT) -> ProgT_co:
+        """Build the root node."""
+        ...
 
-def _consume(tokens: list[Token]) -> Token:
-    if tokens:
-        return tokens.pop(0)
-    else:
-        raise RuntimeError("Token list is empty.")
 
+class TreeBuilder:
+    """Builds the dataclass AST."""
 
-def _expect(expected: TokenType, tokens: list[Token]) -> Token:
-    if tokens:
-        actual = tokens.pop(0)
-        if actual.type != expected:
+    __slots__ = ()
+
+    def constant(self, value: int) -> Expression:
+        """Build a constant expression."""
+        return Constant(value)
+
+    def unary(self, op: UnaryOperator, exp: Expression) -> Expression:
+        """Build a unary expression."""
+        return Unary(op, exp)
+
+    def return_(self, exp: Expression) -> Statement:
+        """Build a return statement."""
+        return Return(exp=exp)
+
+    def function(self, name: str, body: Statement) -> Function:
+        """Build a function definition."""
+        return Function(name=name, body=body)
+
+    def program(self, function_definition: Function) -> Program:
+        """Build the root node."""
+        return Program(function_definition=function_definition)
+
+
+class TokenStream:
+    """A cursor over an immutable sequence of tokens.
+
+    The underlying sequence is never modified, so a token list can be parsed any
+    number of times, cached, or shared between threads. Each thread parsing the
+    same tokens needs its own stream.
+    """
+
+    __slots__ = ("_tokens", "_pos")
+
+    def __init__(self, tokens: Sequence[Token]) -> None:
+        self._tokens = tokens
+        self._pos = 0
+
+    def at_end(self) -> bool:
+        """Return whether all tokens have been consumed."""
+        return self._pos >= len(self._tokens)
+
+    def peek(self, k: int = 0) -> Token:
+        """Return the token `k` positions ahead without consuming it."""
+        idx = self._pos + k
+        if idx < len(self._tokens):
+            return self._tokens[idx]
+        else:
+            raise RuntimeError("SyntaxError: unexpected end of input")
+
+    def consume(self) -> Token:
+        """Consume and return the next token."""
+        if self._pos < len(self._tokens):
+            token = self._tokens[self._pos]
+            self._pos += 1
+            return token
+        else:
+            raise RuntimeError("SyntaxError: unexpected end of input")
+
+    def expect(self, expected: TokenType) -> Token:
+        """Consume and return the next token, which must be of type `expected`."""
+        if self._pos < len(self._tokens):
+            actual = self._tokens[self._pos]
+            if actual.type != expected:
+                raise RuntimeError(
+                    f'SyntaxError: expected {expected}, but found "{actual.literal}"'
+                )
+            self._pos += 1
+            return actual
+        else:
             raise RuntimeError(
-                f'SyntaxError: expected {expected}, but found "{actual.literal}"'
+                f"SyntaxError: expected {expected}, but found end of input"
             )
-    else:
-        raise RuntimeError(f"SyntaxError: expected {expected}, but found end of input")
-    return actual
-
 
-def parse(tokens: list[Token]) -> Program:
-    """Parse a list of tokens, returning an AST."""
-    ast = Program(function_definition=_parse_function(tokens))
-    if tokens:
+    def mark(self) -> int:
+        """Return the current position, for use with `reset`."""
+        return self._pos
+
+    def reset(self, mark: int) -> None:
+        """Rewind (or advance) the stream to a position returned by `mark`."""
+        self._pos = mark
+
+
+_UNARY_OPERATORS: dict[TokenType, type[UnaryOperator]] = {
+    TokenType.TILDE: ComplementOperator,
+    TokenType.MINUS: NegateOperator,
+}
+
+
+# Expressions are parsed without recursion, so nesting depth is limited only by
+# memory. Prefix operators and open parentheses are pushed onto an explicit stack
+# until an operand is read. The stack is then unwound in postfix position: each
+# operator wraps the expression built so far, and each open parenthesis must be
+# matched by a closing one. Binary operators belong in postfix position: unwind
+# every stacked operator that binds at least as tightly, push the binary operator,
+# and return to prefix position for its right operand.
+def _parse_exp(stream: TokenStream, build: Builder[ExpT, StmtT, FnT, ProgT]) -> ExpT:
+    # pending operators, innermost last; `None` marks an open parenthesis
+    pending: list[UnaryOperator | None] = []
+
+    # prefix position
+    while True:
+        token = stream.consume()
+        if token.type == TokenType.CONSTANT:
+            exp = build.constant(int(token.literal))
+            break
+        elif (op := _UNARY_OPERATORS.get(token.type)) is not None:
+            pending.append(op())
+        elif token.type == TokenType.OPEN_PAREN:
+            pending.append(None)
+        else:
+            raise RuntimeError(f'SyntaxError: Malformed expression "{token.literal}"')
+
+    # postfix position
+    while pending:
+        if (unop := pending.pop()) is None:
+            stream.expect(TokenType.CLOSE_PAREN)
+        else:
+            exp = build.unary(unop, exp)
+
+    return exp
+
+
+def _parse_statement(
+    stream: TokenStream, build: Builder[ExpT, StmtT, FnT, ProgT]
+) -> StmtT:
+    stream.expect(TokenType.RETURN_KEYWORD)
+    return_val = _parse_exp(stream, build)
+    stream.expect(TokenType.SEMICOLON)
+    return build.return_(return_val)
+
+
+def _parse_function(
+    stream: TokenStream, build: Builder[ExpT, StmtT, FnT, ProgT]
+) -> FnT:
+    stream.expect(TokenType.INT_KEYWORD)
+    ident_token = stream.expect(TokenType.IDENTIFIER)
+    name = ident_token.literal
+    stream.expect(TokenType.OPEN_PAREN)
+    stream.expect(TokenType.VOID_KEYWORD)
+    stream.expect(TokenType.CLOSE_PAREN)
+    stream.expect(TokenType.OPEN_BRACE)
+    body = _parse_statement(stream, build)
+    stream.expect(TokenType.CLOSE_BRACE)
+
+    return build.function(name, body)
+
+
+def parse_with(
+    tokens: Sequence[Token] | TokenStream, build: Builder[ExpT, StmtT, FnT, ProgT]
+) -> ProgT:
+    """Parse a sequence of tokens, building an AST with `build`.
+
+    The token sequence is not modified.
+    """
+    stream = tokens if isinstance(tokens, TokenStream) else TokenStream(tokens)
+    ast = build.program(_parse_function(stream, build))
+    if not stream.at_end():
         raise RuntimeError(
-            f'SyntaxError: expected end of input, but found "{tokens[0].literal}"'
+            f'SyntaxError: expected end of input, but found "{stream.peek().literal}"'
         )
 
     return ast
+
+
+_TREE_BUILDER = TreeBuilder()
+
+
+def parse(
+    tokens: Sequence[Token] | TokenStream, ctx: CompilationContext | None = None
+) -> Program:
+    """Parse a sequence of tokens, returning an AST.
+
+    The token sequence is not modified. If `ctx` has a profile, the number of AST
+    nodes is recorded in `ctx`.
+    """
+    ast = parse_with(tokens, _TREE_BUILDER)
+    if ctx is not None and ctx.profile is not None:
+        # counting nodes walks the tree, so only profiles do
+        ctx.stats["ast_nodes"] += node_count(ast)
+    return ast
@@ -0,0 +1,163 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Pass manager running optimization pipelines over TAC and assembly."""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Sequence
+from dataclasses import dataclass, field
+from typing import Generic, TypeVar
+
+from yapcc.codegen import Function as AsmFunction
+from yapcc.codegen import Program as AsmProgram
+from yapcc.codegen import codegen
+from yapcc.context import OPTIMIZATION_LEVELS, CompilationContext
+from yapcc.optimize import eliminate_dead_code, fold_constants, propagate_copies
+from yapcc.peephole import peephole
+from yapcc.profile import PassRecord, stage
+from yapcc.tac import Function as TACFunction
+from yapcc.tac import Program as TACProgram
+
+F = TypeVar("F", bound=Hashable)
+
+
+@dataclass(frozen=True, slots=True)
+class Pass(Generic[F]):
+    """A named transformation of a function."""
+
+    name: str
+    run: Callable[[F, CompilationContext], F]
+
+
+@dataclass(slots=True)
+class PassManager(Generic[F]):
+    """Run a declared list of passes over functions.
+
+    With `fixpoint` set, the whole list is repeated until a round leaves the
+    function unchanged, up to `max_iterations` rounds. A pass that returns its
+    input unchanged has converged on that function, and is skipped whenever it sees
+    an equal function again, including in later calls to `run`. Only the
+    `max_converged` most recently seen convergences are remembered. Each run of a
+    pass is recorded in the profile of the context, if any.
+    """
+
+    passes: Sequence[Pass[F]]
+    size: Callable[[F], int]
+    fixpoint: bool = False
+    max_iterations: int = 16
+    max_converged: int = 256
+    _converged: OrderedDict[tuple[str, F], None] = field(default_factory=OrderedDict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def run(self, fn: F, ctx: CompilationContext) -> F:
+        """Run the passes over `fn`, returning the transformed function."""
+        rounds = self.max_iterations if self.fixpoint else 1
+        for iteration in range(rounds):
+            start = fn
+            for pass_ in self.passes:
+                fn = self._run_pass(pass_, fn, ctx, iteration)
+            if fn == start:
+                break
+        return fn
+
+    def _run_pass(
+        self, pass_: Pass[F], fn: F, ctx: CompilationContext, iteration: int
+    ) -> F:
+        key = (pass_.name, fn)
+        with self._lock:
+            converged = key in self._converged
+            if converged:
+                self._converged.move_to_end(key)
+        if converged:
+            if ctx.profile is not None:
+                before = self.size(fn)
+                ctx.profile.passes.append(
+                    PassRecord(pass_.name, iteration, 0.0, before, before, skipped=True)
+                )
+            ctx.stats["passes_skipped"] += 1
+            return fn
+
+        started = time.perf_counter()
+        result = pass_.run(fn, ctx)
+        seconds = time.perf_counter() - started
+
+        if result == fn:
+            with self._lock:
+                self._converged[key] = None
+                while len(self._converged) > self.max_converged:
+                    self._converged.popitem(last=False)
+        if ctx.profile is not None:
+            ctx.profile.passes.append(
+                PassRecord(
+                    pass_.name, iteration, seconds, self.size(fn), self.size(result)
+                )
+            )
+        ctx.stats["passes_run"] += 1
+        return result
+
+
+_TAC_PASSES: tuple[Pass[TACFunction], ...] = (
+    Pass("fold_constants", fold_constants),
+    Pass("propagate_copies", propagate_copies),
+    Pass("eliminate_dead_code", eliminate_dead_code),
+)
+_ASM_PASSES: tuple[Pass[AsmFunction], ...] = (Pass("peephole", peephole),)
+
+
+@functools.cache
+def tac_pass_manager(level: int) -> PassManager[TACFunction]:
+    """Return the TAC pass pipeline for an optimization level.
+
+    `-O0` runs no passes, `-O1` runs each pass once, and `-O2` iterates them to a
+    fixpoint. Every compilation at a level shares one manager, so passes skip
+    functions they converged on in earlier compilations.
+    """
+    _check_level(level)
+    return PassManager(
+        _TAC_PASSES if level else (), lambda fn: len(fn.body), fixpoint=level >= 2
+    )
+
+
+@functools.cache
+def asm_pass_manager(level: int) -> PassManager[AsmFunction]:
+    """Return the assembly pass pipeline for an optimization level."""
+    _check_level(level)
+    return PassManager(
+        _ASM_PASSES if level else (),
+        lambda fn: len(fn.instructions),
+        fixpoint=level >= 2,
+    )
+
+
+def compile_tac(program: TACProgram, ctx: CompilationContext) -> AsmProgram:
+    """Optimize TAC at the level of `ctx`, then generate optimized assembly from it.
+
+    The optimize and codegen stages are timed in the profile of `ctx`, if any.
+    """
+    level = ctx.options.optimization_level
+    with stage(ctx.profile, "optimize"):
+        fn = tac_pass_manager(level).run(program.function_definition, ctx)
+    with stage(ctx.profile, "codegen"):
+        asm = codegen(TACProgram(fn), ctx)
+        return AsmProgram(asm_pass_manager(level).run(asm.function_definition, ctx))
+
+
+def _check_level(level: int) -> None:
+    if level not in OPTIMIZATION_LEVELS:
+        raise RuntimeError(f'OptionError: unknown optimization level "{level}"')
@@ -0,0 +1,182 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Peephole optimization over assembly instructions."""
+
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+
+from yapcc.codegen import (
+    R10,
+    Function,
+    Imm,
+    Instruction,
+    Mov,
+    Operand,
+    Register,
+    Stack,
+    Unary,
+    Xor,
+)
+from yapcc.context import CompilationContext
+
+
+@dataclass(frozen=True, slots=True)
+class Facts:
+    """Function-wide facts available to peephole patterns.
+
+    Facts are computed once, before rewriting, so they may become conservative as
+    rewrites remove instructions but are never wrong.
+    """
+
+    read_slots: frozenset[Stack]
+    """Stack slots read by some instruction other than an in-place update."""
+
+
+Rewrite = Callable[[Sequence[Instruction], Facts], list[Instruction] | None]
+
+
+@dataclass(frozen=True, slots=True)
+class Pattern:
+    """A peephole rewrite over a window of consecutive instructions.
+
+    `rewrite` receives exactly `size` instructions and returns their replacement,
+    or `None` if the pattern does not apply. A replacement must be no longer than
+    the window it replaces, and must not match the same pattern forever.
+    """
+
+    name: str
+    size: int
+    rewrite: Rewrite
+
+
+def _self_move(window: Sequence[Instruction], facts: Facts) -> list[Instruction] | None:
+    match window:
+        case [Mov(src, dest)] if src == dest:
+            return []
+    return None
+
+
+def _redundant_move_pair(
+    window: Sequence[Instruction], facts: Facts
+) -> list[Instruction] | None:
+    match window:
+        case [Mov(src, dest) as first, Mov(back_src, back_dest)] if (
+            back_src == dest and back_dest == src
+        ):
+            # the second mov copies back a value that is already there
+            return [first]
+    return None
+
+
+def _fold_immediate(
+    window: Sequence[Instruction], facts: Facts
+) -> list[Instruction] | None:
+    match window:
+        case [Mov(Imm() as imm, Register() as reg), Mov(src, dest)] if (
+            reg == R10 and src == R10
+        ):
+            # r10 is only ever a scratch register, dead after the second mov
+            return [Mov(imm, dest)]
+        case [
+            Mov(Imm() as imm, Stack() as slot) as store,
+            Mov(src, Register() as dest),
+        ] if src == slot:
+            # reload the immediate rather than the slot it was just stored to
+            return [store, Mov(imm, dest)]
+    return None
+
+
+def _zero_register(
+    window: Sequence[Instruction], facts: Facts
+) -> list[Instruction] | None:
+    match window:
+        case [Mov(Imm(0), Register() as dest)]:
+            return [Xor(dest, dest)]
+    return None
+
+
+def _dead_store(
+    window: Sequence[Instruction], facts: Facts
+) -> list[Instruction] | None:
+    match window:
+        case [Mov(dest=Stack() as slot) | Unary(operand=Stack() as slot)] if (
+            slot not in facts.read_slots
+        ):
+            return []
+    return None
+
+
+DEFAULT_PATTERNS: tuple[Pattern, ...] = (
+    Pattern("self_move", 1, _self_move),
+    Pattern("redundant_move_pair", 2, _redundant_move_pair),
+    Pattern("fold_immediate", 2, _fold_immediate),
+    Pattern("zero_register", 1, _zero_register),
+    Pattern("dead_store", 1, _dead_store),
+)
+
+
+def _reads(instr: Instruction) -> tuple[Operand, ...]:
+    match instr:
+        case Mov(src=src) | Xor(src=src):
+            return (src,)
+    return ()
+
+
+def peephole(
+    fn: Function,
+    ctx: CompilationContext | None = None,
+    patterns: Sequence[Pattern] = DEFAULT_PATTERNS,
+) -> Function:
+    """Rewrite a function's instructions with a table of peephole patterns.
+
+    Instructions are pushed one at a time onto an output list, and after each push
+    the patterns are matched, in order, against the instructions at its end. A
+    match replaces those instructions and matching resumes, so rewrites can
+    cascade into earlier output, but every instruction is only pushed once and
+    every replacement is no longer than its window, so the pass is linear. Hits
+    per pattern are recorded in `ctx` as `peephole_<name>`.
+    """
+    facts = Facts(
+        frozenset(
+            operand
+            for instr in fn.instructions
+            for operand in _reads(instr)
+            if isinstance(operand, Stack)
+        )
+    )
+
+    out: list[Instruction] = []
+    for instr in fn.instructions:
+        out.append(instr)
+        matched = True
+        while matched and out:
+            matched = False
+            for pattern in patterns:
+                if len(out) < pattern.size:
+                    continue
+                window = out[-pattern.size :]
+                replacement = pattern.rewrite(window, facts)
+                if replacement is None or replacement == window:
+                    continue
+                del out[-pattern.size :]
+                out.extend(replacement)
+                if ctx is not None:
+                    ctx.stats[f"peephole_{pattern.name}"] += 1
+                matched = True
+                break
+
+    return Function(fn.name, tuple(out), fn.stack_size)
@@ -0,0 +1,178 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Preprocessor step logic.
+
+Common sources are preprocessed in-process, skipping a `gcc -E` subprocess. The
+built-in preprocessor handles line splices, comments, object-like `#define` and
+`#undef`, and `#include "..."`. For anything else, such as conditionals, function-
+like macros or system headers, it falls back to gcc.
+"""
+
+import os
+import re
+import subprocess
+from collections.abc import Callable
+
+from yapcc.context import CompilationContext
+from yapcc.profile import span
+
+_MAX_INCLUDE_DEPTH = 200
+
+_SPLICE = re.compile(r"\\\n")
+# literals are matched so that comment markers inside them are left alone
+_COMMENT = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+    | (?P<literal>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    | (?P<unterminated>/\*|["'])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_DIRECTIVE = re.compile(r"[ \t\f\v]*#[ \t\f\v]*(?P<name>\w*)[ \t\f\v]*(?P<rest>.*)")
+_DEFINE = re.compile(r"(?P<name>[A-Za-z_]\w*)(?P<body>(?:[ \t\f\v].*)?)")
+_UNDEF = re.compile(r"(?P<name>[A-Za-z_]\w*)[ \t\f\v]*")
+_INCLUDE = re.compile(r'"(?P<path>[^"\n]+)"[ \t\f\v]*')
+# gcc's gnu modes predefine these outside the reserved namespace on the x86 targets
+# yapcc generates code for
+_GNU_PREDEFINED = frozenset({"unix", "linux", "i386"})
+_GNU_PREDEFINED_NAME = re.compile(r"\b(?:unix|linux|i386)\b")
+# pp-numbers are matched so that identifier-like suffixes are not expanded
+_PP_TOKEN = re.compile(
+    r"(?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)|(?P<identifier>[A-Za-z_]\w*)"
+)
+
+
+class _Unsupported(Exception):
+    """Raised when the built-in preprocessor cannot handle a source."""
+
+
+def _expand(text: str, macros: dict[str, str], hidden: frozenset[str]) -> str:
+    def replace(match: re.Match[str]) -> str:
+        name = match["identifier"]
+        if name is None or name in hidden:
+            return match[0]
+        body = macros.get(name)
+        if body is None:
+            # possibly one of gcc's predefined macros
+            if name.startswith("__") or name in _GNU_PREDEFINED:
+                raise _Unsupported(name)
+            return match[0]
+        # pad the expansion so it cannot paste onto the surrounding tokens
+        return f" {_expand(body, macros, hidden | {name})} "
+
+    return _PP_TOKEN.sub(replace, text)
+
+
+def _strip_comment(match: re.Match[str]) -> str:
+    if match["unterminated"]:
+        raise _Unsupported(match[0])
+    return " " if match["comment"] else match[0]
+
+
+def _preprocess(
+    source: str, directory: str, macros: dict[str, str], depth: int
+) -> list[str]:
+    if depth > _MAX_INCLUDE_DEPTH:
+        raise _Unsupported()
+    source = _SPLICE.sub("", source)
+    if "/" in source or '"' in source or "'" in source:
+        source = _COMMENT.sub(_strip_comment, source)
+
+    lines: list[str] = []
+    for line in source.splitlines():
+        directive = _DIRECTIVE.fullmatch(line)
+        if directive is None:
+            # macros must not be expanded inside string and character literals
+            if '"' in line or "'" in line:
+                raise _Unsupported(line)
+            if macros or "__" in line or _GNU_PREDEFINED_NAME.search(line):
+                line = _expand(line, macros, frozenset())
+            lines.append(line)
+            continue
+
+        name, rest = directive["name"], directive["rest"]
+        if name == "define" and (match := _DEFINE.fullmatch(rest)):
+            if "#" in match["body"]:
+                raise _Unsupported(line)
+            macros[match["name"]] = match["body"].strip()
+        elif name == "undef" and (match := _UNDEF.fullmatch(rest)):
+            macros.pop(match["name"], None)
+        elif name == "include" and (match := _INCLUDE.fullmatch(rest)):
+            path = os.path.join(directory, match["path"])
+            try:
+                with open(path, "r", encoding="ascii") as header:
+                    text = header.read()
+            except (OSError, UnicodeDecodeError) as e:
+                raise _Unsupported(path) from e
+            lines.extend(_preprocess(text, os.path.dirname(path), macros, depth + 1))
+        elif name or rest:
+            raise _Unsupported(line)
+    return lines
+
+
+def preprocess_builtin(source: str, directory: str = ".") -> str | None:
+    """Preprocess a source in-process, or return `None` if it is unsupported.
+
+    Quoted includes are resolved relative to `directory`.
+    """
+    try:
+        lines = _preprocess(source, directory, {}, 0)
+    except (_Unsupported, RecursionError):
+        return None
+    return "\n".join(lines) + "\n"
+
+
+def _preprocess_gcc(path: str, source: str | None) -> str:
+    if source is None:
+        args = ["gcc", "-E", "-P", path]
+    else:
+        # quoted includes still resolve relative to the source's directory
+        directory = os.path.dirname(path) or "."
+        args = ["gcc", "-E", "-P", "-iquote", directory, "-x", "c", "-"]
+    result = subprocess.run(
+        args, check=True, input=source, stdout=subprocess.PIPE, encoding="ascii"
+    )
+    return result.stdout
+
+
+def preprocess(
+    path: str,
+    ctx: CompilationContext | None = None,
+    fallback: Callable[[str, str | None], str] = _preprocess_gcc,
+    source: str | None = None,
+) -> str:
+    """Preprocess a source file, in-process if possible and with gcc otherwise.
+
+    The file is read from `path`, unless its contents are given as `source`. Which
+    preprocessor ran is recorded in `ctx` as `preprocess_builtin` or
+    `preprocess_fallback`.
+    """
+    text = source
+    if text is None:
+        with open(path, "r", encoding="ascii") as source_file:
+            text = source_file.read()
+
+    output = preprocess_builtin(text, os.path.dirname(path))
+    if output is None:
+        profile = None if ctx is None else ctx.profile
+        with span(profile, "gcc -E", "subprocess", {"file": path}):
+            output = fallback(path, source)
+        if ctx is not None:
+            ctx.stats["preprocess_fallback"] += 1
+    elif ctx is not None:
+        ctx.stats["preprocess_builtin"] += 1
+    return output
@@ -0,0 +1,280 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Per-stage wall time, CPU time and peak memory of compilations.
+
+Stages and subprocesses are also recorded as begin and end events in the Chrome
+trace-event format, which Perfetto and chrome://tracing display. This module is
+kept free of compiler stage imports, like `yapcc.jobs`, so that clients of a
+compile server can report the profiles it returns.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Iterator, Sequence
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+STAGES = (
+    "preprocess",
+    "lex",
+    "parse",
+    "ir",
+    "optimize",
+    "codegen",
+    "emit",
+    "assemble",
+    "link",
+)
+COUNTS = ("tokens", "ast_nodes", "tac_instructions", "temps", "asm_instructions")
+
+Event = dict[str, object]
+
+
+@dataclass(frozen=True, slots=True)
+class Timing:
+    """The cost of one stage, or of a stage summed over several compilations."""
+
+    wall: float = 0.0
+    """Elapsed seconds."""
+    cpu: float = 0.0
+    """CPU seconds, including those of subprocesses waited for."""
+    peak: int = 0
+    """Peak bytes allocated by Python above those allocated when the stage began."""
+
+    def __add__(self, other: "Timing") -> "Timing":
+        """Sum the times of two timings, keeping the larger peak."""
+        return Timing(
+            self.wall + other.wall, self.cpu + other.cpu, max(self.peak, other.peak)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class PassRecord:
+    """The timing and effect of one run of an optimization pass over a function."""
+
+    name: str
+    iteration: int
+    seconds: float
+    before: int
+    """Instruction count before the pass."""
+    after: int
+    """Instruction count after the pass."""
+    skipped: bool = False
+    """Whether the pass was skipped because it had converged on its input."""
+
+
+def _event(name: str, category: str, phase: str, args: Event | None) -> Event:
+    # the monotonic clock is shared by every process, so workers line up
+    ts = time.clock_gettime_ns(time.CLOCK_MONOTONIC) / 1000
+    event: Event = {
+        "name": name,
+        "cat": category,
+        "ph": phase,
+        "ts": ts,
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+    }
+    if args is not None:
+        event["args"] = args
+    return event
+
+
+def _cpu_time() -> float:
+    # os.times counts in clock ticks, too coarse for most stages
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+@dataclass(slots=True)
+class Profile:
+    """Stage timings and stats counts of one or more compilations.
+
+    Memory is traced with `tracemalloc`, which is process-wide and slows the
+    compiler down, so stages of concurrent compilations in one process should not
+    be profiled with `memory` set.
+    """
+
+    timings: dict[str, Timing] = field(default_factory=dict)
+    counts: Counter[str] = field(default_factory=Counter)
+    events: list[Event] = field(default_factory=list)
+    """Trace events of every stage and span, in the order they happened."""
+    passes: list[PassRecord] = field(default_factory=list)
+    """Every run of an optimization pass, in the order they happened."""
+    memory: bool = True
+    """Trace the peak memory of stages."""
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the body of the `with` statement as stage `name`."""
+        tracing = tracemalloc.is_tracing()
+        start = 0
+        if self.memory:
+            if tracing:
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+            start, _ = tracemalloc.get_traced_memory()
+        self.events.append(_event(name, "stage", "B", None))
+        wall, cpu = time.perf_counter(), _cpu_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, _cpu_time() - cpu
+            self.events.append(_event(name, "stage", "E", None))
+            peak = 0
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1] - start
+                if not tracing:
+                    tracemalloc.stop()
+            timing = Timing(wall, cpu, peak)
+            self.timings[name] = self.timings.get(name, Timing()) + timing
+
+    @contextlib.contextmanager
+    def span(
+        self, name: str, category: str, args: Event | None = None
+    ) -> Iterator[None]:
+        """Record the body of the `with` statement as a trace event, untimed."""
+        self.events.append(_event(name, category, "B", args))
+        try:
+            yield
+        finally:
+            self.events.append(_event(name, category, "E", None))
+
+    def update(self, other: "Profile") -> None:
+        """Add the timings and counts of another profile to this one."""
+        for name, timing in other.timings.items():
+            self.timings[name] = self.timings.get(name, Timing()) + timing
+        self.counts.update(other.counts)
+        self.events.extend(other.events)
+        self.passes.extend(other.passes)
+
+    def total(self) -> Timing:
+        """Return the timings of every stage summed."""
+        return sum(self.timings.values(), Timing())
+
+    def table(self) -> str:
+        """Format the profile as a human-readable table."""
+        lines = [f"{'stage':<22}{'wall (s)':>12}{'cpu (s)':>12}{'peak (KiB)':>12}"]
+        names = [name for name in STAGES if name in self.timings]
+        names += sorted(self.timings.keys() - set(STAGES))
+        rows = [(name, self.timings[name]) for name in names]
+        for name, t in [*rows, ("total", self.total())]:
+            lines.append(
+                f"{name:<22}{t.wall:>12.6f}{t.cpu:>12.6f}{t.peak / 1024:>12.1f}"
+            )
+        if self.passes:
+            lines.append(
+                f"{'pass':<22}{'runs':>12}{'skipped':>12}{'wall (s)':>12}"
+                f"{'removed':>12}"
+            )
+        for name, records in self._passes_by_name().items():
+            runs = sum(not r.skipped for r in records)
+            skipped = len(records) - runs
+            seconds = sum(r.seconds for r in records)
+            removed = sum(r.before - r.after for r in records)
+            lines.append(
+                f"{name:<22}{runs:>12}{skipped:>12}{seconds:>12.6f}{removed:>12}"
+            )
+        names = [name for name in COUNTS if name in self.counts]
+        names += sorted(self.counts.keys() - set(COUNTS))
+        lines.extend(f"{name:<22}{self.counts[name]:>12}" for name in names)
+        return "\n".join(lines) + "\n"
+
+    def _passes_by_name(self) -> dict[str, list[PassRecord]]:
+        by_name: dict[str, list[PassRecord]] = {}
+        for record in self.passes:
+            by_name.setdefault(record.name, []).append(record)
+        return by_name
+
+    def as_dict(self) -> dict[str, object]:
+        """Return the profile as a JSON-serializable dictionary."""
+        return {
+            "timings": {
+                name: {"wall": t.wall, "cpu": t.cpu, "peak": t.peak}
+                for name, t in self.timings.items()
+            },
+            "counts": dict(self.counts),
+            "events": self.events,
+            "passes": [asdict(record) for record in self.passes],
+        }
+
+    @classmethod
+    def from_dict(cls, fields: dict[str, Any]) -> "Profile":
+        """Rebuild a profile from the dictionary returned by `as_dict`."""
+        timings = {
+            name: Timing(t["wall"], t["cpu"], int(t["peak"]))
+            for name, t in fields["timings"].items()
+        }
+        passes = [PassRecord(**record) for record in fields["passes"]]
+        return cls(timings, Counter[str](fields["counts"]), fields["events"], passes)
+
+
+def stage(
+    profile: Profile | None, name: str
+) -> contextlib.AbstractContextManager[None]:
+    """Time a stage in `profile`, or do nothing without one."""
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.stage(name)
+
+
+def span(
+    profile: Profile | None, name: str, category: str, args: Event | None = None
+) -> contextlib.AbstractContextManager[None]:
+    """Record a span in `profile`, or do nothing without one."""
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.span(name, category, args)
+
+
+def _summary(profile: Profile) -> dict[str, object]:
+    # events are reported in a trace of their own
+    summary = profile.as_dict()
+    del summary["events"]
+    return summary
+
+
+def report_json(profiles: Sequence[tuple[str, Profile]], total: Profile) -> str:
+    """Format the profiles of files and their total as one JSON document."""
+    return json.dumps(
+        {
+            "files": [{"file": path, **_summary(p)} for path, p in profiles],
+            "total": _summary(total),
+        },
+        indent=2,
+    )
+
+
+def report_trace(events: Sequence[Event]) -> str:
+    """Format events as a Chrome trace, naming this process and the others."""
+    pids = sorted({event["pid"] for event in events} | {os.getpid()}, key=str)
+    names: list[Event] = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": pid,
+            "args": {"name": "yapcc" if pid == os.getpid() else "yapcc worker"},
+        }
+        for pid in pids
+    ]
+    return json.dumps({"traceEvents": [*names, *events], "displayTimeUnit": "ms"})
@@ -0,0 +1,89 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Linear-scan register allocation for TAC temps."""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import TypeVar
+
+from yapcc.tac import Copy, Function, Unary, Var, reads
+
+R = TypeVar("R")
+
+
+@dataclass(frozen=True, slots=True)
+class Interval:
+    """The live interval of a temp: from its definition to its last read.
+
+    Positions are instruction indexes in the function body.
+    """
+
+    temp: Var
+    start: int
+    end: int
+
+
+def live_intervals(fn: Function) -> list[Interval]:
+    """Return the live interval of every temp, ordered by start position."""
+    starts: dict[Var, int] = {}
+    ends: dict[Var, int] = {}
+    for idx, instr in enumerate(fn.body):
+        for value in reads(instr):
+            if isinstance(value, Var):
+                ends[value] = idx
+        if isinstance(instr, Unary | Copy):
+            starts.setdefault(instr.dest, idx)
+            ends.setdefault(instr.dest, idx)
+
+    # a temp read before any definition (e.g. a parameter) is live from the start
+    return sorted(
+        (Interval(temp, starts.get(temp, -1), end) for temp, end in ends.items()),
+        key=lambda interval: interval.start,
+    )
+
+
+def linear_scan(fn: Function, registers: Sequence[R]) -> dict[Var, R | None]:
+    """Assign each temp a register, or `None` to spill it to the stack.
+
+    Intervals are visited in order of their start. Registers of intervals that have
+    ended are freed first, so a temp last read by the instruction that defines
+    another temp can share its register. When every register is taken, the
+    interval ending last, among the active ones and the new one, is spilled.
+    """
+    assignment: dict[Var, R | None] = {}
+    free = list(reversed(registers))
+    # active intervals and their registers, kept sorted by end position
+    active: list[tuple[Interval, R]] = []
+
+    for interval in live_intervals(fn):
+        while active and active[0][0].end <= interval.start:
+            free.append(active.pop(0)[1])
+
+        if free:
+            register = free.pop()
+        elif active and active[-1][0].end > interval.end:
+            spilled, register = active.pop()
+            assignment[spilled.temp] = None
+        else:
+            assignment[interval.temp] = None
+            continue
+
+        assignment[interval.temp] = register
+        active.append((interval, register))
+        active.sort(key=lambda entry: entry[0].end)
+
+    return assignment
@@ -0,0 +1,149 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compile server keeping warm worker processes behind a Unix domain socket.
+
+Each connection sends jobs as lines of JSON and closes its write side, then reads
+one result per job, in order. Jobs are compiled by a pool of worker processes that
+have already imported the compiler, so a request pays neither interpreter startup
+nor imports.
+"""
+
+import contextlib
+import io
+import os
+import signal
+import socket
+import socketserver
+import stat
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import replace
+from types import TracebackType
+from typing import Self
+
+from yapcc.driver import compile_job
+from yapcc.jobs import Result, dump_result, load_job, write_output
+
+
+def _init_worker() -> None:
+    # interrupts are handled by the server, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _warm() -> None:
+    pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "CompileServer"
+
+    def handle(self) -> None:
+        """Compile every job sent on the connection, then send their results."""
+        futures: list[Future[Result]] = []
+        for line in self.rfile:
+            try:
+                # the server never writes files on behalf of a client, including
+                # cache entries in a directory of its choosing
+                job = replace(
+                    load_job(line.decode("utf-8")),
+                    capture=True,
+                    output_path=None,
+                    save_temps=False,
+                    cache=None,
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                failed: Future[Result] = Future()
+                failed.set_result(Result("", error=f"RequestError: {e}"))
+                futures.append(failed)
+                continue
+            futures.append(self.server.pool.submit(compile_job, job))
+
+        for future in futures:
+            result = future.result()
+            if result.dumps_path is not None:
+                # a result is one line, so the dumps of one job are read at a time
+                with io.StringIO() as output:
+                    write_output(result, output)
+                    result = replace(result, output=output.getvalue(), dumps_path=None)
+            self.wfile.write(dump_result(result).encode("utf-8") + b"\n")
+
+
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    """A compile server listening on a Unix domain socket."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workers: int) -> None:
+        _remove_stale_socket(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.socket_path = socket_path
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        # start the workers now, rather than on the first requests
+        for future in [self.pool.submit(_warm) for _ in range(workers)]:
+            future.result()
+
+    def server_bind(self) -> None:
+        """Bind the socket, readable and writable only by its owner."""
+        # created under the umask, so the socket is never open to other users
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self) -> None:
+        """Stop the workers and remove the socket."""
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.socket_path)
+
+    def __enter__(self) -> Self:
+        """Return the server."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the server."""
+        self.server_close()
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f'ServerError: "{socket_path}" exists and is not a socket')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            # left behind by a server that did not shut down cleanly
+            os.remove(socket_path)
+            return
+    raise RuntimeError(f'ServerError: a server is already listening on "{socket_path}"')
+
+
+def serve(socket_path: str, workers: int) -> None:
+    """Serve compile requests on `socket_path` until interrupted."""
+    with CompileServer(socket_path, workers) as server:
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
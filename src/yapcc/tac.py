@@ -16,8 +16,14 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Three-address code (TAC) intermediate representation logic."""
 
+from array import array
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
+from enum import IntEnum
 
+from yapcc.arena import FlatAST, NodeKind
+from yapcc.context import CompilationContext
+from yapcc.interning import Singleton, SmallValueCached
 from yapcc.parse import ComplementOperator as ASTComplementOperator
 from yapcc.parse import Constant as ASTConstant
 from yapcc.parse import Expression as ASTExpression
@@ -33,19 +39,23 @@ from yapcc.parse import UnaryOperator as ASTUnaryOperator
 class Node:
     """Abstract TAC node."""
 
+    __slots__ = ()
+
 
 class Value(Node):
     """Abstract TAC value node."""
 
+    __slots__ = ()
+
 
-@dataclass
-class Constant(Value):
+@dataclass(frozen=True, slots=True, init=False)
+class Constant(SmallValueCached, Value):
     """TAC constant value node."""
 
     value: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Var(Value):
     """TAC constant var node."""
 
@@ -55,29 +65,33 @@ class Var(Value):
 class UnaryOperator(Node):
     """Abstract TAC unary operator node."""
 
+    __slots__ = ()
+
 
-@dataclass
-class Complement(UnaryOperator):
+@dataclass(frozen=True, slots=True)
+class Complement(Singleton, UnaryOperator):
     """TAC complement operator node."""
 
 
-@dataclass
-class Negate(UnaryOperator):
+@dataclass(frozen=True, slots=True)
+class Negate(Singleton, UnaryOperator):
     """TAC negation operator node."""
 
 
 class Instruction(Node):
     """Abstract TAC instruction node."""
 
+    __slots__ = ()
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Return(Instruction):
     """TAC return instruction node."""
 
     value: Value
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Unary(Instruction):
     """TAC unary instruction node."""
 
@@ -86,29 +100,197 @@ class Unary(Instruction):
     dest: Var
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class Copy(Instruction):
+    """TAC copy instruction node."""
+
+    src: Value
+    dest: Var
+
+
+@dataclass(frozen=True, slots=True)
 class Function(Node):
     """TAC function node."""
 
     identifier: str
-    body: list[Instruction]
+    body: tuple[Instruction, ...]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Program(Node):
     """TAC root node."""
 
     function_definition: Function
 
 
-var_count = 0
-
-
-def _create_var_name() -> str:
-    global var_count
-    name = "tmp_" + str(var_count)
-    var_count += 1
-    return name
+def reads(instr: Instruction) -> tuple[Value, ...]:
+    """Return the values `instr` reads."""
+    match instr:
+        case Unary(src=src) | Copy(src=src):
+            return (src,)
+        case Return(value):
+            return (value,)
+    raise RuntimeError(f'Unsupported TAC instruction "{type(instr).__name__}"')
+
+
+class Opcode(IntEnum):
+    """A packed TAC opcode."""
+
+    RETURN = 1
+    NEGATE = 2
+    COMPLEMENT = 3
+    COPY = 4
+
+
+_UNARY_OPCODES: dict[UnaryOperator, Opcode] = {
+    Negate(): Opcode.NEGATE,
+    Complement(): Opcode.COMPLEMENT,
+}
+
+_OPCODE_OPERATORS: dict[int, UnaryOperator] = {
+    opcode: op for op, opcode in _UNARY_OPCODES.items()
+}
+
+
+class PackedFunction:
+    """A TAC function stored as a dense instruction stream.
+
+    Instruction `i` has opcode `opcodes[i]`, a source operand `srcs[i]` and a
+    destination operand `dests[i]` (unused, and zero, for `RETURN`). An operand is
+    either a temp ID (`>= 0`) or an index into the constant pool, encoded as
+    `-(index + 1)`. Temp names are only kept for debug output: temps without an
+    entry in `temp_names` are named `tmp_<id>`.
+    """
+
+    __slots__ = (
+        "identifier",
+        "opcodes",
+        "srcs",
+        "dests",
+        "constants",
+        "temp_names",
+        "temp_count",
+        "_constant_operands",
+    )
+
+    def __init__(self, identifier: str) -> None:
+        self.identifier = identifier
+        self.opcodes = array("B")
+        self.srcs = array("q")
+        self.dests = array("q")
+        self.constants: list[int] = []
+        self.temp_names: dict[int, str] = {}
+        self.temp_count = 0
+        self._constant_operands: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        """Return the number of instructions."""
+        return len(self.opcodes)
+
+    def constant(self, value: int) -> int:
+        """Return the operand for a constant, adding it to the pool if needed."""
+        operand = self._constant_operands.get(value)
+        if operand is None:
+            self.constants.append(value)
+            operand = self._constant_operands[value] = -len(self.constants)
+        return operand
+
+    def temp(self, name: str | None = None) -> int:
+        """Return the operand for a new temp, optionally recording its name."""
+        temp = self.temp_count
+        self.temp_count += 1
+        if name is not None:
+            self.temp_names[temp] = name
+        return temp
+
+    def append(self, opcode: Opcode, src: int, dest: int = 0) -> None:
+        """Append an instruction."""
+        self.opcodes.append(opcode)
+        self.srcs.append(src)
+        self.dests.append(dest)
+
+    def select(self, indices: Iterable[int]) -> "PackedFunction":
+        """Return a function of the instructions at `indices`, with the same pools."""
+        indices = list(indices)
+        fn = PackedFunction(self.identifier)
+        fn.opcodes = array("B", [self.opcodes[i] for i in indices])
+        fn.srcs = array("q", [self.srcs[i] for i in indices])
+        fn.dests = array("q", [self.dests[i] for i in indices])
+        fn.constants = list(self.constants)
+        fn.temp_names = dict(self.temp_names)
+        fn.temp_count = self.temp_count
+        fn._constant_operands = dict(self._constant_operands)
+        return fn
+
+    def value(self, operand: int) -> Value:
+        """Return the object form of an operand."""
+        if operand < 0:
+            return Constant(self.constants[-operand - 1])
+        return self.var(operand)
+
+    def var(self, temp: int) -> Var:
+        """Return the object form of a temp."""
+        return Var(self.temp_names.get(temp) or f"tmp_{temp}")
+
+    def instructions(self) -> Iterator[Instruction]:
+        """Iterate over the object form of each instruction."""
+        for opcode, src, dest in zip(self.opcodes, self.srcs, self.dests, strict=True):
+            if opcode == Opcode.RETURN:
+                yield Return(self.value(src))
+            elif opcode == Opcode.COPY:
+                yield Copy(self.value(src), self.var(dest))
+            else:
+                yield Unary(_OPCODE_OPERATORS[opcode], self.value(src), self.var(dest))
+
+    def view(self) -> Function:
+        """Return the object form of the function."""
+        return Function(self.identifier, tuple(self.instructions()))
+
+
+def pack(fn: Function) -> PackedFunction:
+    """Encode a TAC function as a dense instruction stream."""
+    packed = PackedFunction(fn.identifier)
+    temps: dict[Var, int] = {}
+    constant = packed.constant
+    opcodes: list[int] = []
+    srcs: list[int] = []
+    dests: list[int] = []
+
+    def operand(value: Value) -> int:
+        if isinstance(value, Var):
+            temp = temps.get(value)
+            if temp is None:
+                temp = temps[value] = packed.temp(value.value)
+            return temp
+        if isinstance(value, Constant):
+            return constant(value.value)
+        raise RuntimeError(f'Unsupported TAC value "{type(value).__name__}"')
+
+    # dispatch on the exact type, since this runs once per instruction of every
+    # function a packed pass sees
+    for instr in fn.body:
+        instr_type = type(instr)
+        if instr_type is Unary:
+            assert isinstance(instr, Unary)
+            opcodes.append(_UNARY_OPCODES[instr.op])
+            srcs.append(operand(instr.src))
+            dests.append(operand(instr.dest))
+        elif instr_type is Copy:
+            assert isinstance(instr, Copy)
+            opcodes.append(Opcode.COPY)
+            srcs.append(operand(instr.src))
+            dests.append(operand(instr.dest))
+        elif instr_type is Return:
+            assert isinstance(instr, Return)
+            opcodes.append(Opcode.RETURN)
+            srcs.append(operand(instr.value))
+            dests.append(0)
+        else:
+            raise RuntimeError(f'Unsupported TAC instruction "{instr_type.__name__}"')
+    packed.opcodes = array("B", opcodes)
+    packed.srcs = array("q", srcs)
+    packed.dests = array("q", dests)
+    return packed
 
 
 def _transform_unop(op: ASTUnaryOperator) -> UnaryOperator:
@@ -120,40 +302,124 @@ def _transform_unop(op: ASTUnaryOperator) -> UnaryOperator:
     raise RuntimeError("Failed to transform AST unary operator")
 
 
-def _transform_ast_expression(exp: ASTExpression, instr: list[Instruction]) -> Value:
+def _transform_ast_expression(
+    exp: ASTExpression, instr: list[Instruction], ctx: CompilationContext
+) -> Value:
+    # Walk the expression in post-order with an explicit stack rather than
+    # recursion: descend to the innermost operand, stacking operators on the way
+    # down, then emit one instruction per operator on the way back up.
+    pending: list[ASTUnaryOperator] = []
+    while isinstance(exp, ASTUnary):
+        pending.append(exp.op)
+        exp = exp.exp
+
     match exp:
         case ASTConstant(v):
-            return Constant(v)
-        case ASTUnary(op=op, exp=inner):
-            src = _transform_ast_expression(inner, instr)
-            dst_name = _create_var_name()
-            dst = Var(dst_name)
-            tac_op = _transform_unop(op)
-            instr.append(Unary(tac_op, src, dst))
-            return dst
+            value: Value = Constant(v)
         case _:
             raise RuntimeError("Failed to transform AST expression")
 
+    while pending:
+        dst = Var(ctx.make_temp_name())
+        instr.append(Unary(_transform_unop(pending.pop()), value, dst))
+        value = dst
+
+    return value
+
 
-def _transform_ast_statement(stat: ASTStatement) -> list[Instruction]:
+def _transform_ast_statement(
+    stat: ASTStatement, ctx: CompilationContext
+) -> list[Instruction]:
     instr: list[Instruction] = []
     match stat:
         case ASTReturn(exp=exp):
-            value = _transform_ast_expression(exp, instr)
+            value = _transform_ast_expression(exp, instr, ctx)
             instr.append(Return(value))
         case _:
             raise RuntimeError("Failed to transform AST statement")
     return instr
 
 
-def _transform_ast_function(fn: ASTFunction) -> Function:
-    return Function(fn.name, _transform_ast_statement(fn.body))
-
-
-def _transform_ast_program(ast: ASTProgram) -> Program:
-    return Program(_transform_ast_function(ast.function_definition))
-
-
-def ir(ast: ASTProgram) -> Program:
-    """Accept an AST and return an intermediate three-address code representation."""
-    return _transform_ast_program(ast)
+def _transform_ast_function(fn: ASTFunction, ctx: CompilationContext) -> Function:
+    return Function(fn.name, tuple(_transform_ast_statement(fn.body, ctx)))
+
+
+def _transform_ast_program(ast: ASTProgram, ctx: CompilationContext) -> Program:
+    return Program(_transform_ast_function(ast.function_definition, ctx))
+
+
+_FLAT_UNARY_OPCODES: dict[int, Opcode] = {
+    NodeKind.NEGATE: Opcode.NEGATE,
+    NodeKind.COMPLEMENT: Opcode.COMPLEMENT,
+}
+
+
+def _transform_flat_ast(flat: FlatAST, ctx: CompilationContext) -> PackedFunction:
+    # children precede parents, so one forward pass lowers every operand before
+    # the node that uses it; operands are dropped as soon as their parent uses them
+    operands: dict[int, int] = {}
+    fn = PackedFunction("")
+    nodes = zip(flat.kinds, flat.values, flat.children, strict=True)
+    for idx, (kind, value, child) in enumerate(nodes):
+        match kind:
+            case NodeKind.CONSTANT:
+                operands[idx] = fn.constant(value)
+            case NodeKind.NEGATE | NodeKind.COMPLEMENT:
+                dest = operands[idx] = fn.temp()
+                fn.append(_FLAT_UNARY_OPCODES[kind], operands.pop(child), dest)
+            case NodeKind.RETURN:
+                fn.append(Opcode.RETURN, operands.pop(child))
+            case NodeKind.FUNCTION:
+                fn.identifier = flat.names[value]
+            case NodeKind.PROGRAM:
+                pass
+            case _:
+                raise RuntimeError("Failed to transform flat AST node")
+
+    # temps are named through the context, continuing its numbering; in a fresh
+    # context every name is tmp_<id>, which the packed form derives from the ID, so
+    # names are only recorded when the context has named temps before
+    renamed = ctx.temp_count != 0
+    for temp in range(fn.temp_count):
+        name = ctx.make_temp_name()
+        if renamed:
+            fn.temp_names[temp] = name
+    return fn
+
+
+def ir_packed(
+    ast: ASTProgram | FlatAST, ctx: CompilationContext | None = None
+) -> PackedFunction:
+    """Accept an AST and return its (single) function as packed three-address code.
+
+    A flat AST is lowered directly, without creating TAC objects. Temps are named
+    through `ctx`; without one, a fresh context is used.
+    """
+    if ctx is None:
+        ctx = CompilationContext()
+    first_temp = ctx.temp_count
+    if isinstance(ast, FlatAST):
+        fn = _transform_flat_ast(ast, ctx)
+    else:
+        fn = pack(_transform_ast_program(ast, ctx).function_definition)
+    ctx.stats["tac_instructions"] += len(fn)
+    ctx.stats["temps"] += ctx.temp_count - first_temp
+    return fn
+
+
+def ir(ast: ASTProgram | FlatAST, ctx: CompilationContext | None = None) -> Program:
+    """Accept an AST and return an intermediate three-address code representation.
+
+    The AST may be either the dataclass tree or a flat AST. Temps are named through
+    `ctx`; without one, a fresh context is used.
+    """
+    if ctx is None:
+        ctx = CompilationContext()
+    first_temp = ctx.temp_count
+    if isinstance(ast, FlatAST):
+        program = Program(_transform_flat_ast(ast, ctx).view())
+    else:
+        program = _transform_ast_program(ast, ctx)
+    ctx.stats["tac_instructions"] += len(program.function_definition.body)
+    ctx.stats["temps"] += ctx.temp_count - first_temp
+    return program
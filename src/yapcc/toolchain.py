@@ -0,0 +1,113 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Assembler and linker invocation."""
+
+import contextlib
+import io
+import os
+import subprocess
+from collections.abc import Callable, Sequence
+from typing import TextIO
+
+from yapcc.jobs import Job
+from yapcc.profile import Profile, span, stage
+
+Writer = Callable[[TextIO], None]
+
+
+def text_writer(text: str) -> Writer:
+    """Return a writer writing `text`."""
+
+    def write(out: TextIO) -> None:
+        out.write(text)
+
+    return write
+
+
+def remove(*paths: str) -> None:
+    """Remove files, ignoring those that do not exist."""
+    for path in paths:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def assemble(write: Writer, object_path: str, profile: Profile | None = None) -> None:
+    """Assemble what `write` writes, streaming it to `as` on stdin."""
+    command = ["as", "-o", object_path]
+    with (
+        span(profile, "as", "subprocess", {"argv": command}),
+        subprocess.Popen(command, stdin=subprocess.PIPE) as assembler,
+    ):
+        assert assembler.stdin is not None
+        stdin = io.TextIOWrapper(assembler.stdin, encoding="ascii")
+        with stage(profile, "emit"):
+            try:
+                write(stdin)
+                stdin.close()
+            except BrokenPipeError:
+                # the assembler exited early, and its status is reported below
+                pass
+        with stage(profile, "assemble"):
+            assembler.wait()
+    if assembler.returncode:
+        raise subprocess.CalledProcessError(assembler.returncode, assembler.args)
+
+
+def link(
+    inputs: Sequence[str], output_path: str, profile: Profile | None = None
+) -> None:
+    """Link assembly or object files into an executable with one gcc call."""
+    command = ["gcc", *inputs, "-o", output_path]
+    with span(profile, "gcc", "subprocess", {"argv": command}):
+        subprocess.run(command, check=True)
+
+
+def link_input(job: Job) -> str:
+    """Return the file `deliver` leaves for the job's assembly to be linked from."""
+    if job.pipe or (job.save_temps and job.output_path is not None):
+        return job.object_path
+    return job.assembly_path
+
+
+def deliver(job: Job, write: Writer, profile: Profile | None = None) -> None:
+    """Write a job's assembly, then assemble and link it as the job requests.
+
+    With `pipe` set, the assembly is streamed to the assembler and never written
+    to disk. Intermediate files are removed after linking unless `save_temps` is
+    set. Writing, assembling and linking are timed in `profile`, if given.
+    """
+    needs_object = link_input(job) == job.object_path
+    if job.pipe and not job.save_temps:
+        assemble(write, job.object_path, profile)
+    else:
+        with stage(profile, "emit"):
+            with open(job.assembly_path, "w", encoding="ascii") as outfile:
+                write(outfile)
+        if needs_object:
+            command = ["as", "-o", job.object_path, job.assembly_path]
+            with (
+                stage(profile, "assemble"),
+                span(profile, "as", "subprocess", {"argv": command}),
+            ):
+                subprocess.run(command, check=True)
+
+    if job.output_path is None:
+        return
+    with stage(profile, "link"):
+        link([link_input(job)], job.output_path, profile)
+    if not job.save_temps:
+        remove(link_input(job))
@@ -0,0 +1,187 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compile API tests for yapcc."""
+
+from pathlib import Path
+
+import pytest
+import yapcc
+from yapcc.api import MemoryCache, compile_source, default_cache
+from yapcc.codegen import Program as AsmProgram
+from yapcc.context import Options
+from yapcc.driver import compile_job
+from yapcc.jobs import Job, Stage
+from yapcc.lex import TokenBuffer
+from yapcc.parse import Program as ASTProgram
+from yapcc.profile import Profile
+from yapcc.tac import Program as TACProgram
+
+SOURCE = "int main(void) { return -~2; }"
+
+
+class TestCompileSource:
+    @pytest.mark.parametrize(
+        ("stage", "expected"),
+        [
+            (Stage.LEX, TokenBuffer),
+            (Stage.PARSE, ASTProgram),
+            (Stage.TACKY, TACProgram),
+            (Stage.CODEGEN, AsmProgram),
+            (Stage.ASSEMBLY, str),
+        ],
+    )
+    def test_stages(self, stage: Stage, expected: type) -> None:
+        """Return the result of the requested stage."""
+        actual = compile_source(SOURCE, stage, cache=MemoryCache())
+
+        assert isinstance(actual, expected)
+
+    def test_assembly(self) -> None:
+        """Return assembly text by default."""
+        actual = compile_source(SOURCE, cache=MemoryCache())
+
+        assert "\tmovl\t$3, %eax\n" in actual
+
+    def test_profile(self) -> None:
+        """Time and count only the stages run, not those found in the cache."""
+        cache = MemoryCache()
+        compile_source(SOURCE, Stage.TACKY, cache=cache)
+        profile = Profile()
+
+        compile_source(SOURCE, cache=cache, profile=profile)
+
+        assert list(profile.timings) == ["preprocess", "optimize", "codegen", "emit"]
+        assert profile.counts["asm_instructions"] > 0
+        assert "tokens" not in profile.counts
+
+    def test_share_stages(self) -> None:
+        """Reuse results of earlier stages cached by another request."""
+        cache = MemoryCache()
+        tac = compile_source(SOURCE, Stage.TACKY, cache=cache)
+        assert (cache.hits, cache.misses) == (0, 3)
+
+        compile_source(SOURCE, cache=cache)
+
+        assert (cache.hits, cache.misses) == (1, 5)
+        assert compile_source(SOURCE, Stage.TACKY, cache=cache) is tac
+
+    def test_share_across_options(self) -> None:
+        """Share results of stages that do not depend on the options."""
+        cache = MemoryCache()
+        optimized = compile_source(SOURCE, cache=cache)
+
+        unoptimized = compile_source(
+            SOURCE, options=Options(optimization_level=0), cache=cache
+        )
+
+        assert unoptimized != optimized
+        assert cache.hits == 1
+
+    def test_unoptimized_stack_slots(self) -> None:
+        """Keep temps in stack slots at -O0, as the command line does."""
+        actual = compile_source(
+            SOURCE, options=Options(optimization_level=0), cache=MemoryCache()
+        )
+
+        assert "-4(%rbp)" in actual
+        assert "%ecx" not in actual
+
+    @pytest.mark.parametrize("level", [0, 1, 2])
+    def test_matches_driver(self, level: int, tmp_path: Path) -> None:
+        """Generate the same assembly as the driver at every level."""
+        options = Options(optimization_level=level)
+        job = Job(str(tmp_path / "a.c"), options=options, source=SOURCE, capture=True)
+
+        actual = compile_source(SOURCE, options=options, cache=MemoryCache())
+
+        assert actual == compile_job(job).assembly
+
+    def test_evict(self) -> None:
+        """Evict the least recently used results beyond the size bound."""
+        cache = MemoryCache(maxsize=2)
+
+        compile_source(SOURCE, Stage.TACKY, cache=cache)
+
+        assert len(cache) == 2
+        assert cache.evictions == 1
+        compile_source(SOURCE, Stage.LEX, cache=cache)
+        assert cache.misses == 4
+
+    def test_clear(self) -> None:
+        """Remove every result and reset the counters."""
+        cache = MemoryCache()
+        compile_source(SOURCE, cache=cache)
+
+        cache.clear()
+
+        assert len(cache) == 0
+        assert (cache.hits, cache.misses, cache.evictions) == (0, 0, 0)
+
+    def test_default_cache(self) -> None:
+        """Memoize in the default cache unless given another."""
+        default_cache().clear()
+
+        first = yapcc.compile_source(SOURCE)
+        second = yapcc.compile_source(SOURCE)
+
+        assert first is second
+        assert default_cache().hits == 1
+
+    def test_header_edit(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Recompile a source whose included header changed."""
+        monkeypatch.chdir(tmp_path)
+        text = '#include "value.h"\nint main(void) { return VALUE; }\n'
+        cache = MemoryCache()
+        (tmp_path / "value.h").write_text("#define VALUE 1\n")
+        first = compile_source(text, cache=cache)
+
+        (tmp_path / "value.h").write_text("#define VALUE 2\n")
+        second = compile_source(text, cache=cache)
+
+        assert "\tmovl\t$1, %eax\n" in first
+        assert "\tmovl\t$2, %eax\n" in second
+
+    def test_chdir(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Resolve includes in the current directory, not where first compiled."""
+        text = '#include "value.h"\nint main(void) { return VALUE; }\n'
+        cache = MemoryCache()
+        for value in (1, 2):
+            (tmp_path / str(value)).mkdir()
+            (tmp_path / str(value) / "value.h").write_text(f"#define VALUE {value}\n")
+
+        monkeypatch.chdir(tmp_path / "1")
+        first = compile_source(text, cache=cache)
+        monkeypatch.chdir(tmp_path / "2")
+        second = compile_source(text, cache=cache)
+
+        assert "\tmovl\t$1, %eax\n" in first
+        assert "\tmovl\t$2, %eax\n" in second
+
+    def test_needs_gcc(self) -> None:
+        """Refuse sources that need the gcc preprocessor."""
+        with pytest.raises(RuntimeError, match="PreprocessError"):
+            compile_source("#if 1\n#endif\n", cache=MemoryCache())
+
+    def test_error_not_cached(self) -> None:
+        """Raise errors every time, without caching them."""
+        cache = MemoryCache()
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError, match="SyntaxError"):
+                compile_source("int main(void) { return }", cache=cache)
+
+        assert len(cache) == 1
@@ -0,0 +1,116 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Flat AST tests for yapcc."""
+
+import os
+import subprocess
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from yapcc import tac
+from yapcc.arena import NodeKind, from_tree, parse_flat, to_tree
+from yapcc.lex import Token, lex
+from yapcc.parse import parse
+
+LexedFixture = Callable[[str], list[Token]]
+
+
+@pytest.fixture()
+def lexed(tmp_path: str) -> Callable[[str], list[Token]]:
+    def _lexed(input_path: str) -> list[Token]:
+        dirname = os.path.dirname(__file__)
+        input_path = os.path.join(dirname, input_path)
+        preprocess_path = os.path.join(tmp_path, Path(input_path).stem) + ".i"
+        subprocess.run(
+            ["gcc", "-E", "-P", input_path, "-o", preprocess_path], check=True
+        )
+        with open(preprocess_path, "r", encoding="ascii") as preprocess_file:
+            preprocessed = preprocess_file.read()
+            return lex(preprocessed)
+
+    return _lexed
+
+
+class TestArena:
+    def test_valid_nested_exp(self, lexed: LexedFixture) -> None:
+        """Build a flat AST with children stored before their parents."""
+        tokens = lexed("input/valid/nested_exp.c")
+
+        actual = parse_flat(tokens)
+
+        assert list(actual.kinds) == [
+            NodeKind.CONSTANT,
+            NodeKind.NEGATE,
+            NodeKind.COMPLEMENT,
+            NodeKind.RETURN,
+            NodeKind.FUNCTION,
+            NodeKind.PROGRAM,
+        ]
+        assert list(actual.children) == [-1, 0, 1, 2, 3, 4]
+        assert actual.values[0] == 1
+        assert actual.names[actual.values[4]] == "main"
+        assert actual.root == 5
+
+    @pytest.mark.parametrize(
+        "input_path",
+        [
+            "input/valid/multi_digit.c",
+            "input/valid/negate.c",
+            "input/valid/complement.c",
+            "input/valid/nested_exp.c",
+        ],
+    )
+    def test_convert(self, lexed: LexedFixture, input_path: str) -> None:
+        """Convert between flat and dataclass ASTs without loss."""
+        tokens = lexed(input_path)
+        flat = parse_flat(tokens)
+        tree = parse(tokens)
+
+        assert to_tree(flat) == tree
+        converted = from_tree(tree)
+        assert converted.kinds == flat.kinds
+        assert converted.values == flat.values
+        assert converted.children == flat.children
+        assert converted.names == flat.names
+
+    def test_ir(self, lexed: LexedFixture) -> None:
+        """Lower a flat AST to the same TAC as the dataclass AST."""
+        tokens = lexed("input/valid/nested_exp.c")
+
+        assert tac.ir(parse_flat(tokens)) == tac.ir(parse(tokens))
+
+    def test_valid_deep_nesting(self) -> None:
+        """Build and lower very deeply nested expressions."""
+        depth = 100_000
+        tokens = lex(
+            "int main(void) { return " + "-~(" * depth + "1" + ")" * depth + "; }"
+        )
+
+        flat = parse_flat(tokens)
+
+        assert len(flat) == 2 * depth + 4
+        assert len(tac.ir(flat).function_definition.body) == 2 * depth + 1
+
+    def test_invalid(self, lexed: LexedFixture) -> None:
+        """Raise the same errors as the dataclass parser."""
+        tokens = lexed("input/invalid_parse/unclosed_paren.c")
+        with pytest.raises(
+            RuntimeError,
+            match='SyntaxError: expected TokenType.CLOSE_PAREN, but found "{"',
+        ):
+            parse_flat(tokens)
@@ -0,0 +1,195 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compile cache tests for yapcc."""
+
+import errno
+import hashlib
+import os
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+from yapcc.cache import DiskCache, cache_key
+from yapcc.context import CompilationContext, Options
+from yapcc.driver import compile_job
+from yapcc.jobs import Job
+
+
+def _key(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+class TestCacheKey:
+    def test_source_and_options(self) -> None:
+        """Key entries by the preprocessed source and the options."""
+        source = "int main(void) { return 2; }"
+
+        key = cache_key(source, Options())
+
+        assert key == cache_key(source, Options())
+        assert key != cache_key(source + " ", Options())
+        assert key != cache_key(source, Options(optimization_level=2))
+
+
+class TestDiskCache:
+    def test_round_trip(self, tmp_path: Path) -> None:
+        """Return what was put, and record hits and misses."""
+        cache = DiskCache(str(tmp_path / "cache"))
+        ctx = CompilationContext()
+
+        assert cache.get(_key("a"), ctx) is None
+        cache.put(_key("a"), "\tret\n", ctx)
+
+        assert cache.get(_key("a"), ctx) == "\tret\n"
+        assert ctx.stats["cache_misses"] == 1
+        assert ctx.stats["cache_hits"] == 1
+        assert cache.usage() == (1, 5)
+
+    def test_evict_least_recently_used(self, tmp_path: Path) -> None:
+        """Evict the least recently used entries to stay within the budget."""
+        cache = DiskCache(str(tmp_path), max_bytes=20)
+        ctx = CompilationContext()
+        for i, key in enumerate([_key("a"), _key("b")]):
+            cache.put(key, "x" * 10)
+            os.utime(tmp_path / f"{key}.s", (i, i))
+        # reading an entry makes it the most recently used
+        assert cache.get(_key("a")) is not None
+
+        cache.put(_key("c"), "x" * 10, ctx)
+
+        assert cache.get(_key("b")) is None
+        assert cache.get(_key("a")) is not None
+        assert cache.get(_key("c")) is not None
+        assert ctx.stats["cache_evictions"] == 1
+
+    def test_concurrent(self, tmp_path: Path) -> None:
+        """Leave only complete entries when written concurrently."""
+        cache = DiskCache(str(tmp_path))
+
+        def put(i: int) -> None:
+            cache.put(_key(f"k{i % 4}"), str(i % 4) * 4096)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(put, range(64)))
+
+        assert sorted(os.listdir(tmp_path)) == sorted(
+            f"{_key(f'k{i}')}.s" for i in range(4)
+        )
+        for i in range(4):
+            assert cache.get(_key(f"k{i}")) == str(i) * 4096
+
+    def test_clear(self, tmp_path: Path) -> None:
+        """Remove every entry."""
+        cache = DiskCache(str(tmp_path))
+        cache.put(_key("a"), "x")
+
+        cache.clear()
+
+        assert cache.usage() == (0, 0)
+
+    def test_foreign_files(self, tmp_path: Path) -> None:
+        """Leave files that are not entries alone when evicting and clearing."""
+        cache = DiskCache(str(tmp_path), max_bytes=10)
+        (tmp_path / "main.s").write_text("x" * 100)
+        cache.put(_key("a"), "x" * 10)
+
+        assert cache.usage() == (1, 10)
+        cache.clear()
+
+        assert cache.usage() == (0, 0)
+        assert (tmp_path / "main.s").read_text() == "x" * 100
+
+    def test_shared_permissions(self, tmp_path: Path) -> None:
+        """Create entries readable by other users, as the umask allows."""
+        cache = DiskCache(str(tmp_path))
+        umask = os.umask(0o022)
+        try:
+            cache.put(_key("a"), "x")
+        finally:
+            os.umask(umask)
+
+        assert stat.S_IMODE(os.stat(tmp_path / f"{_key('a')}.s").st_mode) == 0o644
+
+    def test_unreadable(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Count an entry that cannot be read as a miss."""
+        cache = DiskCache(str(tmp_path))
+        ctx = CompilationContext()
+        cache.put(_key("a"), "x")
+
+        def fail(*args: object) -> None:
+            raise PermissionError(errno.EACCES, "Permission denied")
+
+        monkeypatch.setattr(os, "utime", fail)
+
+        assert cache.get(_key("a"), ctx) is None
+        assert ctx.stats["cache_misses"] == 1
+
+    def test_unwritable(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Skip storing an entry when the directory cannot be written to."""
+        cache = DiskCache(str(tmp_path))
+
+        def fail(*args: object, **kwargs: object) -> None:
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        monkeypatch.setattr(tempfile, "mkstemp", fail)
+        cache.put(_key("a"), "x")
+        monkeypatch.undo()
+        monkeypatch.setattr(os, "replace", fail)
+        cache.put(_key("b"), "x")
+
+        assert os.listdir(tmp_path) == []
+
+
+class TestCompileJob:
+    def test_reuse(self, tmp_path: Path) -> None:
+        """Reuse assembly compiled for the same source and options."""
+        cache = DiskCache(str(tmp_path / "cache"))
+        source = "int main(void) { return ~-3; }"
+        first = Job(str(tmp_path / "a.c"), source=source, capture=True, cache=cache)
+        second = Job(str(tmp_path / "b.c"), source=source, capture=True, cache=cache)
+        other = Job(
+            str(tmp_path / "a.c"),
+            options=Options(optimization_level=0),
+            source=source,
+            capture=True,
+            cache=cache,
+        )
+
+        results = [compile_job(job) for job in [first, second, other]]
+
+        assert [result.stats["cache_hits"] for result in results] == [0, 1, 0]
+        assert results[0].assembly == results[1].assembly
+        assert results[1].stats["tokens"] == 0
+        assert results[2].assembly != results[0].assembly
+
+    def test_cache_error(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Compile as usual when the cache cannot be used."""
+        cache = DiskCache(str(tmp_path / "cache"))
+        job = Job(str(tmp_path / "a.c"), source="int main(void) { return 2; }")
+
+        def fail(*args: object, **kwargs: object) -> None:
+            raise PermissionError(errno.EACCES, "Permission denied")
+
+        monkeypatch.setattr(os, "makedirs", fail)
+        result = compile_job(replace(job, capture=True, cache=cache))
+
+        assert result.error is None
+        assert result.assembly is not None
+        assert "\tmovl\t$2, %eax\n" in result.assembly
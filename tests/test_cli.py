@@ -0,0 +1,225 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""CLI tests for yapcc."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from yapcc.cli import main
+
+
+def _main(monkeypatch: pytest.MonkeyPatch, *args: str) -> int:
+    monkeypatch.setattr(sys, "argv", ["yapcc", *args])
+    try:
+        main()
+    except SystemExit as e:
+        return int(e.code or 0)
+    return 0
+
+
+def _write_sources(tmp_path: Path, count: int) -> list[str]:
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"f{i}.c"
+        path.write_text(f"int main(void) {{ return {i}; }}")
+        paths.append(str(path))
+    return paths
+
+
+class TestBatch:
+    def test_ordered(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Report results in the order the files were given."""
+        paths = _write_sources(tmp_path, 6)
+
+        status = _main(
+            monkeypatch,
+            "-j",
+            "2",
+            "--lex",
+            "--dump=tokens",
+            "--dump-format=json",
+            *paths,
+        )
+
+        assert status == 0
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        constants = [r for r in records if r["type"] == "CONSTANT"]
+        assert [r["literal"] for r in constants] == ["0", "1", "2", "3", "4", "5"]
+        assert [r["file"] for r in constants] == paths
+
+    def test_error_isolation(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Compile every other file when one of them fails."""
+        paths = _write_sources(tmp_path, 4)
+        Path(paths[1]).write_text("int main(void) { return 1 }")
+
+        status = _main(monkeypatch, "-j", "2", "-S", *paths)
+
+        assert status == 1
+        err = capsys.readouterr().err
+        assert err.count("yapcc:") == 1
+        assert "f1.c" in err
+        assert sorted(p.name for p in tmp_path.glob("*.s")) == [
+            "f0.s",
+            "f2.s",
+            "f3.s",
+        ]
+
+    def test_link_one_output(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Link every translation unit into one executable."""
+        main_path = tmp_path / "main.c"
+        main_path.write_text("int main(void) { return 7; }")
+        output_path = tmp_path / "out"
+
+        status = _main(monkeypatch, "-j", "2", "-o", str(output_path), str(main_path))
+
+        assert status == 0
+        assert subprocess.run([output_path], check=False).returncode == 7
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["main.c", "out"]
+
+
+class TestClient:
+    def test_no_server(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Report a missing server as an error, not a traceback."""
+        paths = _write_sources(tmp_path, 1)
+        socket_path = str(tmp_path / "missing.sock")
+
+        status = _main(monkeypatch, "--client", "--socket", socket_path, "-S", *paths)
+
+        assert status == 1
+        err = capsys.readouterr().err
+        assert err.startswith("yapcc: ServerError: no server listening")
+        assert "Traceback" not in err
+
+    def test_cache_rejected(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Reject a cache directory, which a server would ignore."""
+        paths = _write_sources(tmp_path, 1)
+        cache_dir = str(tmp_path / "cache")
+
+        status = _main(monkeypatch, "--client", "--cache-dir", cache_dir, *paths)
+
+        assert status == 2
+        assert "cannot be combined with --client" in capsys.readouterr().err
+
+    def test_cache_from_environment(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """Ignore the default cache directory, rather than reject it."""
+        paths = _write_sources(tmp_path, 1)
+        monkeypatch.setenv("YAPCC_CACHE_DIR", str(tmp_path / "cache"))
+        socket_path = str(tmp_path / "missing.sock")
+
+        status = _main(monkeypatch, "--client", "--socket", socket_path, "-S", *paths)
+
+        assert status == 1
+        assert not (tmp_path / "cache").exists()
+
+
+class TestProfile:
+    def test_time_passes(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        """Report the total of every file as a table on stderr."""
+        paths = _write_sources(tmp_path, 2)
+
+        status = _main(monkeypatch, "--time-passes", "-S", *paths)
+
+        assert status == 0
+        rows = {
+            line.split()[0]: line.split()[1:]
+            for line in capsys.readouterr().err.splitlines()
+        }
+        assert rows["stage"] == ["wall", "(s)", "cpu", "(s)", "peak", "(KiB)"]
+        assert len(rows["parse"]) == 3
+        assert rows["tokens"] == ["20"]
+
+    def test_stats(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Write the profile of every file, and their total with the link, as JSON."""
+        paths = _write_sources(tmp_path, 1)
+        stats_path = tmp_path / "stats.json"
+        output_path = str(tmp_path / "out")
+
+        status = _main(
+            monkeypatch, "--stats", str(stats_path), "-o", output_path, *paths
+        )
+
+        assert status == 0
+        report = json.loads(stats_path.read_text())
+        assert [f["file"] for f in report["files"]] == paths
+        assert "link" not in report["files"][0]["timings"]
+        assert "link" in report["total"]["timings"]
+        assert report["total"]["counts"]["tokens"] == 10
+        passes = [record["name"] for record in report["files"][0]["passes"]]
+        assert passes == [
+            "fold_constants",
+            "propagate_copies",
+            "eliminate_dead_code",
+            "peephole",
+        ]
+
+    def test_trace(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Trace every file, stage and subprocess of a parallel build."""
+        paths = _write_sources(tmp_path, 2)
+        trace_path = tmp_path / "trace.json"
+        output_path = str(tmp_path / "out")
+        Path(paths[1]).write_text("int helper(void) { return 1; }")
+
+        status = _main(
+            monkeypatch,
+            "-j",
+            "2",
+            "--trace",
+            str(trace_path),
+            "-o",
+            output_path,
+            *paths,
+        )
+
+        assert status == 0
+        events = json.loads(trace_path.read_text())["traceEvents"]
+        files = [e for e in events if e.get("cat") == "file" and e["ph"] == "B"]
+        assert sorted(e["name"] for e in files) == paths
+        links = [e for e in events if e["name"] == "gcc" and e["ph"] == "B"]
+        assert [e["args"]["argv"][-1] for e in links] == [output_path]
+        assert all(e["pid"] != links[0]["pid"] for e in files)
@@ -16,23 +16,43 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Code generation tests for yapcc."""
 
+import io
 import os
 import subprocess
 from pathlib import Path
 from typing import Callable
 
 import pytest
-from yapcc.codegen import codegen, emit
+from yapcc.codegen import (
+    AX,
+    CX,
+    R10,
+    Function,
+    Imm,
+    Mov,
+    Neg,
+    Not,
+    Program,
+    Ret,
+    Stack,
+    Unary,
+    Xor,
+    codegen,
+    emit,
+)
+from yapcc.context import CompilationContext, Options
 from yapcc.lex import lex
-from yapcc.parse import Program as ASTProgram
 from yapcc.parse import parse
+from yapcc.tac import Program as TACProgram
+from yapcc.tac import ir
 
-ParseFixture = Callable[[str], ASTProgram]
+LoweredFixture = Callable[[str], TACProgram]
+RunFixture = Callable[[str], int]
 
 
 @pytest.fixture()
-def parsed(tmp_path: str) -> Callable[[str], ASTProgram]:
-    def _parsed(input_path: str) -> ASTProgram:
+def lowered(tmp_path: str) -> Callable[[str], TACProgram]:
+    def _lowered(input_path: str) -> TACProgram:
         dirname = os.path.dirname(__file__)
         input_path = os.path.join(dirname, input_path)
         preprocess_path = os.path.join(tmp_path, Path(input_path).stem) + ".i"
@@ -42,15 +62,28 @@ def parsed(tmp_path: str) -> Callable[[str], ASTProgram]:
         with open(preprocess_path, "r", encoding="ascii") as preprocess_file:
             preprocessed = preprocess_file.read()
         tokens = lex(preprocessed)
-        return parse(tokens)
+        return ir(parse(tokens))
 
-    return _parsed
+    return _lowered
+
+
+@pytest.fixture()
+def run(tmp_path: str) -> Callable[[str], int]:
+    def _run(assembly: str) -> int:
+        assembly_path = os.path.join(tmp_path, "out.s")
+        output_path = os.path.join(tmp_path, "out")
+        with open(assembly_path, "w", encoding="ascii") as assembly_file:
+            assembly_file.write(assembly)
+        subprocess.run(["gcc", assembly_path, "-o", output_path], check=True)
+        return subprocess.run([output_path], check=False).returncode
+
+    return _run
 
 
 class TestLex:
-    def test_valid(self, parsed: ParseFixture) -> None:
+    def test_valid(self, lowered: LoweredFixture) -> None:
         """Return generated assembly with multi-digit constants."""
-        ast = parsed("input/valid/multi_digit.c")
+        tac = lowered("input/valid/multi_digit.c")
         expected = (
             "\t.globl main\n"
             "main:\n"
@@ -59,6 +92,102 @@ class TestLex:
             '\t.section\t.note.GNU-stack, "",@progbits\n'
         )
 
-        actual = emit(codegen(ast))
+        actual = emit(codegen(tac))
 
         assert actual == expected
+
+    def test_stream(self, lowered: LoweredFixture) -> None:
+        """Write the same assembly to a stream, in chunks, as is returned."""
+        tac = lowered("input/valid/nested_exp.c")
+        fn = codegen(tac).function_definition
+        program = Program(Function("main", fn.instructions[:-1] * 1000 + (Ret(),)))
+        writes: list[str] = []
+
+        class Recorder(io.StringIO):
+            def write(self, s: str) -> int:
+                writes.append(s)
+                return super().write(s)
+
+        with Recorder() as out:
+            result = emit(program, out)
+            actual = out.getvalue()
+
+        assert result is None
+        assert actual == emit(program)
+        assert len(writes) > 1
+
+    def test_valid_zero(self, lowered: LoweredFixture) -> None:
+        """Zero the return register with xor."""
+        tac = lowered("input/valid/return_0.c")
+
+        actual = codegen(tac).function_definition
+
+        assert actual.instructions == (Xor(AX, AX), Ret())
+        assert actual.stack_size == 0
+
+    def test_valid_nested_exp(self, lowered: LoweredFixture) -> None:
+        """Lower unary instructions through stack slots."""
+        tac = lowered("input/valid/nested_exp.c")
+        ctx = CompilationContext(Options(register_allocation=False))
+
+        actual = codegen(tac, ctx).function_definition
+
+        assert actual == Function(
+            "main",
+            (
+                Mov(Imm(1), Stack(-4)),
+                Unary(Neg(), Stack(-4)),
+                Mov(Stack(-4), R10),
+                Mov(R10, Stack(-8)),
+                Unary(Not(), Stack(-8)),
+                Mov(Stack(-8), AX),
+                Ret(),
+            ),
+            16,
+        )
+
+    def test_valid_nested_exp_registers(self, lowered: LoweredFixture) -> None:
+        """Keep temps in one register when their live intervals do not overlap."""
+        tac = lowered("input/valid/nested_exp.c")
+        ctx = CompilationContext()
+
+        actual = codegen(tac, ctx).function_definition
+
+        assert actual == Function(
+            "main",
+            (
+                Mov(Imm(1), CX),
+                Unary(Neg(), CX),
+                Mov(CX, CX),
+                Unary(Not(), CX),
+                Mov(CX, AX),
+                Ret(),
+            ),
+        )
+        assert ctx.stats["spilled_temps"] == 0
+
+    @pytest.mark.parametrize(
+        ("input_path", "expected"),
+        [
+            ("input/valid/return_0.c", 0),
+            ("input/valid/return_2.c", 2),
+            ("input/valid/multi_digit.c", 100),
+            ("input/valid/negate.c", 255),
+            ("input/valid/complement.c", 254),
+            ("input/valid/nested_exp.c", 0),
+        ],
+    )
+    @pytest.mark.parametrize("register_allocation", [True, False])
+    def test_run(
+        self,
+        lowered: LoweredFixture,
+        run: RunFixture,
+        input_path: str,
+        expected: int,
+        register_allocation: bool,
+    ) -> None:
+        """Return the expected exit status from the assembled program."""
+        tac = lowered(input_path)
+        ctx = CompilationContext(Options(register_allocation=register_allocation))
+
+        assert run(emit(codegen(tac, ctx))) == expected
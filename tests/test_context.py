@@ -0,0 +1,83 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compilation context tests for yapcc."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from yapcc.codegen import codegen, emit
+from yapcc.context import CompilationContext, Options
+from yapcc.lex import tokenize
+from yapcc.parse import parse
+from yapcc.tac import Program, Unary, Var, ir
+
+
+def _compile(source: str) -> tuple[Program, CompilationContext]:
+    ctx = CompilationContext()
+    return ir(parse(tokenize(source, ctx)), ctx), ctx
+
+
+def _assemble(source: str) -> str:
+    ctx = CompilationContext()
+    return emit(codegen(ir(parse(tokenize(source, ctx)), ctx), ctx))
+
+
+class TestContext:
+    def test_temp_names(self) -> None:
+        """Name temps from zero in every compilation."""
+        source = "int main(void) { return -~-1; }"
+
+        first, _ = _compile(source)
+        second, _ = _compile(source)
+
+        assert first == second
+        dests = [
+            instr.dest
+            for instr in first.function_definition.body
+            if isinstance(instr, Unary)
+        ]
+        assert dests == [Var("tmp_0"), Var("tmp_1"), Var("tmp_2")]
+
+    def test_stats(self) -> None:
+        """Record per-compilation statistics."""
+        _, ctx = _compile("int main(void) { return ~(-2); }")
+
+        assert ctx.stats["tokens"] == 14
+        assert ctx.stats["tac_instructions"] == 3
+        assert ctx.stats["temps"] == 2
+        assert ctx.temp_count == 2
+
+    def test_concurrent(self) -> None:
+        """Compile many units concurrently with deterministic output."""
+        sources = [
+            "int main(void) { return " + "-~" * n + f"{n}; }}" for n in range(64)
+        ]
+        expected = [_assemble(source) for source in sources]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            actual = list(pool.map(_assemble, sources))
+
+        assert actual == expected
+
+
+class TestOptions:
+    def test_register_allocation(self) -> None:
+        """Allocate registers by default above -O0 only, unless chosen."""
+        assert Options(optimization_level=0).register_allocation is False
+        assert Options(optimization_level=1).register_allocation is True
+        assert Options(optimization_level=2).register_allocation is True
+        assert Options(0, register_allocation=True).register_allocation is True
+        assert Options(2, register_allocation=False).register_allocation is False
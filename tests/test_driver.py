@@ -0,0 +1,199 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compiler driver tests for yapcc."""
+
+import io
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import cast
+
+import pytest
+from yapcc.driver import compile_job
+from yapcc.jobs import DUMPS, Job, Stage, write_output
+
+
+def _write(tmp_path: Path, name: str, source: str) -> str:
+    path = tmp_path / name
+    path.write_text(source)
+    return str(path)
+
+
+class TestCompileJob:
+    def test_link(self, tmp_path: Path) -> None:
+        """Compile and link a translation unit, removing its assembly."""
+        path = _write(tmp_path, "a.c", "int main(void) { return ~-3; }")
+        output_path = str(tmp_path / "a")
+
+        result = compile_job(Job(path, output_path=output_path))
+
+        assert result.error is None
+        assert result.stats["tokens"] == 12
+        assert not os.path.exists(tmp_path / "a.s")
+        assert subprocess.run([output_path], check=False).returncode == 2
+
+    def test_assembly(self, tmp_path: Path) -> None:
+        """Keep the assembly when the job has no output path."""
+        path = _write(tmp_path, "a.c", "int main(void) { return 0; }")
+
+        result = compile_job(Job(path))
+
+        assert result.error is None
+        assert "\tret\n" in (tmp_path / "a.s").read_text()
+
+    @pytest.mark.parametrize(
+        ("stop_after", "dumps"),
+        [(Stage.LEX, 1), (Stage.PARSE, 2), (Stage.TACKY, 3), (Stage.CODEGEN, 4)],
+    )
+    def test_stop_after(self, tmp_path: Path, stop_after: Stage, dumps: int) -> None:
+        """Stop after the requested stage without writing assembly."""
+        path = _write(tmp_path, "a.c", "int main(void) { return 0; }")
+
+        result = compile_job(Job(path, stop_after, dumps=DUMPS))
+
+        assert result.error is None
+        assert result.output == ""
+        assert result.dumps_path is not None
+        with io.StringIO() as out:
+            write_output(result, out)
+            output = out.getvalue()
+        headers = [line for line in output.splitlines() if line[0] == "#"]
+        assert headers == [f"# {dump} {path}" for dump in DUMPS[:dumps]]
+        assert not os.path.exists(result.dumps_path)
+        assert not os.path.exists(tmp_path / "a.s")
+
+    def test_no_dumps(self, tmp_path: Path) -> None:
+        """Dump nothing unless requested."""
+        path = _write(tmp_path, "a.c", "int main(void) { return 0; }")
+
+        result = compile_job(Job(path, Stage.CODEGEN))
+
+        assert result.output == ""
+        assert result.dumps_path is None
+
+    def test_dump_stream(self, tmp_path: Path) -> None:
+        """Write dumps to a stream as newline-delimited JSON."""
+        path = _write(tmp_path, "a.c", "int main(void) { return ~1; }")
+        job = Job(path, Stage.TACKY, dumps=("tac",), dump_format="json")
+
+        with io.StringIO() as out:
+            result = compile_job(job, out)
+            lines = out.getvalue().splitlines()
+
+        assert result.dumps_path is None
+        assert [json.loads(line) for line in lines] == [
+            {"dump": "tac", "file": path, "depth": 0, "function": "main"},
+            {
+                "dump": "tac",
+                "file": path,
+                "depth": 1,
+                "instruction": "Unary",
+                "op": "Complement",
+                "src": 1,
+                "dest": "tmp_0",
+            },
+            {
+                "dump": "tac",
+                "file": path,
+                "depth": 1,
+                "instruction": "Return",
+                "value": "tmp_0",
+            },
+        ]
+
+    def test_save_temps(self, tmp_path: Path) -> None:
+        """Keep the preprocessed source and intermediate files."""
+        path = _write(tmp_path, "a.c", "/* c */ int main(void) { return 0; }")
+        output_path = str(tmp_path / "a")
+
+        result = compile_job(Job(path, output_path=output_path, save_temps=True))
+
+        assert result.error is None
+        names = sorted(os.listdir(tmp_path))
+        assert names == ["a", "a.c", "a.i", "a.o", "a.s"]
+        assert "/*" not in (tmp_path / "a.i").read_text()
+
+    def test_profile(self, tmp_path: Path) -> None:
+        """Time every stage run and count the size of every representation."""
+        path = _write(tmp_path, "a.c", "int main(void) { return ~-3; }")
+        job = Job(path, output_path=str(tmp_path / "a"), pipe=True, profile=True)
+
+        result = compile_job(job)
+
+        assert result.error is None
+        assert result.profile is not None
+        assert list(result.profile.timings) == [
+            "preprocess",
+            "lex",
+            "parse",
+            "ir",
+            "optimize",
+            "codegen",
+            "emit",
+            "assemble",
+            "link",
+        ]
+        counts = result.profile.counts
+        assert (counts["tokens"], counts["ast_nodes"]) == (12, 8)
+
+    def test_trace(self, tmp_path: Path) -> None:
+        """Nest the events of stages and subprocesses in the file's span."""
+        path = _write(tmp_path, "a.c", "#if 1\nint main(void) { return 0; }\n#endif")
+        job = Job(path, Stage.TACKY, profile=True, profile_memory=False)
+
+        result = compile_job(job)
+
+        assert result.error is None
+        assert result.profile is not None
+        assert result.profile.timings["lex"].peak == 0
+        events = [(e["name"], e["ph"]) for e in result.profile.events]
+        assert events == [
+            (path, "B"),
+            ("preprocess", "B"),
+            ("gcc -E", "B"),
+            ("gcc -E", "E"),
+            ("preprocess", "E"),
+            ("lex", "B"),
+            ("lex", "E"),
+            ("parse", "B"),
+            ("parse", "E"),
+            ("ir", "B"),
+            ("ir", "E"),
+            (path, "E"),
+        ]
+        timestamps = [cast(float, e["ts"]) for e in result.profile.events]
+        assert timestamps == sorted(timestamps)
+
+    def test_no_profile(self, tmp_path: Path) -> None:
+        """Profile nothing unless requested."""
+        path = _write(tmp_path, "a.c", "int main(void) { return 0; }")
+
+        result = compile_job(Job(path))
+
+        assert result.profile is None
+        assert "ast_nodes" not in result.stats
+
+    def test_error(self, tmp_path: Path) -> None:
+        """Report errors instead of raising them."""
+        path = _write(tmp_path, "bad.c", "int main(void) { return 0 }")
+
+        result = compile_job(Job(path, output_path=str(tmp_path / "bad")))
+
+        assert result.error is not None
+        assert "SyntaxError" in result.error
+        assert os.listdir(tmp_path) == ["bad.c"]
@@ -0,0 +1,93 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Node interning tests for yapcc."""
+
+import copy
+import dataclasses
+import pickle
+
+import pytest
+from yapcc import codegen, parse, tac
+
+
+class TestInterning:
+    def test_singletons(self) -> None:
+        """Return one shared instance for every stateless node."""
+        assert parse.ComplementOperator() is parse.ComplementOperator()
+        assert parse.NegateOperator() is parse.NegateOperator()
+        assert tac.Complement() is tac.Complement()
+        assert tac.Negate() is tac.Negate()
+        assert codegen.Neg() is codegen.Neg()
+        assert codegen.Not() is codegen.Not()
+        assert codegen.Ret() is codegen.Ret()
+
+    def test_separate_classes(self) -> None:
+        """Keep the shared instances of each class apart from other classes'."""
+        negate: object = parse.NegateOperator()
+        constant: object = tac.Constant(1)
+
+        assert negate is not parse.ComplementOperator()
+        assert type(negate) is parse.NegateOperator
+        assert constant is not parse.Constant(1)
+        assert type(constant) is tac.Constant
+
+    def test_small_values(self) -> None:
+        """Return shared instances for small constant values only."""
+        assert parse.Constant(1) is parse.Constant(1)
+        assert tac.Constant(-1) is tac.Constant(-1)
+        assert codegen.Imm(255) is codegen.Imm(255)
+
+        large, other = tac.Constant(100_000), tac.Constant(100_000)
+        assert large is not other
+        assert large == other
+        assert large.value == 100_000
+
+    def test_shared_value_unchanged(self) -> None:
+        """Never rewrite a shared instance's value, even from an equal value."""
+        one = parse.Constant(1)
+        two = codegen.Imm(2)
+
+        true = parse.Constant(True)
+        real = codegen.Imm(2.0)  # type: ignore[arg-type]
+
+        assert (one.value, type(one.value)) == (1, int)
+        assert (two.value, type(two.value)) == (2, int)
+        assert true is not one
+        assert true.value is True
+        assert real is not two
+        assert type(real.value) is float
+        assert dataclasses.replace(one, value=3) is parse.Constant(3)
+
+    def test_pickle_and_copy(self) -> None:
+        """Preserve interning through pickling and copying."""
+        exp = parse.Unary(parse.NegateOperator(), parse.Constant(2))
+
+        for actual in (pickle.loads(pickle.dumps(exp)), copy.deepcopy(exp)):
+            assert actual == exp
+            assert actual.op is parse.NegateOperator()
+            assert actual.exp is parse.Constant(2)
+
+        assert pickle.loads(pickle.dumps(tac.Constant(10**6))) == tac.Constant(10**6)
+
+    def test_frozen(self) -> None:
+        """Reject mutation and allow hashing of nodes."""
+        instr = tac.Unary(tac.Negate(), tac.Constant(1), tac.Var("tmp_0"))
+
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            instr.dest = tac.Var("tmp_1")  # type: ignore[misc]
+        assert not hasattr(instr, "__dict__")
+        assert {instr: 1}[tac.Unary(tac.Negate(), tac.Constant(1), tac.Var("tmp_0"))]
@@ -18,11 +18,12 @@
 
 import os
 import subprocess
+import tracemalloc
 from pathlib import Path
 from typing import Callable
 
 import pytest
-from yapcc.lex import Token, TokenType, lex
+from yapcc.lex import Token, TokenBuffer, TokenType, lex, tokenize
 
 PreprocessFixture = Callable[[str], str]
 AssertTokensFixture = Callable[[list[Token], list[Token]], None]
@@ -313,3 +314,83 @@ class TestLex:
         source = preprocess("input/invalid_lex/invalid_identifier_2.c")
         with pytest.raises(RuntimeError, match='TokenError: Illegal constant "1f..."'):
             lex(source)
+
+    def test_valid_large_input(self, assert_tokens: AssertTokensFixture) -> None:
+        """Return expected tokens for a large generated source."""
+        depth = 100_000
+        source = "int main(void) {\n return " + "-~" * depth + "1;\n}\n"
+        expected: list[Token] = [
+            Token(TokenType.INT_KEYWORD, "int"),
+            Token(TokenType.IDENTIFIER, "main"),
+            Token(TokenType.OPEN_PAREN, "("),
+            Token(TokenType.VOID_KEYWORD, "void"),
+            Token(TokenType.CLOSE_PAREN, ")"),
+            Token(TokenType.OPEN_BRACE, "{"),
+            Token(TokenType.RETURN_KEYWORD, "return"),
+            *[Token(TokenType.MINUS, "-"), Token(TokenType.TILDE, "~")] * depth,
+            Token(TokenType.CONSTANT, "1"),
+            Token(TokenType.SEMICOLON, ";"),
+            Token(TokenType.CLOSE_BRACE, "}"),
+        ]
+
+        actual = lex(source)
+
+        assert_tokens(actual, expected)
+
+    def test_invalid_minus_minus(self, assert_tokens: AssertTokensFixture) -> None:
+        """Raise expected error with unsupported "--" operator."""
+        with pytest.raises(RuntimeError, match='TokenError: Illegal token "--"'):
+            lex("int main(void) { return --1; }")
+
+    @pytest.mark.parametrize("char", ["é", "٣", "五"])
+    def test_invalid_non_ascii(self, char: str) -> None:
+        """Reject non-ASCII letters and digits in identifiers and constants."""
+        for source in (
+            f"int {char}",
+            f"int a{char}",
+            f"return {char}",
+            f"return 1{char}",
+        ):
+            with pytest.raises(
+                RuntimeError, match=f'TokenError: Illegal token "{char}"'
+            ):
+                lex(source)
+
+    def test_token_buffer(
+        self, preprocess: PreprocessFixture, assert_tokens: AssertTokensFixture
+    ) -> None:
+        """Return the same tokens from a token buffer, sharing fixed tokens."""
+        source = preprocess("input/valid/nested_exp.c")
+
+        buffer = tokenize(source)
+
+        assert isinstance(buffer, TokenBuffer)
+        assert_tokens(list(buffer), lex(source))
+        assert_tokens([buffer[i] for i in range(len(buffer))], lex(source))
+        assert buffer[-1] == Token(TokenType.CLOSE_BRACE, "}")
+        assert buffer[0:2] == [
+            Token(TokenType.INT_KEYWORD, "int"),
+            Token(TokenType.IDENTIFIER, "main"),
+        ]
+        assert buffer[2] is lex(source)[2]
+        assert buffer.type_at(1) == TokenType.IDENTIFIER
+        assert buffer.literal_at(1) == "main"
+
+    def test_token_buffer_memory(self) -> None:
+        """Use several times less memory for a token buffer than a token list."""
+        source = " ".join(f"ident_{i} {i} ( ) ;" for i in range(5_000))
+
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            buffer = tokenize(source)
+            buffer_size = tracemalloc.get_traced_memory()[0] - before
+
+            before, _ = tracemalloc.get_traced_memory()
+            tokens = lex(source)
+            list_size = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+        assert len(buffer) == len(tokens)
+        assert buffer_size * 4 < list_size
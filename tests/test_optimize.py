@@ -0,0 +1,230 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""TAC optimization tests for yapcc."""
+
+import pytest
+from yapcc.codegen import codegen, emit
+from yapcc.context import CompilationContext
+from yapcc.lex import lex
+from yapcc.optimize import (
+    eliminate_dead_code,
+    eliminate_dead_code_packed,
+    fold_constants,
+    propagate_copies,
+    wrap_int32,
+)
+from yapcc.parse import parse
+from yapcc.tac import (
+    Complement,
+    Constant,
+    Copy,
+    Function,
+    Negate,
+    Program,
+    Return,
+    Unary,
+    Var,
+    ir,
+    pack,
+)
+
+
+def _lower(source: str) -> Function:
+    return ir(parse(lex(source))).function_definition
+
+
+class TestFoldConstants:
+    def test_fold_chain(self) -> None:
+        """Collapse a chain of unary operators on a constant to one return."""
+        fn = _lower("int main(void) { return -~-~5; }")
+        assert len(fn.body) == 5
+
+        actual = fold_constants(fn)
+
+        assert actual == Function("main", (Return(Constant(7)),))
+
+    @pytest.mark.parametrize(
+        ("source", "expected"),
+        [
+            ("return -2147483647;", -2147483647),
+            ("return -(-2147483647);", 2147483647),
+            ("return ~0;", -1),
+            ("return ~2147483647;", -2147483648),
+            ("return -~2147483647;", -2147483648),
+            ("return -2147483648;", -2147483648),
+            ("return ~-~4294967295;", -1),
+        ],
+    )
+    def test_fold_wraparound(self, source: str, expected: int) -> None:
+        """Fold with 32-bit two's-complement wraparound."""
+        fn = _lower("int main(void) { " + source + " }")
+
+        actual = fold_constants(fn)
+
+        assert actual.body == (Return(Constant(expected)),)
+
+    def test_fold_partial(self) -> None:
+        """Keep instructions whose operands are not constants."""
+        fn = Function(
+            "main",
+            (
+                Unary(Negate(), Var("x"), Var("tmp_0")),
+                Unary(Complement(), Var("tmp_0"), Var("tmp_1")),
+                Unary(Negate(), Constant(3), Var("tmp_2")),
+                Return(Var("tmp_2")),
+            ),
+        )
+
+        actual = fold_constants(fn)
+
+        assert actual.body == (
+            Unary(Negate(), Var("x"), Var("tmp_0")),
+            Unary(Complement(), Var("tmp_0"), Var("tmp_1")),
+            Return(Constant(-3)),
+        )
+
+    def test_fold_copy(self) -> None:
+        """Fold copies of constants."""
+        fn = Function(
+            "main",
+            (
+                Copy(Constant(4), Var("a")),
+                Unary(Negate(), Var("a"), Var("b")),
+                Return(Var("b")),
+            ),
+        )
+        ctx = CompilationContext()
+
+        actual = fold_constants(fn, ctx)
+
+        assert actual.body == (Return(Constant(-4)),)
+        assert ctx.stats["tac_folded"] == 2
+
+    def test_fold_codegen(self) -> None:
+        """Generate a single mov and ret for a folded expression."""
+        fn = fold_constants(_lower("int main(void) { return -~-~5; }"))
+
+        actual = emit(codegen(Program(fn)))
+
+        assert actual == (
+            "\t.globl main\n"
+            "main:\n"
+            "\tmovl\t$7, %eax\n"
+            "\tret\n"
+            '\t.section\t.note.GNU-stack, "",@progbits\n'
+        )
+
+    def test_wrap_int32(self) -> None:
+        """Wrap integers to the 32-bit signed range."""
+        assert wrap_int32(2**31) == -(2**31)
+        assert wrap_int32(-(2**31) - 1) == 2**31 - 1
+        assert wrap_int32(2**32 + 5) == 5
+
+
+class TestCopiesAndDeadCode:
+    def test_propagate_copies(self) -> None:
+        """Read copied values directly, collapsing chains of copies."""
+        fn = Function(
+            "main",
+            (
+                Copy(Var("x"), Var("a")),
+                Copy(Var("a"), Var("b")),
+                Unary(Negate(), Var("b"), Var("c")),
+                Copy(Var("c"), Var("d")),
+                Return(Var("d")),
+            ),
+        )
+
+        actual = propagate_copies(fn)
+
+        assert actual.body == (
+            Copy(Var("x"), Var("a")),
+            Copy(Var("x"), Var("b")),
+            Unary(Negate(), Var("x"), Var("c")),
+            Copy(Var("c"), Var("d")),
+            Return(Var("c")),
+        )
+
+    def test_eliminate_dead_code(self) -> None:
+        """Remove unread temps, including chains, and code after a return."""
+        fn = Function(
+            "main",
+            (
+                Unary(Negate(), Var("x"), Var("dead_0")),
+                Unary(Complement(), Var("dead_0"), Var("dead_1")),
+                Copy(Var("dead_1"), Var("dead_2")),
+                Unary(Negate(), Var("x"), Var("live")),
+                Return(Var("live")),
+                Unary(Negate(), Var("live"), Var("after")),
+                Return(Var("after")),
+            ),
+        )
+        ctx = CompilationContext()
+
+        actual = eliminate_dead_code(fn, ctx)
+
+        assert actual.body == (
+            Unary(Negate(), Var("x"), Var("live")),
+            Return(Var("live")),
+        )
+        assert ctx.stats["tac_eliminated"] == 5
+
+    def test_eliminate_dead_code_packed(self) -> None:
+        """Sweep a packed function, keeping its pools and temp names."""
+        fn = Function(
+            "main",
+            (
+                Unary(Negate(), Constant(1), Var("dead")),
+                Copy(Constant(2), Var("live")),
+                Return(Var("live")),
+                Return(Constant(3)),
+            ),
+        )
+
+        actual = eliminate_dead_code_packed(pack(fn))
+
+        assert len(actual) == 2
+        assert actual.view().body == (
+            Copy(Constant(2), Var("live")),
+            Return(Var("live")),
+        )
+        assert actual.view() == eliminate_dead_code(fn)
+
+    def test_propagate_and_eliminate(self) -> None:
+        """Remove copies once every read has been propagated."""
+        fn = Function(
+            "main",
+            (
+                Unary(Negate(), Var("x"), Var("a")),
+                Copy(Var("a"), Var("b")),
+                Copy(Var("b"), Var("c")),
+                Return(Var("c")),
+            ),
+        )
+
+        actual = eliminate_dead_code(propagate_copies(fn))
+
+        assert actual.body == (
+            Unary(Negate(), Var("x"), Var("a")),
+            Return(Var("a")),
+        )
+
+    def test_keep_live_code(self) -> None:
+        """Leave lowered expressions unchanged when every temp is read."""
+        fn = _lower("int main(void) { return ~(-1); }")
+
+        assert eliminate_dead_code(propagate_copies(fn)) == fn
@@ -22,16 +22,19 @@ from pathlib import Path
 from typing import Callable
 
 import pytest
-from yapcc.lex import Token, lex
+from yapcc.lex import Token, TokenType, lex, tokenize
 from yapcc.parse import (
     ComplementOperator,
     Constant,
+    Expression,
     Function,
     NegateOperator,
     Node,
     Program,
     Return,
+    TokenStream,
     Unary,
+    node_count,
     parse,
 )
 
@@ -109,6 +112,38 @@ class TestParse:
         assert isinstance(constant, Constant)
         assert constant.value == 1
 
+    def test_valid_reuses_tokens(self, lexed: LexedFixture) -> None:
+        """Parse the same token list repeatedly without modifying it."""
+        tokens = lexed("input/valid/nested_exp.c")
+        expected = list(tokens)
+
+        first = parse(tokens)
+        second = parse(tokens)
+
+        assert tokens == expected
+        assert first == second
+
+    def test_valid_token_buffer(self, lexed: LexedFixture) -> None:
+        """Parse a compact token buffer directly."""
+        tokens = lexed("input/valid/nested_exp.c")
+        source = " ".join(token.literal for token in tokens)
+
+        assert parse(tokenize(source)) == parse(tokens)
+
+    def test_token_stream_mark_reset(self, lexed: LexedFixture) -> None:
+        """Peek ahead, consume, and rewind a token stream."""
+        stream = TokenStream(lexed("input/valid/return_2.c"))
+
+        assert stream.peek(1).type == TokenType.IDENTIFIER
+        mark = stream.mark()
+        assert stream.expect(TokenType.INT_KEYWORD).literal == "int"
+        assert stream.consume().literal == "main"
+        stream.reset(mark)
+
+        assert stream.peek().type == TokenType.INT_KEYWORD
+        assert isinstance(parse(stream), Program)
+        assert stream.at_end()
+
     def test_invalid_end_before_expr(self, lexed: LexedFixture) -> None:
         """Raises expected error with unterminated expressions."""
         tokens = lexed("input/invalid_parse/end_before_expr.c")
@@ -216,3 +251,33 @@ class TestParse:
             match='SyntaxError: expected TokenType.CLOSE_PAREN, but found "{"',
         ):
             parse(tokens)
+
+    def test_valid_deep_nesting(self) -> None:
+        """Parse very deeply nested expressions without recursion."""
+        depth = 100_000
+        tokens = lex(
+            "int main(void) { return " + "-~(" * depth + "1" + ")" * depth + "; }"
+        )
+
+        actual = parse(tokens)
+
+        statement = actual.function_definition.body
+        assert isinstance(statement, Return)
+        exp: Expression = statement.exp
+        for _ in range(depth):
+            assert isinstance(exp, Unary)
+            assert isinstance(exp.op, NegateOperator)
+            exp = exp.exp
+            assert isinstance(exp, Unary)
+            assert isinstance(exp.op, ComplementOperator)
+            exp = exp.exp
+        assert exp == Constant(1)
+
+    def test_node_count(self) -> None:
+        """Count every node, operators included, however deep the nesting."""
+        depth = 100_000
+        tokens = lex("int main(void) { return " + "~" * depth + "1; }")
+
+        actual = node_count(parse(tokens))
+
+        assert actual == 4 + 2 * depth
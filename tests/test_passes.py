@@ -0,0 +1,172 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Pass manager tests for yapcc."""
+
+import pytest
+from yapcc.context import CompilationContext
+from yapcc.lex import lex
+from yapcc.parse import parse
+from yapcc.passes import Pass, PassManager, asm_pass_manager, tac_pass_manager
+from yapcc.profile import PassRecord, Profile
+from yapcc.tac import Constant, Function, Return, ir
+
+
+@pytest.fixture(autouse=True)
+def _fresh_managers() -> None:
+    # managers are shared between compilations, so forget earlier tests' runs
+    tac_pass_manager.cache_clear()
+    asm_pass_manager.cache_clear()
+
+
+def _profiled() -> CompilationContext:
+    return CompilationContext(profile=Profile(memory=False))
+
+
+def _records(ctx: CompilationContext) -> list[PassRecord]:
+    assert ctx.profile is not None
+    return ctx.profile.passes
+
+
+def _lower(source: str) -> Function:
+    return ir(parse(lex(source))).function_definition
+
+
+def _drop_first(fn: Function, ctx: CompilationContext) -> Function:
+    # removes one instruction per run, so only a fixpoint reaches a single return
+    return Function(fn.identifier, fn.body[1:] if len(fn.body) > 1 else fn.body)
+
+
+def _sized(fixpoint: bool) -> PassManager[Function]:
+    return PassManager(
+        (Pass("drop_first", _drop_first),), lambda fn: len(fn.body), fixpoint
+    )
+
+
+class TestPassManager:
+    def test_single_round(self) -> None:
+        """Run every pass once without a fixpoint."""
+        fn = _lower("int main(void) { return -~-1; }")
+        manager = _sized(fixpoint=False)
+        ctx = _profiled()
+
+        actual = manager.run(fn, ctx)
+
+        assert len(actual.body) == 3
+        assert [(r.name, r.before, r.after) for r in _records(ctx)] == [
+            ("drop_first", 4, 3)
+        ]
+
+    def test_fixpoint(self) -> None:
+        """Repeat the passes until a round leaves the function unchanged."""
+        fn = _lower("int main(void) { return -~-1; }")
+        manager = _sized(fixpoint=True)
+        ctx = _profiled()
+
+        actual = manager.run(fn, ctx)
+
+        assert len(actual.body) == 1
+        assert [r.iteration for r in _records(ctx)] == [0, 1, 2, 3]
+        assert [r.after for r in _records(ctx)] == [3, 2, 1, 1]
+
+    def test_max_iterations(self) -> None:
+        """Stop iterating after the configured number of rounds."""
+        fn = _lower("int main(void) { return -~-1; }")
+        manager = _sized(fixpoint=True)
+        manager.max_iterations = 2
+
+        actual = manager.run(fn, CompilationContext())
+
+        assert len(actual.body) == 2
+
+    def test_skip_converged(self) -> None:
+        """Skip passes that have converged on an equal function."""
+        fn = _lower("int main(void) { return -~-1; }")
+        ctx = _profiled()
+        manager = tac_pass_manager(1)
+        optimized = manager.run(fn, ctx)
+        _records(ctx).clear()
+
+        actual = manager.run(optimized, ctx)
+
+        # the later passes already converged on the folded function in the first run
+        assert actual == optimized
+        assert [r.skipped for r in _records(ctx)] == [False, True, True]
+
+        # a later compilation shares the manager, and with it the convergence
+        other = _profiled()
+        tac_pass_manager(1).run(optimized, other)
+
+        assert [r.skipped for r in _records(other)] == [True, True, True]
+        assert ctx.stats["passes_skipped"] + other.stats["passes_skipped"] == 5
+
+    def test_bounded_convergence(self) -> None:
+        """Forget the least recently seen convergences beyond the bound."""
+        manager = _sized(fixpoint=False)
+        manager.max_converged = 2
+        ctx = CompilationContext()
+        fns = [Function(f"f{i}", (Return(Constant(i)),)) for i in range(3)]
+
+        for fn in fns:
+            manager.run(fn, ctx)
+        manager.run(fns[0], ctx)
+        assert ctx.stats["passes_skipped"] == 0
+
+        manager.run(fns[2], ctx)
+        assert ctx.stats["passes_skipped"] == 1
+
+    def test_no_profile(self) -> None:
+        """Count runs in the stats without recording them."""
+        ctx = CompilationContext()
+
+        tac_pass_manager(1).run(_lower("int main(void) { return 1; }"), ctx)
+
+        assert ctx.stats["passes_run"] == 3
+
+
+class TestLevels:
+    def test_o0(self) -> None:
+        """Run no passes at -O0."""
+        fn = _lower("int main(void) { return -~-1; }")
+        ctx = _profiled()
+
+        assert tac_pass_manager(0).run(fn, ctx) == fn
+        assert _records(ctx) == []
+
+    @pytest.mark.parametrize("level", [1, 2])
+    def test_optimized(self, level: int) -> None:
+        """Fold a constant expression to a single return."""
+        fn = _lower("int main(void) { return -~-1; }")
+        ctx = _profiled()
+
+        actual = tac_pass_manager(level).run(fn, ctx)
+
+        assert actual == Function("main", (Return(Constant(0)),))
+        assert [r.name for r in _records(ctx)][:3] == [
+            "fold_constants",
+            "propagate_copies",
+            "eliminate_dead_code",
+        ]
+
+    def test_unknown_level(self) -> None:
+        """Reject optimization levels without a pipeline."""
+        with pytest.raises(RuntimeError, match="OptionError"):
+            asm_pass_manager(3)
+
+    def test_shared(self) -> None:
+        """Return one manager per level."""
+        assert tac_pass_manager(2) is tac_pass_manager(2)
+        assert tac_pass_manager(1) is not tac_pass_manager(2)
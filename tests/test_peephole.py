@@ -0,0 +1,134 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Peephole optimization tests for yapcc."""
+
+from collections.abc import Sequence
+
+import pytest
+from yapcc.codegen import (
+    AX,
+    R10,
+    Function,
+    Imm,
+    Instruction,
+    Mov,
+    Neg,
+    Not,
+    Ret,
+    Stack,
+    Unary,
+    Xor,
+)
+from yapcc.context import CompilationContext
+from yapcc.peephole import DEFAULT_PATTERNS, Facts, Pattern, peephole
+
+
+def _function(*instructions: Instruction) -> Function:
+    return Function("main", instructions, 16)
+
+
+class TestPeephole:
+    @pytest.mark.parametrize(
+        ("instructions", "expected", "pattern"),
+        [
+            (
+                (Mov(Stack(-4), Stack(-4)), Ret()),
+                (Ret(),),
+                "self_move",
+            ),
+            (
+                (Mov(Stack(-4), AX), Mov(AX, Stack(-4)), Ret()),
+                (Mov(Stack(-4), AX), Ret()),
+                "redundant_move_pair",
+            ),
+            (
+                (Mov(Imm(5), R10), Mov(R10, Stack(-4)), Mov(Stack(-4), AX), Ret()),
+                (Mov(Imm(5), Stack(-4)), Mov(Imm(5), AX), Ret()),
+                "fold_immediate",
+            ),
+            (
+                (Mov(Imm(0), AX), Ret()),
+                (Xor(AX, AX), Ret()),
+                "zero_register",
+            ),
+            (
+                (Mov(Imm(1), Stack(-4)), Unary(Not(), Stack(-4)), Ret()),
+                (Ret(),),
+                "dead_store",
+            ),
+        ],
+    )
+    def test_pattern(
+        self,
+        instructions: tuple[Instruction, ...],
+        expected: tuple[Instruction, ...],
+        pattern: str,
+    ) -> None:
+        """Rewrite each pattern and count its hits."""
+        ctx = CompilationContext()
+
+        actual = peephole(_function(*instructions), ctx)
+
+        assert actual == _function(*expected)
+        assert ctx.stats[f"peephole_{pattern}"] >= 1
+
+    def test_cascade(self) -> None:
+        """Let rewrites cascade into earlier output."""
+        fn = _function(
+            Mov(Imm(0), Stack(-4)),
+            Mov(Stack(-4), AX),
+            Mov(Imm(7), Stack(-8)),
+            Unary(Neg(), Stack(-8)),
+            Ret(),
+        )
+        ctx = CompilationContext()
+
+        actual = peephole(fn, ctx)
+
+        assert actual == _function(Mov(Imm(0), Stack(-4)), Xor(AX, AX), Ret())
+        assert ctx.stats["peephole_fold_immediate"] == 1
+        assert ctx.stats["peephole_zero_register"] == 1
+        assert ctx.stats["peephole_dead_store"] == 2
+
+    def test_custom_patterns(self) -> None:
+        """Run only the configured patterns."""
+
+        def drop_not(
+            window: Sequence[Instruction], facts: Facts
+        ) -> list[Instruction] | None:
+            match window:
+                case [Unary(Not(), _), Unary(Not(), _)] if window[0] == window[1]:
+                    return []
+            return None
+
+        fn = _function(Mov(Imm(0), AX), Unary(Not(), AX), Unary(Not(), AX), Ret())
+        ctx = CompilationContext()
+
+        actual = peephole(fn, ctx, patterns=[Pattern("double_not", 2, drop_not)])
+
+        assert actual == _function(Mov(Imm(0), AX), Ret())
+        assert ctx.stats == {"peephole_double_not": 1}
+
+    def test_default_patterns_linear(self) -> None:
+        """Rewrite long instruction lists in a single linear pass."""
+        count = 50_000
+        fn = _function(*[Mov(Imm(1), R10), Mov(R10, AX)] * count, Ret())
+
+        actual = peephole(fn)
+
+        assert actual.instructions == (Mov(Imm(1), AX),) * count + (Ret(),)
+        assert all(pattern.size <= 2 for pattern in DEFAULT_PATTERNS)
@@ -0,0 +1,148 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Preprocessor tests for yapcc."""
+
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from yapcc.context import CompilationContext
+from yapcc.lex import lex
+from yapcc.preprocess import preprocess, preprocess_builtin
+
+VALID_DIR = os.path.join(os.path.dirname(__file__), "input", "valid")
+
+
+class TestBuiltin:
+    @pytest.mark.parametrize("name", sorted(os.listdir(VALID_DIR)))
+    def test_valid(self, name: str) -> None:
+        """Lex the same tokens as gcc's preprocessor output."""
+        path = os.path.join(VALID_DIR, name)
+        with open(path, "r", encoding="ascii") as source_file:
+            source = source_file.read()
+        expected = subprocess.run(
+            ["gcc", "-E", "-P", path], check=True, capture_output=True, text=True
+        ).stdout
+
+        actual = preprocess_builtin(source)
+
+        assert actual is not None
+        assert lex(actual) == lex(expected)
+
+    def test_comments_and_splices(self) -> None:
+        """Replace comments with a space and join spliced lines."""
+        source = "int/* a */main(void) { // b \\\n c\nreturn 1\\\n0; }"
+
+        actual = preprocess_builtin(source)
+
+        assert actual is not None
+        assert lex(actual) == lex("int main(void) { return 10; }")
+
+    def test_define(self) -> None:
+        """Expand object-like macros, including macros in their bodies."""
+        source = (
+            "#define ONE 1\n"
+            "# define TWO (ONE + ONE) /* a comment */\n"
+            "#define SELF SELF\n"
+            "#undef ONE\n"
+            "#define ONE 7\n"
+            "TWO SELF 1ONE\n"
+        )
+
+        actual = preprocess_builtin(source)
+
+        assert actual is not None
+        assert actual.split() == ["(", "7", "+", "7", ")", "SELF", "1ONE"]
+
+    def test_no_paste(self) -> None:
+        """Keep expansions from pasting onto neighbouring tokens."""
+        actual = preprocess_builtin("#define N -1\nint main(void) { return -N; }")
+
+        assert actual is not None
+        assert lex(actual) == lex("int main(void) { return - -1; }")
+
+    def test_include(self, tmp_path: Path) -> None:
+        """Include quoted headers relative to the including file."""
+        (tmp_path / "inc").mkdir()
+        (tmp_path / "inc" / "value.h").write_text('#include "inner.h"\n')
+        (tmp_path / "inc" / "inner.h").write_text("#define VALUE 3\n")
+        source = '#include "inc/value.h"\nint main(void) { return VALUE; }\n'
+
+        actual = preprocess_builtin(source, str(tmp_path))
+
+        assert actual is not None
+        assert lex(actual) == lex("int main(void) { return 3; }")
+
+    def test_gnu_predefined_redefined(self) -> None:
+        """Expand gcc's non-reserved predefined names when the source defines them."""
+        actual = preprocess_builtin("#define unix 0\nint unixy = unix;\n")
+
+        assert actual is not None
+        assert actual.split() == ["int", "unixy", "=", "0", ";"]
+
+    @pytest.mark.parametrize(
+        "source",
+        [
+            "#ifdef X\n#endif\n",
+            "#define F(x) x\n",
+            "#define CAT a ## b\n",
+            "#include <stdio.h>\n",
+            '#include "missing.h"\n',
+            "int x = __LINE__;\n",
+            "int main(void) { return unix; }\n",
+            "#define X linux\nint x = X;\n",
+            'char *s = "/* not a comment */";\n',
+            "int /* unterminated\n",
+        ],
+    )
+    def test_unsupported(self, source: str) -> None:
+        """Return `None` for sources the built-in preprocessor cannot handle."""
+        assert preprocess_builtin(source) is None
+
+
+class TestPreprocess:
+    def test_builtin(self) -> None:
+        """Preprocess supported files without gcc."""
+        ctx = CompilationContext()
+
+        def fallback(path: str, source: str | None) -> str:
+            raise AssertionError(path)
+
+        preprocess(os.path.join(VALID_DIR, "return_2.c"), ctx, fallback)
+
+        assert ctx.stats["preprocess_builtin"] == 1
+
+    def test_fallback(self, tmp_path: Path) -> None:
+        """Fall back to gcc for unsupported files."""
+        path = tmp_path / "cond.c"
+        path.write_text("#if 1\nint main(void) { return 2; }\n#endif\n")
+        ctx = CompilationContext()
+
+        actual = preprocess(str(path), ctx)
+
+        assert lex(actual) == lex("int main(void) { return 2; }")
+        assert ctx.stats["preprocess_fallback"] == 1
+
+    def test_fallback_source(self, tmp_path: Path) -> None:
+        """Fall back to gcc for unsupported contents given in memory."""
+        (tmp_path / "value.h").write_text("#define VALUE 2\n")
+        source = '#include "value.h"\n#if 1\nint main(void) { return VALUE; }\n#endif\n'
+
+        actual = preprocess(str(tmp_path / "missing.c"), source=source)
+
+        assert lex(actual) == lex("int main(void) { return 2; }")
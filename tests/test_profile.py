@@ -0,0 +1,158 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Profile tests for yapcc."""
+
+import json
+import os
+import tracemalloc
+from collections import Counter
+
+from yapcc.profile import PassRecord, Profile, Timing, report_trace, span, stage
+
+
+class TestProfile:
+    def test_stage(self) -> None:
+        """Time a stage and trace the memory it allocates."""
+        profile = Profile()
+
+        with profile.stage("lex"):
+            data = bytearray(1024 * 1024)
+        del data
+
+        timing = profile.timings["lex"]
+        assert timing.wall > 0
+        assert timing.peak >= 1024 * 1024
+        assert not tracemalloc.is_tracing()
+
+    def test_no_memory(self) -> None:
+        """Time a stage without tracing its memory."""
+        profile = Profile(memory=False)
+
+        with profile.stage("lex"):
+            assert not tracemalloc.is_tracing()
+
+        assert profile.timings["lex"].peak == 0
+
+    def test_span(self) -> None:
+        """Record spans as trace events, nested in stages, without timing them."""
+        profile = Profile(memory=False)
+
+        with profile.stage("link"), span(profile, "gcc", "subprocess", {"argv": []}):
+            pass
+
+        assert list(profile.timings) == ["link"]
+        assert [(e["name"], e["cat"], e["ph"]) for e in profile.events] == [
+            ("link", "stage", "B"),
+            ("gcc", "subprocess", "B"),
+            ("gcc", "subprocess", "E"),
+            ("link", "stage", "E"),
+        ]
+        assert profile.events[1]["args"] == {"argv": []}
+        assert {e["pid"] for e in profile.events} == {os.getpid()}
+
+    def test_repeated_stage(self) -> None:
+        """Sum the times of a stage run more than once."""
+        profile = Profile({"emit": Timing(1.0, 0.5, 1 << 20)})
+
+        with profile.stage("emit"):
+            pass
+
+        assert profile.timings["emit"].wall > 1.0
+        assert profile.timings["emit"].peak == 1 << 20
+
+    def test_no_profile(self) -> None:
+        """Time nothing without a profile."""
+        with stage(None, "lex"):
+            pass
+
+        assert not tracemalloc.is_tracing()
+
+    def test_update(self) -> None:
+        """Sum times and counts, keeping the larger peak."""
+        profile = Profile({"lex": Timing(1.0, 1.0, 5)}, Counter({"tokens": 3}))
+
+        profile.update(
+            Profile(
+                {"lex": Timing(2.0, 0.5, 3), "parse": Timing(1.0, 1.0, 8)},
+                Counter({"tokens": 4}),
+            )
+        )
+
+        assert profile.timings == {
+            "lex": Timing(3.0, 1.5, 5),
+            "parse": Timing(1.0, 1.0, 8),
+        }
+        assert profile.counts == Counter({"tokens": 7})
+        assert profile.total() == Timing(4.0, 2.5, 8)
+
+    def test_table(self) -> None:
+        """Format stages in pipeline order, then the total, then counts."""
+        profile = Profile(
+            {"parse": Timing(0.5, 0.25, 2048), "lex": Timing(0.25, 0.25, 1024)},
+            Counter({"passes_run": 2, "tokens": 9}),
+        )
+
+        lines = profile.table().splitlines()
+
+        assert [line.split()[0] for line in lines] == [
+            "stage",
+            "lex",
+            "parse",
+            "total",
+            "tokens",
+            "passes_run",
+        ]
+        assert lines[3].split() == ["total", "0.750000", "0.500000", "2.0"]
+
+    def test_pass_table(self) -> None:
+        """Summarize the runs of each pass, in the order passes first ran."""
+        profile = Profile(
+            passes=[
+                PassRecord("fold_constants", 0, 0.5, 5, 3),
+                PassRecord("peephole", 0, 0.25, 3, 3),
+                PassRecord("fold_constants", 1, 0.0, 3, 3, skipped=True),
+            ]
+        )
+
+        lines = profile.table().splitlines()
+
+        assert lines[2].split() == ["pass", "runs", "skipped", "wall", "(s)", "removed"]
+        assert lines[3].split() == ["fold_constants", "1", "1", "0.500000", "2"]
+        assert lines[4].split() == ["peephole", "1", "0", "0.250000", "0"]
+
+    def test_round_trip(self) -> None:
+        """Rebuild an equal profile from its dictionary."""
+        profile = Profile(
+            {"lex": Timing(0.5, 0.25, 10)},
+            Counter({"tokens": 9}),
+            passes=[PassRecord("peephole", 0, 0.25, 3, 2)],
+        )
+
+        assert Profile.from_dict(profile.as_dict()) == profile
+
+
+class TestReportTrace:
+    def test_process_names(self) -> None:
+        """Name this process and every worker process with events."""
+        worker = {"name": "lex", "cat": "stage", "ph": "B", "ts": 1.0, "pid": -1}
+
+        trace = json.loads(report_trace([worker]))
+
+        events = trace["traceEvents"]
+        assert events[-1] == worker
+        names = {e["pid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+        assert names == {os.getpid(): "yapcc", -1: "yapcc worker"}
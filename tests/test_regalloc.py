@@ -0,0 +1,138 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Register allocation tests for yapcc."""
+
+import os
+import subprocess
+from typing import Callable
+
+import pytest
+from yapcc.codegen import ALLOCATABLE_REGISTERS, codegen, emit
+from yapcc.context import CompilationContext
+from yapcc.lex import lex
+from yapcc.parse import parse
+from yapcc.regalloc import Interval, linear_scan, live_intervals
+from yapcc.tac import (
+    Complement,
+    Constant,
+    Copy,
+    Function,
+    Negate,
+    Program,
+    Return,
+    Unary,
+    Var,
+    ir,
+)
+
+RunFixture = Callable[[str], int]
+
+
+@pytest.fixture()
+def run(tmp_path: str) -> Callable[[str], int]:
+    def _run(assembly: str) -> int:
+        assembly_path = os.path.join(tmp_path, "out.s")
+        output_path = os.path.join(tmp_path, "out")
+        with open(assembly_path, "w", encoding="ascii") as assembly_file:
+            assembly_file.write(assembly)
+        subprocess.run(["gcc", assembly_path, "-o", output_path], check=True)
+        return subprocess.run([output_path], check=False).returncode
+
+    return _run
+
+
+def _overlapping(count: int) -> Function:
+    # define `count` temps up front, then read them all back, so every interval
+    # overlaps every other
+    temps = [Var(f"t{i}") for i in range(count)]
+    copies = [Var(f"u{i}") for i in range(count)]
+    body = (
+        *(Copy(Constant(i), temp) for i, temp in enumerate(temps)),
+        *(Copy(temp, copy) for temp, copy in zip(temps, copies, strict=True)),
+        Return(copies[-1]),
+    )
+    return Function("main", body)
+
+
+class TestLiveIntervals:
+    def test_unary_chain(self) -> None:
+        """End each temp at the instruction that reads it."""
+        fn = ir(parse(lex("int main(void) { return ~-1; }"))).function_definition
+
+        actual = live_intervals(fn)
+
+        assert actual == [
+            Interval(Var("tmp_0"), 0, 1),
+            Interval(Var("tmp_1"), 1, 2),
+        ]
+
+    def test_read_before_definition(self) -> None:
+        """Start a temp read before any definition at the function entry."""
+        fn = Function("main", (Return(Var("x")),))
+
+        assert live_intervals(fn) == [Interval(Var("x"), -1, 0)]
+
+
+class TestLinearScan:
+    def test_share_register(self) -> None:
+        """Reuse a register once the temp holding it is last read."""
+        fn = Function(
+            "main",
+            (
+                Unary(Negate(), Constant(1), Var("a")),
+                Unary(Complement(), Var("a"), Var("b")),
+                Return(Var("b")),
+            ),
+        )
+
+        actual = linear_scan(fn, ["r1", "r2"])
+
+        assert actual == {Var("a"): "r1", Var("b"): "r1"}
+
+    def test_spill_furthest_end(self) -> None:
+        """Spill the interval ending last when every register is taken."""
+        fn = _overlapping(3)
+
+        actual = linear_scan(fn, ["r1", "r2"])
+
+        assert actual[Var("t0")] == "r1"
+        assert actual[Var("t1")] == "r2"
+        assert actual[Var("t2")] is None
+        assert all(actual[Var(f"u{i}")] is not None for i in range(3))
+
+    def test_no_registers(self) -> None:
+        """Spill every temp when there are no registers to allocate."""
+        fn = _overlapping(2)
+
+        actual = linear_scan(fn, [])
+
+        assert set(actual.values()) == {None}
+
+
+class TestCodegen:
+    def test_spill(self, run: RunFixture) -> None:
+        """Fall back to stack slots under register pressure."""
+        count = len(ALLOCATABLE_REGISTERS) + 2
+        ctx = CompilationContext()
+
+        actual = codegen(Program(_overlapping(count)), ctx)
+
+        assert ctx.stats["spilled_temps"] == 2
+        assert actual.function_definition.stack_size == 16
+        assembly = emit(actual)
+        assert "(%rbp)" in assembly
+        assert run(assembly) == count - 1
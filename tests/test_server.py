@@ -0,0 +1,170 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Compile server tests for yapcc."""
+
+import os
+import socket
+import stat
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from yapcc.cache import DiskCache
+from yapcc.client import compile_remote
+from yapcc.context import Options
+from yapcc.jobs import Job, Result, Stage, dump_job, dump_result, load_job, load_result
+from yapcc.profile import Profile, Timing
+from yapcc.server import CompileServer
+
+
+@pytest.fixture()
+def server(tmp_path: Path) -> Iterator[str]:
+    socket_path = str(tmp_path / "yapcc.sock")
+    with CompileServer(socket_path, workers=2) as compile_server:
+        thread = threading.Thread(target=compile_server.serve_forever)
+        thread.start()
+        try:
+            yield socket_path
+        finally:
+            compile_server.shutdown()
+            thread.join()
+
+
+class TestJobs:
+    def test_job_round_trip(self) -> None:
+        """Decode an encoded job to an equal job."""
+        job = Job("a.c", Stage.TACKY, Options(optimization_level=2), source="int")
+
+        assert load_job(dump_job(job)) == job
+
+    def test_result_round_trip(self) -> None:
+        """Decode an encoded result to an equal result."""
+        result = Result("a.c", "out", None, Counter({"tokens": 3}), "\tret\n")
+
+        assert load_result(dump_result(result)) == result
+
+    def test_profiled_result_round_trip(self) -> None:
+        """Decode the profile of an encoded result."""
+        profile = Profile({"lex": Timing(0.5, 0.25, 10)}, Counter({"tokens": 3}))
+        result = Result("a.c", stats=Counter({"tokens": 3}), profile=profile)
+
+        assert load_result(dump_result(result)) == result
+
+
+class TestServer:
+    def test_compile(self, server: str, tmp_path: Path) -> None:
+        """Return assembly and errors for every job, in order."""
+        jobs = [
+            Job(str(tmp_path / f"f{i}.c"), source=f"int main(void) {{ return {i}; }}")
+            for i in range(8)
+        ]
+        jobs[5] = Job(str(tmp_path / "bad.c"), source="int main(void) { return }")
+
+        results = list(compile_remote(jobs, server))
+
+        assert [result.input_path for result in results] == [
+            job.input_path for job in jobs
+        ]
+        assert results[5].error is not None
+        assert "SyntaxError" in results[5].error
+        for i, result in enumerate(results):
+            if i != 5:
+                assert result.error is None
+                assert result.assembly is not None
+                expected = "xorl\t%eax, %eax" if i == 0 else f"movl\t${i}, %eax"
+                assert expected in result.assembly
+        # the server never writes files for its clients
+        assert list(tmp_path.glob("*.s")) == []
+
+    def test_dumps(self, server: str, tmp_path: Path) -> None:
+        """Send the dumps of every job with its result."""
+        jobs = [
+            Job(
+                str(tmp_path / f"f{i}.c"),
+                Stage.LEX,
+                source=f"int main(void) {{ return {i}; }}",
+                dumps=("tokens",),
+            )
+            for i in range(2)
+        ]
+
+        results = list(compile_remote(jobs, server))
+
+        assert [result.dumps_path for result in results] == [None, None]
+        for i, result in enumerate(results):
+            assert result.output.startswith(f"# tokens {jobs[i].input_path}\n")
+            assert f"\nCONSTANT {i}\n" in result.output
+
+    def test_ignores_cache(self, server: str, tmp_path: Path) -> None:
+        """Never write to a cache directory named by a client."""
+        cache_dir = tmp_path / "cache"
+        job = Job(
+            str(tmp_path / "a.c"),
+            source="int main(void) { return 0; }",
+            cache=DiskCache(str(cache_dir)),
+        )
+
+        [result] = compile_remote([job], server)
+
+        assert result.error is None
+        assert not cache_dir.exists()
+
+    def test_malformed_request(self, server: str) -> None:
+        """Answer a malformed request with an error result."""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(server)
+            sock.sendall(b'{"input_path": 1, "unknown": 2}\n')
+            sock.shutdown(socket.SHUT_WR)
+            response = sock.makefile("r", encoding="utf-8").readline()
+
+        assert "RequestError" in response
+
+    def test_already_listening(self, server: str) -> None:
+        """Refuse to replace a live server's socket."""
+        with pytest.raises(RuntimeError, match="ServerError"):
+            CompileServer(server, workers=1)
+
+    def test_stale_socket(self, tmp_path: Path) -> None:
+        """Replace a socket left behind by a server that is no longer running."""
+        socket_path = str(tmp_path / "yapcc.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(socket_path)
+
+        with CompileServer(socket_path, workers=1) as compile_server:
+            assert compile_server.socket_path == socket_path
+
+    def test_socket_permissions(self, server: str) -> None:
+        """Create the socket accessible only to its owner."""
+        assert stat.S_IMODE(os.stat(server).st_mode) == 0o600
+
+    def test_not_a_socket(self, tmp_path: Path) -> None:
+        """Refuse to replace a file that is not a socket."""
+        socket_path = tmp_path / "yapcc.sock"
+        socket_path.write_text("keep me")
+
+        with pytest.raises(RuntimeError, match="ServerError"):
+            CompileServer(str(socket_path), workers=1)
+        assert socket_path.read_text() == "keep me"
+
+    def test_no_server(self, tmp_path: Path) -> None:
+        """Fail when no server is listening."""
+        jobs = [Job(str(tmp_path / "a.c"), source="")]
+
+        with pytest.raises(RuntimeError, match="ServerError"):
+            list(compile_remote(jobs, str(tmp_path / "missing.sock")))
@@ -0,0 +1,163 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Three-address code tests for yapcc."""
+
+import os
+import subprocess
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from yapcc.arena import parse_flat
+from yapcc.context import CompilationContext
+from yapcc.lex import lex
+from yapcc.parse import Program as ASTProgram
+from yapcc.parse import parse
+from yapcc.tac import (
+    Complement,
+    Constant,
+    Copy,
+    Function,
+    Negate,
+    Opcode,
+    Return,
+    Unary,
+    Var,
+    ir,
+    ir_packed,
+    pack,
+)
+
+ParseFixture = Callable[[str], ASTProgram]
+
+
+@pytest.fixture()
+def parsed(tmp_path: str) -> Callable[[str], ASTProgram]:
+    def _parsed(input_path: str) -> ASTProgram:
+        dirname = os.path.dirname(__file__)
+        input_path = os.path.join(dirname, input_path)
+        preprocess_path = os.path.join(tmp_path, Path(input_path).stem) + ".i"
+        subprocess.run(
+            ["gcc", "-E", "-P", input_path, "-o", preprocess_path], check=True
+        )
+        with open(preprocess_path, "r", encoding="ascii") as preprocess_file:
+            preprocessed = preprocess_file.read()
+        tokens = lex(preprocessed)
+        return parse(tokens)
+
+    return _parsed
+
+
+class TestTac:
+    def test_valid_constant(self, parsed: ParseFixture) -> None:
+        """Return a single return instruction for a constant expression."""
+        ast = parsed("input/valid/multi_digit.c")
+
+        actual = ir(ast)
+
+        assert actual.function_definition.identifier == "main"
+        assert actual.function_definition.body == (Return(Constant(100)),)
+
+    def test_valid_nested_exp(self, parsed: ParseFixture) -> None:
+        """Emit unary instructions innermost first for nested expressions."""
+        ast = parsed("input/valid/nested_exp.c")
+
+        body = ir(ast).function_definition.body
+
+        assert len(body) == 3
+        negate, complement, ret = body
+        assert isinstance(negate, Unary)
+        assert negate.op == Negate()
+        assert negate.src == Constant(1)
+        assert isinstance(complement, Unary)
+        assert complement.op == Complement()
+        assert complement.src == negate.dest
+        assert ret == Return(complement.dest)
+
+    def test_valid_deep_nesting(self) -> None:
+        """Lower very deeply nested expressions without recursion."""
+        depth = 100_000
+        ast = parse(lex("int main(void) { return " + "- " * depth + "1; }"))
+
+        body = ir(ast).function_definition.body
+
+        assert len(body) == depth + 1
+        assert all(isinstance(instr, Unary) for instr in body[:-1])
+        assert isinstance(body[-1], Return)
+        assert isinstance(body[-1].value, Var)
+
+    def test_pack(self, parsed: ParseFixture) -> None:
+        """Encode a TAC function as arrays and view it as objects again."""
+        fn = ir(parsed("input/valid/nested_exp.c")).function_definition
+
+        packed = pack(fn)
+
+        assert len(packed) == 3
+        assert list(packed.opcodes) == [
+            Opcode.NEGATE,
+            Opcode.COMPLEMENT,
+            Opcode.RETURN,
+        ]
+        assert list(packed.srcs) == [-1, 0, 1]
+        assert list(packed.dests[:2]) == [0, 1]
+        assert packed.constants == [1]
+        assert packed.view() == fn
+
+    def test_pack_constant_pool(self) -> None:
+        """Share constant pool entries between operands with the same value."""
+        fn = Function(
+            "main",
+            (
+                Unary(Negate(), Constant(7), Var("a")),
+                Unary(Complement(), Constant(7), Var("b")),
+                Copy(Var("b"), Var("c")),
+                Return(Constant(3)),
+            ),
+        )
+
+        packed = pack(fn)
+
+        assert packed.constants == [7, 3]
+        assert list(packed.srcs) == [-1, -1, 1, -2]
+        assert packed.view() == fn
+
+    def test_ir_packed_flat(self) -> None:
+        """Lower a flat AST directly to packed TAC."""
+        tokens = lex("int main(void) { return ~(-1); }")
+
+        packed = ir_packed(parse_flat(tokens))
+
+        assert packed.identifier == "main"
+        assert packed.temp_names == {}
+        assert packed.view() == Function(
+            "main",
+            (
+                Unary(Negate(), Constant(1), Var("tmp_0")),
+                Unary(Complement(), Var("tmp_0"), Var("tmp_1")),
+                Return(Var("tmp_1")),
+            ),
+        )
+
+    def test_ir_flat_shared_context(self) -> None:
+        """Continue the context's temp numbering when lowering a flat AST."""
+        ctx = CompilationContext()
+        ctx.make_temp_name()
+
+        packed = ir_packed(parse_flat(lex("int main(void) { return -1; }")), ctx)
+
+        assert packed.view().body[0] == Unary(Negate(), Constant(1), Var("tmp_1"))
+        assert ctx.make_temp_name() == "tmp_2"
@@ -0,0 +1,78 @@
+# Copyright 2024 Jon Webb <jon@jonwebb.dev>
+#
+# This file is part of yapcc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Toolchain tests for yapcc."""
+
+import subprocess
+from pathlib import Path
+
+import pytest
+from yapcc.api import compile_source
+from yapcc.jobs import Job
+from yapcc.toolchain import assemble, deliver, link, text_writer
+
+ASSEMBLY = compile_source("int main(void) { return 6; }")
+
+
+class TestAssemble:
+    def test_stream(self, tmp_path: Path) -> None:
+        """Assemble assembly streamed on stdin."""
+        object_path = str(tmp_path / "a.o")
+        output_path = str(tmp_path / "a")
+
+        assemble(text_writer(ASSEMBLY), object_path)
+        link([object_path], output_path)
+
+        assert subprocess.run([output_path], check=False).returncode == 6
+
+    def test_error(self, tmp_path: Path) -> None:
+        """Raise when the assembler fails."""
+        with pytest.raises(subprocess.CalledProcessError):
+            assemble(text_writer("\tbogus\n"), str(tmp_path / "a.o"))
+
+
+class TestDeliver:
+    def test_pipe(self, tmp_path: Path) -> None:
+        """Leave only the executable behind when piping."""
+        job = Job(str(tmp_path / "a.c"), output_path=str(tmp_path / "a"), pipe=True)
+
+        deliver(job, text_writer(ASSEMBLY))
+
+        assert [p.name for p in tmp_path.iterdir()] == ["a"]
+        assert subprocess.run([tmp_path / "a"], check=False).returncode == 6
+
+    def test_pipe_object(self, tmp_path: Path) -> None:
+        """Leave an object to be linked later when there is no output path."""
+        job = Job(str(tmp_path / "a.c"), pipe=True)
+
+        deliver(job, text_writer(ASSEMBLY))
+
+        assert [p.name for p in tmp_path.iterdir()] == ["a.o"]
+
+    @pytest.mark.parametrize("pipe", [True, False])
+    def test_save_temps(self, tmp_path: Path, pipe: bool) -> None:
+        """Keep the assembly and object when saving temps."""
+        job = Job(
+            str(tmp_path / "a.c"),
+            output_path=str(tmp_path / "a"),
+            pipe=pipe,
+            save_temps=True,
+        )
+
+        deliver(job, text_writer(ASSEMBLY))
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "a.o", "a.s"]
+        assert (tmp_path / "a.s").read_text() == ASSEMBLY